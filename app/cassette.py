@@ -0,0 +1,274 @@
+# app/cassette.py
+"""
+Record/replay of a digest run's external responses, for offline profiling.
+
+    CASSETTE_MODE=record   run normally; Gmail (messages.list/get/attachments.get), Schoology
+                           (SchoologyClient._send) and OpenAI (llm_usage.chat) responses are
+                           saved with their latency to CASSETTE_DIR/family_<id>.json.gz
+    CASSETTE_MODE=replay   the same calls are answered from that file; nothing leaves the
+                           process. Each answer waits its recorded latency times
+                           CASSETTE_LATENCY_SCALE (1 = as recorded, 0 = no waiting).
+                           No OPENAI_API_KEY, Google token or Schoology consumer key is
+                           needed (see `replaying()`); the family's DB rows still are.
+
+run_digest_once opens `session(family_id)`; the cassette follows the run through a
+ContextVar. The Gmail service wrapper and SchoologyClient capture it when they are
+created, so Schoology's worker threads record into the same file.
+
+Lookups are by a normalized request key (volatile parts such as Gmail's after:<ts>
+or the events start_date are dropped). Identical keys replay in recorded order. A
+key that was never recorded falls back to the next unused entry of the same kind,
+so prompts that embed today's date still replay.
+
+Recordings are sanitized: no request headers or credentials are stored, values
+under secret-looking keys are replaced, and with CASSETTE_REDACT_EMAILS=1 (default)
+the local part of every email address in headers and text bodies is hashed, keeping
+the domain. PDF attachments are stored as-is.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from .logger import logger
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "").strip().lower()
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "./cassettes")
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1"))
+CASSETTE_REDACT_EMAILS = os.getenv("CASSETTE_REDACT_EMAILS", "1") == "1"
+
+
+class CassetteMiss(RuntimeError):
+    """Replay was asked for a request the cassette has no (unused) answer for."""
+
+
+# ---- sanitizing ----
+
+_SECRET_KEY_RE = re.compile(r"(?<!page)token|secret|password|authorization|api[_-]?key|cookie", re.I)
+_EMAIL_RE = re.compile(r"\b([A-Za-z0-9._%+-]+)@([A-Za-z0-9.-]+\.[A-Za-z]{2,})\b")
+
+
+def _mask_emails(s: str) -> str:
+    return _EMAIL_RE.sub(lambda m: f"u{hashlib.sha1(m.group(1).lower().encode()).hexdigest()[:10]}@{m.group(2)}", s)
+
+
+def _scrub_b64(data: str) -> str:
+    try:
+        text = base64.urlsafe_b64decode(data).decode("utf-8")
+    except Exception:
+        return data  # binary (PDF etc.)
+    return base64.urlsafe_b64encode(_mask_emails(text).encode()).decode("ascii")
+
+
+def sanitize(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            if isinstance(v, str) and v and _SECRET_KEY_RE.search(str(k)):  # not usage.*_tokens counts
+                out[k] = "[redacted]"
+            elif k == "data" and isinstance(v, str) and CASSETTE_REDACT_EMAILS:
+                out[k] = _scrub_b64(v)
+            else:
+                out[k] = sanitize(v)
+        return out
+    if isinstance(obj, list):
+        return [sanitize(v) for v in obj]
+    if isinstance(obj, str) and CASSETTE_REDACT_EMAILS:
+        return _mask_emails(obj)
+    return obj
+
+
+# ---- cassette ----
+
+class Cassette:
+    def __init__(self, path: str, mode: str, latency_scale: float = CASSETTE_LATENCY_SCALE):
+        self.path, self.mode, self.latency_scale = path, mode, latency_scale
+        self._lock = threading.Lock()
+        self.entries: List[Dict[str, Any]] = []
+        self._by_key: Dict[Tuple[str, str], Deque[int]] = defaultdict(deque)
+        self._by_kind: Dict[str, Deque[int]] = defaultdict(deque)
+        self._used: set = set()
+        if mode == "replay":
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                self.entries = json.load(f)["entries"]
+            for i, e in enumerate(self.entries):
+                self._by_key[(e["kind"], e["key"])].append(i)
+                self._by_kind[e["kind"]].append(i)
+
+    def record(self, kind: str, key: str, response: Any, seconds: float):
+        with self._lock:
+            self.entries.append({"kind": kind, "key": key, "seconds": round(seconds, 4),
+                                 "response": sanitize(response)})
+
+    def _take(self, kind: str, key: str) -> Dict[str, Any]:
+        with self._lock:
+            for queue in (self._by_key.get((kind, key)), self._by_kind.get(kind)):
+                while queue:
+                    i = queue.popleft()
+                    if i not in self._used:
+                        self._used.add(i)
+                        return self.entries[i]
+        raise CassetteMiss(f"no recorded {kind} response for {key[:200]}")
+
+    def replay(self, kind: str, key: str) -> Any:
+        entry = self._take(kind, key)
+        if self.latency_scale > 0 and entry["seconds"] > 0:
+            time.sleep(entry["seconds"] * self.latency_scale)
+        return entry["response"]
+
+    def call(self, kind: str, key: str, fn: Callable[[], Any], encode: Callable[[Any], Any] = lambda r: r,
+             decode: Callable[[Any], Any] = lambda r: r) -> Any:
+        """Replay decode(recorded), or run fn() and record encode(result)."""
+        if self.mode == "replay":
+            return decode(self.replay(kind, key))
+        t0 = time.perf_counter()
+        result = fn()
+        self.record(kind, key, encode(result), time.perf_counter() - t0)
+        return result
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries}, f)
+        os.replace(tmp, self.path)
+        logger.info(f"[CASSETTE] recorded {len(self.entries)} responses to {self.path}")
+
+
+_current: ContextVar[Optional[Cassette]] = ContextVar("cassette", default=None)
+
+
+def current() -> Optional[Cassette]:
+    return _current.get()
+
+
+def replaying() -> bool:
+    """True inside a replay session, or (outside any run, e.g. at import) when CASSETTE_MODE=replay."""
+    cas = _current.get()
+    return cas.mode == "replay" if cas is not None else CASSETTE_MODE == "replay"
+
+
+def path_for(family_id: int) -> str:
+    return os.path.join(CASSETTE_DIR, f"family_{family_id}.json.gz")
+
+
+@contextmanager
+def session(family_id: int, mode: Optional[str] = None) -> Iterator[Optional[Cassette]]:
+    """Record or replay everything inside the block (per CASSETTE_MODE unless mode is given)."""
+    mode = CASSETTE_MODE if mode is None else mode
+    if mode not in ("record", "replay"):
+        yield None
+        return
+    cas = Cassette(path_for(family_id), mode)
+    token = _current.set(cas)
+    try:
+        yield cas
+    finally:
+        _current.reset(token)
+        if mode == "record":
+            cas.save()
+
+
+def key(*parts: Any) -> str:
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+# ---- Gmail ----
+
+_AFTER_RE = re.compile(r"\bafter:\d+\s*")
+
+
+class _GmailCall:
+    def __init__(self, cas: Cassette, kind: str, k: str, request: Any):
+        self.cas, self.kind, self.k, self.request = cas, kind, k, request
+
+    def execute(self, *args, **kwargs):
+        return self.cas.call(self.kind, self.k, lambda: self.request.execute(*args, **kwargs))
+
+
+class GmailCassette:
+    """Stands in for the Gmail service: service.users().messages().list/get/attachments().get()."""
+
+    def __init__(self, cas: Cassette, service: Any = None):
+        self.cas, self.service = cas, service  # service is None when replaying
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def attachments(self):
+        return _GmailAttachments(self)
+
+    def _real(self):
+        return self.service.users().messages()
+
+    def list(self, userId="me", q=None, maxResults=None, pageToken=None, **kw):
+        k = key(_AFTER_RE.sub("", q or ""), maxResults, pageToken)
+        return _GmailCall(self.cas, "gmail.list", k, None if self.service is None else
+                          self._real().list(userId=userId, q=q, maxResults=maxResults, pageToken=pageToken, **kw))
+
+    def get(self, userId="me", id=None, format=None, **kw):
+        return _GmailCall(self.cas, "gmail.get", key(id, format), None if self.service is None else
+                          self._real().get(userId=userId, id=id, format=format, **kw))
+
+
+class _GmailAttachments:
+    def __init__(self, parent: GmailCassette):
+        self.parent = parent
+
+    def get(self, userId="me", messageId=None, id=None, **kw):
+        p = self.parent
+        return _GmailCall(p.cas, "gmail.attachment", key(messageId, id), None if p.service is None else
+                          p._real().attachments().get(userId=userId, messageId=messageId, id=id, **kw))
+
+
+# ---- OpenAI ----
+
+def openai_key(call_site: str, create_kwargs: Dict[str, Any]) -> str:
+    # hashed: the prompt carries the email text, which must not land in the file unsanitized
+    raw = key(create_kwargs.get("model"), create_kwargs.get("messages"))
+    return f"{call_site}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def decode_completion(data: Dict[str, Any]):
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate(data)
+
+
+# ---- Schoology ----
+
+_VOLATILE_PARAMS = ("start_date",)
+
+
+def schoology_key(method: str, url: str, params: Optional[Dict[str, Any]]) -> str:
+    # links.next pages carry start/limit in the URL itself; fold them in with the params
+    base, _, query = url.partition("?")
+    merged = {**dict(parse_qsl(query, keep_blank_values=True)), **{k: str(v) for k, v in (params or {}).items()}}
+    stable = {k: v for k, v in merged.items() if k not in _VOLATILE_PARAMS}
+    return key(method.upper(), base, stable)
+
+
+def encode_response(r) -> Dict[str, Any]:
+    keep = ("ETag", "Last-Modified", "Content-Type")
+    return {"status": r.status_code, "headers": {h: r.headers[h] for h in keep if h in r.headers}, "text": r.text}
+
+
+def decode_response(data: Dict[str, Any]):
+    import requests
+    r = requests.Response()
+    r.status_code = data["status"]
+    r.headers.update(data["headers"])
+    r._content = data["text"].encode("utf-8")
+    r.encoding = "utf-8"
+    return r
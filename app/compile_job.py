@@ -4,10 +4,16 @@ from typing import List, Tuple
 import os
 import pytz
 
+from sqlalchemy import or_, select
 from sqlalchemy.orm import Session
+from .db import release
 from .models import OneLiner, DigestRun, Family
-from .emailer import send_email
+from .outbox import digest_run_key, enqueue_email
 from .llm_digest import format_digest_from_oneliners
+from .llm_usage import over_budget
+from . import rule_based
+from .timings import bind_run, stage
+from .tracing import link_run, span, traced
 from .logger import logger
 
 DEFAULT_TZ = os.getenv("DEFAULT_TIMEZONE", "America/Los_Angeles")
@@ -18,35 +24,31 @@ def _tz(tz_name: str):
 from datetime import datetime
 from typing import List, Dict
 
-def _filter_future_items(items: List[Dict], today_str: str = None) -> List[Dict]:
-    """
-    Keep only items where date_string >= today (if date_string exists).
-    Items without a date_string are kept.
+
+def _upcoming_oneliner_items(db: Session, family_id: int, today_str: str) -> List[Dict]:
     """
-    if today_str is None:
-        today_str = datetime.now().strftime("%Y-%m-%d")
+    The digest payload for one family: only the four columns the LLM needs, with the
+    date window applied in SQL so cost tracks upcoming items, not account age.
 
+    Only items on or after today are kept, on the typed column: event_date >= today, or
+    no parseable date at all (event_date IS NULL). Served by ix_one_liners_family_event_date.
+    """
     today = datetime.strptime(today_str, "%Y-%m-%d").date()
-    kept = []
-
-    for it in items:
-        ds = it.get("date_string")
-        if ds:
-            try:
-                d = datetime.strptime(ds, "%Y-%m-%d").date()
-                if d >= today:
-                    kept.append(it)
-            except ValueError:
-                # if date_string is malformed, keep item (or skip depending on your preference)
-                kept.append(it)
-        else:
-            # no date_string → keep
-            kept.append(it)
-
-    return kept
+    ed = OneLiner.event_date
+    stmt = (
+        select(OneLiner.one_liner, OneLiner.date_string, OneLiner.time_string, OneLiner.domain)
+        .where(OneLiner.family_id == family_id)
+        .where(or_(ed.is_(None), ed >= today))
+        .order_by(ed.asc().nulls_last(), OneLiner.created_at.asc())
+    )
+    return [
+        {"one_liner": r[0], "date_string": r[1], "time_string": r[2], "domain": r[3]}
+        for r in db.execute(stmt)
+    ]
 
 
 # ---------- main ----------
+@traced("compile_and_send_digest")
 def compile_and_send_digest(
     db: Session,
     family_id: int,
@@ -61,41 +63,33 @@ def compile_and_send_digest(
 
     run = DigestRun(family_id=family_id, started_at=datetime.utcnow(), cadence=cadence)
     db.add(run); db.commit(); db.refresh(run)
+    bind_run(run.id)
+    link_run(run.id)
 
     try:
-        # Grab this family's one-liners (you can narrow to the upcoming/current week if you prefer)
-        rows = (
-            db.query(OneLiner)
-            .filter(OneLiner.family_id == family_id)
-            .order_by(OneLiner.date_string.asc().nulls_last(), OneLiner.created_at.asc())
-            .all()
-        )
-        # logger.debug("$$$")
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        items = _upcoming_oneliner_items(db, family_id, today_str)
 
-        if not rows:
+        if not items:
             run.email_sent = False
             run.error = "No one-liners to include."
             run.ended_at = datetime.utcnow()
             db.add(run); db.commit()
             return False, run.error
 
-        # Prepare compact payload for LLM
-        items = []
-        for it in rows:
-            items.append({
-                "one_liner": it.one_liner,
-                "date_string": it.date_string,
-                "time_string": it.time_string,
-                "domain": it.domain
-            })
-        items = _filter_future_items(items)
-        subject, html, text = format_digest_from_oneliners(
-            family_display_name=(fam.display_name or ""),
-            cadence=cadence,
-            tz_name=tz_name,
-            items=items,
-            detail_level=fam.prefs.detail_level
-        )
+        display_name, detail_level = fam.display_name or "", fam.prefs.detail_level
+        release(db)  # the render is an LLM call
+        if over_budget(family_id):
+            subject, html, text = rule_based.render_digest(display_name, cadence, items)
+        else:
+            with stage("compile_llm"), span("llm.compile", items=len(items)):
+                subject, html, text = format_digest_from_oneliners(
+                    family_display_name=display_name,
+                    cadence=cadence,
+                    tz_name=tz_name,
+                    items=items,
+                    detail_level=detail_level
+                )
 
         if not (html and text):
             run.email_sent = False
@@ -104,14 +98,15 @@ def compile_and_send_digest(
             db.add(run); db.commit()
             return False, run.error
 
-        # Email it
-        send_email(subject, html, text, to_emails)
-
-        run.email_sent = True
+        # Persist the render; the outbox worker sends it and marks run.email_sent
+        enqueue_email(
+            db, idempotency_key=digest_run_key(run.id), subject=subject, html=html, text=text,
+            to_addrs=to_emails, family_id=family_id, digest_run_id=run.id,
+        )
         run.items_found = len(items)
         run.ended_at = datetime.utcnow()
         db.add(run); db.commit()
-        return True, "sent"
+        return True, "queued"
 
     except Exception as e:
         run.email_sent = False
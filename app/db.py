@@ -1,8 +1,11 @@
 # app/db.py
 import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
 from urllib.parse import urlsplit, urlunsplit
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
 from .models import Base
 
 
@@ -83,6 +86,79 @@ else:
 engine = create_engine(DATABASE_URL, **engine_kwargs)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+
+class PoolGauge:
+    """Connections currently checked out of an engine's pool, and the high-water mark."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak = 0
+        self.checkouts = 0
+
+    def _checkout(self, *args):
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.peak = max(self.peak, self.in_use)
+
+    def _checkin(self, *args):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_use": self.in_use, "peak": self.peak, "checkouts": self.checkouts}
+
+
+def track_pool(eng) -> PoolGauge:
+    gauge = PoolGauge()
+    event.listen(eng, "checkout", gauge._checkout)
+    event.listen(eng, "checkin", gauge._checkin)
+    return gauge
+
+
+pool_gauge = track_pool(engine)
+
+
+def pool_stats() -> Dict[str, int]:
+    """Pool usage for /healthz and run logs: in_use/peak/checkouts, plus the configured limits."""
+    stats = pool_gauge.snapshot()
+    if hasattr(engine.pool, "size"):
+        stats["size"] = engine.pool.size()
+        stats["max_overflow"] = engine_kwargs.get("max_overflow", 0)
+    return stats
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """One short unit of work: commit on success, roll back on error, always close."""
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def release(db: Session) -> None:
+    """
+    End the session's transaction so its connection goes back to the pool before slow
+    external I/O (Gmail, OpenAI, Schoology, IMAP, SMTP). Pending changes are committed;
+    loaded objects are not expired, so reading them afterwards does not check a
+    connection out again.
+    """
+    expire = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire
+
+
 def init_db():
     """Create tables if they don't exist. Use Alembic for real migrations."""
     Base.metadata.create_all(bind=engine)
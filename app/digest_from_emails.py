@@ -1,13 +1,14 @@
 # app/digest_from_emails.py
 import json, re
 from datetime import datetime, timezone
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
 import pytz
 from openai import OpenAI
 
 from .models import DigestRun, Family
-from .emailer import send_email
+from .outbox import digest_run_key, enqueue_email
 from .llm import get_openai
+from . import llm_usage
 
 client = get_openai()
 
@@ -86,11 +87,12 @@ def _payload_for_llm(emails: List[Dict[str, Any]], tz_name: str) -> Dict[str, An
         "emails": emails,
     }
 
-def _call_llm_for_digest(payload: Dict[str, Any]) -> Tuple[str, str, str]:
+def _call_llm_for_digest(payload: Dict[str, Any], family_id: Optional[int] = None) -> Tuple[str, str, str]:
     """
     Calls Chat Completions and returns (subject, html, text).
     """
-    resp = client.chat.completions.create(
+    resp = llm_usage.chat(
+        client, "digest_from_emails", family_id=family_id,
         # model="gpt-5-mini",
         model="gpt-4.1-mini",
         temperature=0.2,
@@ -138,15 +140,17 @@ def compile_and_send_digest_from_emails(
             return False, run.error
 
         payload = _payload_for_llm(emails, tz_name)
-        subject, html, text = _call_llm_for_digest(payload)
+        subject, html, text = _call_llm_for_digest(payload, family_id)
 
-        send_email(subject, html, text, to_emails)
+        enqueue_email(
+            db, idempotency_key=digest_run_key(run.id), subject=subject, html=html, text=text,
+            to_addrs=to_emails, family_id=family_id, digest_run_id=run.id,
+        )
 
-        run.email_sent = True
         run.items_found = len(emails)  # count of source emails summarized
         run.ended_at = datetime.utcnow()
         db.add(run); db.commit()
-        return True, "sent"
+        return True, "queued"
 
     except Exception as e:
         run.email_sent = False
@@ -1,8 +1,12 @@
 # app/digest_runner.py
 import os
-from typing import Optional, Tuple, Dict, List
+from typing import Callable, Optional, Tuple, Dict, List
 
-from sqlalchemy.orm import Session
+from .db import pool_stats, session_scope
+from .timings import RunTimings, run_timings, save, stage
+from .tracing import span
+from .llm_usage import family_scope, recheck_budget
+from . import cassette, profiling
 from .models import DigestPreference
 from .utils import csv_to_list
 from .logger import logger
@@ -36,21 +40,77 @@ def _resolve_recipients(pref: DigestPreference, user_email_fallback: Optional[st
 
 
 def run_digest_once(
-    db: Session,
     family_id: int,
-    pref: DigestPreference,
     *,
     user_email_fallback: Optional[str] = None,
     days_back: int = 7,
+    progress: Optional[Callable[[str, Dict[str, int]], None]] = None,
 ) -> Tuple[bool, str, Dict[str, int]]:
     """
     Orchestrates: process forwarded → collect recent → create points → compile & send.
     Returns: (sent_ok, message, metrics)
     metrics keys: processed_forwarded, emails_fetched, processed_count, points_created,
                   schoology_created, schoology_oneliners
+    progress, if given, is called as progress(stage, metrics_so_far) when each stage
+    starts: forwarded, collect, summarize, schoology, compile.
+
+    Stage wall times (app/timings.py) are saved to digest_run_stages for the
+    DigestRun that compile creates, and observed into the /metrics histograms.
+
+    Each stage runs on its own short-lived session (session_scope), and the stage
+    functions release their connection before every Gmail/OpenAI/Schoology/IMAP call,
+    so a slow pipeline never pins a pool connection. user_email_fallback defaults to
+    the family owner's address.
+
+    OpenAI calls made during the run are accounted to the family (app/llm_usage.py).
+    With CASSETTE_MODE=record|replay the run's Gmail/Schoology/OpenAI responses are
+    recorded to, or served from, a per-family cassette (app/cassette.py).
+    Families flagged for profiling run under cProfile/a stack sampler (app/profiling.py).
     """
+    with run_timings() as timings, family_scope(family_id), cassette.session(family_id), \
+            profiling.profile_run(family_id, timings), span("digest_run", family_id=family_id):
+        try:
+            return _run_stages(family_id, user_email_fallback, days_back, progress)
+        finally:
+            _save_timings(family_id, timings)
+
+
+def _save_timings(family_id: int, timings: RunTimings):
+    if not timings.seconds:
+        return
+    logger.info(f"[family_id={family_id}] stage_seconds={timings.summary()} run_id={timings.digest_run_id}")
+    try:
+        with session_scope() as db:
+            save(db, timings)
+    except Exception as e:
+        logger.warning(f"[family_id={family_id}] could not save stage timings: {e}")
+
+
+def _run_stages(
+    family_id: int,
+    user_email_fallback: Optional[str],
+    days_back: int,
+    progress: Optional[Callable[[str, Dict[str, int]], None]],
+) -> Tuple[bool, str, Dict[str, int]]:
+    metrics: Dict[str, int] = {}
+
+    def _stage(name: str):
+        recheck_budget()
+        if progress:
+            progress(name, dict(metrics))
+
+    with session_scope() as db:
+        pref = db.query(DigestPreference).filter_by(family_id=family_id).first()
+        if not pref:
+            return False, "No DigestPreference found for family", metrics
+        if user_email_fallback is None and pref.family and pref.family.owner:
+            user_email_fallback = pref.family.owner.email
+        to_emails = _resolve_recipients(pref, user_email_fallback)
+        allowed_domains = _normalize_domains(pref.school_domains)
+        cadence = (pref.cadence or "weekly").strip().lower()
+        tz_name = pref.timezone or DEFAULT_TZ
+
     # Preconditions
-    to_emails = _resolve_recipients(pref, user_email_fallback)
     if not to_emails:
         logger.debug("[DIGEST_RUNNER] run_digest_once - No recipients configured")
         return False, "No recipients configured", {
@@ -60,48 +120,56 @@ def run_digest_once(
             "points_created": 0,
         }
 
-    allowed_domains = _normalize_domains(pref.school_domains)
-    cadence = (pref.cadence or "weekly").strip().lower()
-    tz_name = pref.timezone or DEFAULT_TZ
-
     # Step A: forwarded emails domain maintenance
-    processed_forwarded = process_forwarded_emails_and_update_domains(db)
+    _stage("forwarded")
+    with session_scope() as db, stage("forwarded_imap"):
+        processed_forwarded = process_forwarded_emails_and_update_domains(db)
+    metrics["processed_forwarded"] = int(processed_forwarded or 0)
     logger.info(f"[family_id={family_id}] processed_forwarded={processed_forwarded}")
 
     # Step B: collect and process recent emails
-    emails = collect_recent_emails(
-        db=db,
-        family_id=family_id,
-        allowed_domains=allowed_domains,
-        days_back=days_back,
-    )
-    processed_count, points_created = process_recent_emails_saving_to_points(
-        db=db,
-        family_id=family_id,
-        emails=emails,
-        local_tz=tz_name,
-    )
+    _stage("collect")
+    with session_scope() as db:
+        emails = collect_recent_emails(
+            db=db,
+            family_id=family_id,
+            allowed_domains=allowed_domains,
+            days_back=days_back,
+        )
+    metrics["emails_fetched"] = len(emails)
+    _stage("summarize")
+    with session_scope() as db:
+        processed_count, points_created = process_recent_emails_saving_to_points(
+            db=db,
+            family_id=family_id,
+            emails=emails,
+            local_tz=tz_name,
+        )
+    metrics["processed_count"] = int(processed_count or 0)
+    metrics["points_created"] = int(points_created or 0)
 
     # Step B2: Schoology sync
-    sch_sync = sync_schoology(db, family_id)
-    sch_oneliners = materialize_schoology_items_as_oneliners(db, family_id)
+    _stage("schoology")
+    with stage("schoology"):
+        with session_scope() as db:
+            sch_sync = sync_schoology(db, family_id)
+        with session_scope() as db:
+            sch_oneliners = materialize_schoology_items_as_oneliners(db, family_id, tz_name=tz_name)
+    metrics["schoology_created"] = int(sch_sync.get("created", 0))
+    metrics["schoology_oneliners"] = int(sch_oneliners or 0)
     logger.info(
         f"[family_id={family_id}] emails_fetched={len(emails)} "
         f"processed_count={processed_count} points_created={points_created}"
     )
 
     # Step C: compile + send
-    sent, msg = compile_and_send_digest(
-        db=db,
-        family_id=family_id,
-        to_emails=to_emails,
-        cadence=cadence,
-    )
-    return bool(sent), (msg or "sent" if sent else "not sent"), {
-        "processed_forwarded": int(processed_forwarded or 0),
-        "emails_fetched": len(emails),
-        "processed_count": int(processed_count or 0),
-        "points_created": int(points_created or 0),
-        "schoology_created": int(sch_sync.get("created",0)),
-        "schoology_oneliners": int(sch_oneliners or 0),
-    }
+    _stage("compile")
+    with session_scope() as db:
+        sent, msg = compile_and_send_digest(
+            db=db,
+            family_id=family_id,
+            to_emails=to_emails,
+            cadence=cadence,
+        )
+    logger.debug(f"[family_id={family_id}] db pool {pool_stats()}")
+    return bool(sent), (msg or "sent" if sent else "not sent"), metrics
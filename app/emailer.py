@@ -1,7 +1,9 @@
 # app/emailer.py
-import os, smtplib, ssl
+import os, smtplib, ssl, threading, time
 from email.message import EmailMessage
+from typing import List, Optional
 from .logger import logger
+from .tracing import traced
 
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
@@ -9,9 +11,162 @@ SMTP_USERNAME = os.getenv("SMTP_USERNAME")  # must be full email for Gmail
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", SMTP_USERNAME)  # default to username
 SMTP_FROM_NAME = os.getenv("SMTP_FROM_NAME", "SchoolBrief")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", "90"))   # Gmail caps msgs per connection
+SMTP_POOL_IDLE_SECONDS = int(os.getenv("SMTP_POOL_IDLE_SECONDS", "120"))  # servers drop idle sessions
+SMTP_POOL_NOOP_AFTER = float(os.getenv("SMTP_POOL_NOOP_AFTER", "5"))      # health-check if idle longer
+
+
+class _SMTP(smtplib.SMTP):
+    """smtplib.SMTP that notes whether the message in flight reached the DATA command."""
+    data_started = False
+
+    def data(self, msg):
+        self.data_started = True
+        return super().data(msg)
+
+
+class _PooledConnection:
+    __slots__ = ("server", "sent", "last_used")
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """
+    A few authenticated SMTP sessions shared by every send in the process.
+
+    Connections are handed out LIFO (the warmest one first), NOOP-checked if they sat
+    idle for more than `noop_after` seconds, and retired after `max_messages` sends or
+    `idle_timeout` seconds unused. A send whose session died before DATA is retried once
+    on a fresh connection. Once DATA has started the server may already have accepted
+    the message, so the error propagates and the outbox decides; so does anything else
+    (auth, refused recipients).
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str], *,
+                 starttls: bool = True, size: int = SMTP_POOL_SIZE, max_messages: int = SMTP_POOL_MAX_MESSAGES,
+                 idle_timeout: float = SMTP_POOL_IDLE_SECONDS, noop_after: float = SMTP_POOL_NOOP_AFTER,
+                 timeout: float = 20):
+        self.host, self.port = host, port
+        self.username, self.password = username, password
+        self.starttls = starttls
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self.timeout = timeout
+        self._idle: List[_PooledConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, size))
+        self.connects = 0  # logins performed (for diagnostics/benchmarks)
+
+    def _connect(self) -> _PooledConnection:
+        server = _SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.starttls:
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            self._quit(server)
+            raise
+        self.connects += 1
+        return _PooledConnection(server)
+
+    @staticmethod
+    def _quit(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _healthy(self, conn: _PooledConnection) -> bool:
+        idle = time.monotonic() - conn.last_used
+        if idle > self.idle_timeout or conn.sent >= self.max_messages:
+            return False
+        if idle <= self.noop_after:
+            return True
+        try:
+            return conn.server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _acquire(self) -> _PooledConnection:
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+            if self._healthy(conn):
+                return conn
+            self._quit(conn.server)
+
+    def _release(self, conn: _PooledConnection):
+        conn.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(conn)
+
+    def send(self, msg: EmailMessage):
+        with self._slots:
+            conn = self._acquire()
+            conn.server.data_started = False
+            try:
+                conn.server.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError) as e:
+                if conn.server.data_started:
+                    self._quit(conn.server)
+                    raise
+                logger.debug(f"[SMTP] session lost ({type(e).__name__}); retrying on a fresh connection")
+                self._quit(conn.server)
+                conn = self._connect()
+                try:
+                    conn.server.send_message(msg)
+                except Exception:
+                    self._quit(conn.server)
+                    raise
+            except Exception:
+                self._quit(conn.server)
+                raise
+            conn.sent += 1
+            self._release(conn)
+
+    def close(self):
+        """QUIT every idle connection (drain_outbox calls this at the end of each batch)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._quit(conn.server)
+
+
+_pool: Optional[SMTPPool] = None
+_pool_lock = threading.Lock()
+
+
+def smtp_pool() -> SMTPPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SMTPPool(SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, starttls=SMTP_STARTTLS)
+        return _pool
+
+
+def close_smtp_pool():
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.close()
+
 
 def _from_addr() -> str:
-    logger.debug("")
     name = (SMTP_FROM_NAME or "").strip()
     email = (SMTP_FROM_EMAIL or "").strip()
     if not email:
@@ -20,8 +175,8 @@ def _from_addr() -> str:
         return f"{name} <{email}>"
     return email
 
-def send_email(subject: str, html: str, text: str, to_addrs: list[str]):
-    logger.debug("")
+@traced("send_email")
+def send_email(subject: str, html: str, text: str, to_addrs: list[str], message_id: Optional[str] = None):
     if not (SMTP_USERNAME and SMTP_PASSWORD):
         raise RuntimeError("SMTP credentials are not configured")
 
@@ -30,20 +185,16 @@ def send_email(subject: str, html: str, text: str, to_addrs: list[str]):
     msg["Subject"] = subject or "SchoolBrief"
     msg["From"] = _from_addr()
     msg["To"] = ", ".join(to_addrs or [])
+    if message_id:
+        msg["Message-ID"] = message_id  # stable across retries of the same outbox entry
     # text first, then add HTML alternative
     msg.set_content(text or "")
     if html:
         msg.add_alternative(html, subtype="html")
 
     try:
-        # STARTTLS (port 587)
-        context = ssl.create_default_context()
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20) as server:
-            server.ehlo()
-            server.starttls(context=context)
-            server.ehlo()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.send_message(msg)
+        # STARTTLS (port 587) + LOGIN happen once per pooled connection, not per message
+        smtp_pool().send(msg)
 
     except smtplib.SMTPAuthenticationError as e:
         # Provide human-friendly hints
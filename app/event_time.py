@@ -0,0 +1,130 @@
+# app/event_time.py
+"""
+Typed event date/time for OneLiner.
+
+`date_string` / `time_string` stay as the LLM (or Schoology) produced them, since they
+are what the digest prompt consumes. Alongside them every one-liner gets:
+
+    event_date  DATE      parsed from date_string (YYYY-MM-DD)
+    event_time  TIME      first clock time in time_string (h:mm AM/PM, or 24h HH:MM)
+    event_at    DATETIME  naive UTC instant; when_ts if known, else date + time in the
+                          family's timezone (all-day items pinned to DEFAULT_ALLDAY_LOCAL_HOUR)
+
+so that window queries are plain range scans on indexed columns.
+
+Migration 0006 fills these for existing rows. Rows written without them afterwards
+(e.g. by older code still running during a deploy) can be filled with
+    python -m app.event_time backfill [--batch N]
+"""
+import re
+from datetime import date, datetime, time, timezone
+from typing import Dict, Optional
+
+import pytz
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+DEFAULT_ALLDAY_LOCAL_HOUR = 8  # 8:00 AM local for date-only items
+DEFAULT_TZ = "America/Los_Angeles"
+
+# First clock time in the string: "3:15 PM", "9am", "6:00 PM to 7:38 PM", "14:30"
+_TIME_12H_RE = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*([ap])\.?\s*m\b\.?", re.I)
+_TIME_24H_RE = re.compile(r"\b(\d{1,2}):(\d{2})\b")
+
+
+def parse_event_date(date_string: Optional[str]) -> Optional[date]:
+    s = (date_string or "").strip()
+    if not s:
+        return None
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def parse_event_time(time_string: Optional[str]) -> Optional[time]:
+    s = (time_string or "").strip()
+    if not s:
+        return None
+    m = _TIME_12H_RE.search(s)
+    if m:
+        hour, minute = int(m.group(1)), int(m.group(2) or 0)
+        if not (1 <= hour <= 12 and minute < 60):
+            return None
+        hour = hour % 12 + (12 if m.group(3).lower() == "p" else 0)
+        return time(hour, minute)
+    m = _TIME_24H_RE.search(s)
+    if m and int(m.group(1)) < 24 and int(m.group(2)) < 60:
+        return time(int(m.group(1)), int(m.group(2)))
+    return None
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def event_fields(
+    date_string: Optional[str],
+    time_string: Optional[str],
+    when_ts: Optional[datetime] = None,
+    tz_name: Optional[str] = None,
+) -> Dict[str, object]:
+    """event_date / event_time / event_at for one one-liner (values may be None)."""
+    d = parse_event_date(date_string)
+    t = parse_event_time(time_string)
+    if when_ts is not None:
+        at = _naive_utc(when_ts)
+    elif d is not None:
+        tz = pytz.timezone(tz_name or DEFAULT_TZ)
+        local = datetime.combine(d, t or time(DEFAULT_ALLDAY_LOCAL_HOUR, 0))
+        at = _naive_utc(tz.localize(local, is_dst=False))
+    else:
+        at = None
+    return {"event_date": d, "event_time": t, "event_at": at}
+
+
+def backfill_event_fields(db: Session, batch: int = 1000) -> int:
+    """
+    Fill event_* for one-liners that have a date/time but no event_date yet.
+    Walks the table in id order, one UPDATE executemany per batch. Returns rows updated.
+    """
+    from .models import DigestPreference, OneLiner  # local import to avoid circular
+
+    tz_by_family = dict(db.execute(select(DigestPreference.family_id, DigestPreference.timezone)).all())
+    last_id, updated = 0, 0
+    while True:
+        rows = db.execute(
+            select(OneLiner.id, OneLiner.family_id, OneLiner.date_string, OneLiner.time_string, OneLiner.when_ts)
+            .where(OneLiner.id > last_id, OneLiner.event_date.is_(None), OneLiner.event_at.is_(None))
+            .order_by(OneLiner.id)
+            .limit(batch)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for r in rows:
+            f = event_fields(r.date_string, r.time_string, r.when_ts, tz_by_family.get(r.family_id))
+            if f["event_date"] or f["event_time"] or f["event_at"]:
+                params.append({"id": r.id, **f})
+        if params:
+            db.execute(update(OneLiner), params)
+            updated += len(params)
+        db.commit()
+        last_id = rows[-1].id
+    return updated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .db import session_scope
+
+    ap = argparse.ArgumentParser(description="Typed event date/time maintenance for one_liners.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    bf = sub.add_parser("backfill", help="fill event_date/event_time/event_at where they are missing")
+    bf.add_argument("--batch", type=int, default=1000)
+    args = ap.parse_args()
+    with session_scope() as db:
+        print(f"backfilled {backfill_event_fields(db, batch=args.batch)} one-liners")
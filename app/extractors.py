@@ -116,7 +116,6 @@ def _to_iso(dt_str: str, anchor_dt: datetime) -> Optional[str]:
         return None
 
 def _select_best_dates(anchor_dt: datetime, candidates: List[datetime]) -> List[str]:
-    logger.debug("")
     """
     Given many parsed datetimes, choose the best one(s):
     - Prefer future >= (anchor_dt - 1 day)
@@ -154,7 +153,6 @@ def _clean_text(s: str) -> str:
     return s
 
 def _parse_date_fragments(text: str, anchor_dt: datetime) -> List[datetime]:
-    logger.debug("")
     """Extract plausible datetimes from a line of text, anchored to email time."""
     out: List[datetime] = []
     # try multiple small parses; dateutil can pull several tokens when called repeatedly
@@ -171,7 +169,6 @@ def _parse_date_fragments(text: str, anchor_dt: datetime) -> List[datetime]:
     return out
 
 def _best_single_date(anchor_dt: datetime, candidates: List[datetime]) -> Optional[str]:
-    logger.debug("")
     """Choose a single representative date: next future, else most recent within 45 days."""
     if not candidates:
         return None
@@ -190,7 +187,6 @@ def _best_single_date(anchor_dt: datetime, candidates: List[datetime]) -> Option
     return None
 
 def extract_events_from_html(html: str, anchor_dt: datetime) -> List[Dict[str, Any]]:
-    logger.debug("")
     """
     Extracts items from newsletter-like HTML:
     - Finds sections titled 'Upcoming Events', 'Reminders', 'Important Dates'
@@ -261,6 +257,20 @@ def _context(text: str, start: int, end: int, span: int = CONTEXT_CHARS) -> str:
     b = min(len(text), end + span)
     return text[a:b]
 
+def _mine_dates(text: str, anchor_dt: datetime) -> List[datetime]:
+    out: List[datetime] = []
+    for pat in DATE_PATTERNS:
+        for dm in re.finditer(pat, text, re.I):
+            try:
+                dt = dateparser.parse(dm.group(0), fuzzy=True, default=anchor_dt)
+                if dt and dt.tzinfo is None:
+                    dt = dt.replace(tzinfo=timezone.utc)
+                if dt:
+                    out.append(dt)
+            except Exception:
+                pass
+    return out
+
 def classify(
     text: str,
     anchor_dt: datetime,
@@ -316,37 +326,18 @@ def classify(
 
             # Prefer a single task-like line (strip markdown bullets etc.)
             # First line that contains the keyword span or follows it closely
-            lines = [ln.strip(" •-*>\t") for ln in ctx.splitlines() if ln.strip()]
-            snippet = lines[0][:300] if lines else m.group(0)[:300]
+            a = search_text.rfind("\n", 0, m.start()) + 1
+            b = search_text.find("\n", m.end())
+            line = search_text[a:b if b >= 0 else len(search_text)].strip(" •-*>\t\r")
+            snippet = line[:300] if line else m.group(0)[:300]
 
-            # Mine dates from the local context
+            # Mine dates from the hit's own line, then the local context,
+            # then (fallback) the very first 2k chars
             local_dates = []
-            for pat in DATE_PATTERNS:
-                for dm in re.finditer(pat, ctx, re.I):
-                    frag = dm.group(0)
-                    try:
-                        dt = dateparser.parse(frag, fuzzy=True, default=anchor_dt)
-                        if dt and dt.tzinfo is None:
-                            dt = dt.replace(tzinfo=timezone.utc)
-                        if dt:
-                            local_dates.append(dt)
-                    except Exception:
-                        pass
-
-            # Fallback: very first 2k chars if nothing near the hit
-            if not local_dates:
-                head = search_text[:2000]
-                for pat in DATE_PATTERNS:
-                    for dm in re.finditer(pat, head, re.I):
-                        frag = dm.group(0)
-                        try:
-                            dt = dateparser.parse(frag, fuzzy=True, default=anchor_dt)
-                            if dt and dt.tzinfo is None:
-                                dt = dt.replace(tzinfo=timezone.utc)
-                            if dt:
-                                local_dates.append(dt)
-                        except Exception:
-                            pass
+            for where in (line, ctx, search_text[:2000]):
+                local_dates = _mine_dates(where, anchor_dt)
+                if local_dates:
+                    break
 
             chosen = _select_best_dates(anchor_dt, local_dates)
             if chosen:
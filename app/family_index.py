@@ -0,0 +1,192 @@
+# app/family_index.py
+"""
+Normalized, indexed mirrors of the CSV columns on DigestPreference.
+
+`to_addresses` and `school_domains` stay the source of truth (settings, billing and
+the digest runner read them), but matching an inbound sender to a family or listing
+known domains should not mean loading and splitting every family's CSV. An
+after_flush hook rewrites the family_recipients / family_domains rows for any
+DigestPreference whose CSV changed, in the same transaction as the change, and
+adjusts the per-domain family counts behind the settings-page suggestions. The
+suggestions cache is cleared once that transaction commits (after_commit), so a
+reader never caches counts that are later rolled back.
+"""
+import os, threading, time
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import delete, event, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from .models import DigestPreference, DomainPopularity, Family, FamilyDomain, FamilyRecipient
+from .utils import upsert_insert
+
+SUGGESTIONS_TTL_SECONDS = int(os.getenv("DOMAIN_SUGGESTIONS_TTL", "300"))
+SUGGESTIONS_LIMIT = int(os.getenv("DOMAIN_SUGGESTIONS_LIMIT", "200"))
+
+_suggestions_lock = threading.Lock()
+_suggestions_cache = {"expires": 0.0, "value": []}
+_SUGGESTIONS_STALE = "family_index.suggestions_stale"   # Session.info flag, see _invalidate_after_commit
+
+
+def normalize_recipients(csv_str: Optional[str]) -> Set[str]:
+    return {e.strip().lower() for e in (csv_str or "").split(",") if e.strip()}
+
+
+def normalize_domains(csv_str: Optional[str]) -> Set[str]:
+    out = set()
+    for d in (csv_str or "").split(","):
+        d = d.strip().lstrip("@").lower()
+        if d:
+            out.add(d)
+    return out
+
+
+def _reconcile(conn, model, column, family_id: int, wanted: Set[str]):
+    """Make `model` rows for family_id equal `wanted`. Returns (added, removed)."""
+    col = getattr(model, column)
+    have = set(conn.execute(select(col).where(model.family_id == family_id)).scalars())
+    added, removed = wanted - have, have - wanted
+    if removed:
+        conn.execute(delete(model).where(model.family_id == family_id, col.in_(removed)))
+    if added:
+        conn.execute(insert(model), [{"family_id": family_id, column: v} for v in sorted(added)])
+    return added, removed
+
+
+def _bump_popularity(conn, domains: Set[str], delta: int):
+    if not domains:
+        return
+    if delta < 0:
+        conn.execute(
+            update(DomainPopularity)
+            .where(DomainPopularity.domain.in_(domains))
+            .values(family_count=DomainPopularity.family_count + delta)
+        )
+        return
+    stmt = upsert_insert(conn.dialect.name, DomainPopularity)
+    if stmt is not None:
+        stmt = stmt.values([{"domain": d, "family_count": delta} for d in sorted(domains)])
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[DomainPopularity.domain],
+            set_={"family_count": DomainPopularity.family_count + stmt.excluded.family_count},
+        ))
+        return
+    for d in sorted(domains):
+        res = conn.execute(
+            update(DomainPopularity)
+            .where(DomainPopularity.domain == d)
+            .values(family_count=DomainPopularity.family_count + delta)
+        )
+        if not res.rowcount:
+            conn.execute(insert(DomainPopularity).values(domain=d, family_count=delta))
+
+
+def sync_preference(conn, pref: DigestPreference, deleted: bool = False):
+    """Bring the index rows (and domain counts) for one preference in line with its CSV columns."""
+    added, removed = set(), set()
+    # a preference moved to another family (or detached) leaves its rows under the old id
+    for old_family_id in inspect(pref).attrs.family_id.history.deleted or ():
+        if old_family_id and old_family_id != pref.family_id:
+            _reconcile(conn, FamilyRecipient, "email", old_family_id, set())
+            old_domains = _reconcile(conn, FamilyDomain, "domain", old_family_id, set())[1]
+            _bump_popularity(conn, old_domains, -1)
+            removed |= old_domains
+    if pref.family_id:
+        recipients = set() if deleted else normalize_recipients(pref.to_addresses)
+        domains = set() if deleted else normalize_domains(pref.school_domains)
+        _reconcile(conn, FamilyRecipient, "email", pref.family_id, recipients)
+        added, now_removed = _reconcile(conn, FamilyDomain, "domain", pref.family_id, domains)
+        _bump_popularity(conn, added, +1)
+        _bump_popularity(conn, now_removed, -1)
+        removed |= now_removed
+    return added, removed
+
+
+def _csv_changed(pref: DigestPreference) -> bool:
+    state = inspect(pref)
+    return any(state.attrs[name].history.has_changes() for name in ("to_addresses", "school_domains", "family_id"))
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_family_index(session: Session, flush_context):
+    touched: List[DigestPreference] = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, DigestPreference) and _csv_changed(obj)
+    ]
+    gone = [obj for obj in session.deleted if isinstance(obj, DigestPreference)]
+    if not (touched or gone):
+        return
+    conn = session.connection()
+    changed = False
+    for pref in touched:
+        changed |= any(sync_preference(conn, pref))
+    for pref in gone:
+        changed |= any(sync_preference(conn, pref, deleted=True))
+    if changed:
+        session.info[_SUGGESTIONS_STALE] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    if session.info.pop(_SUGGESTIONS_STALE, False):
+        invalidate_domain_suggestions()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session):
+    session.info.pop(_SUGGESTIONS_STALE, None)
+
+
+# ---- Lookups ----
+
+def family_for_recipient(db: Session, email: str) -> Optional[Family]:
+    """Family whose recipient list contains `email` (index probe on family_recipients.email)."""
+    email = (email or "").strip().lower()
+    if not email:
+        return None
+    return (
+        db.query(Family)
+        .join(FamilyRecipient, FamilyRecipient.family_id == Family.id)
+        .filter(FamilyRecipient.email == email)
+        .order_by(Family.id.asc())
+        .first()
+    )
+
+
+def invalidate_domain_suggestions():
+    with _suggestions_lock:
+        _suggestions_cache["expires"] = 0.0
+
+
+def domain_suggestions(db: Session) -> List[str]:
+    """
+    Most widely used domains (up to DOMAIN_SUGGESTIONS_LIMIT), alphabetized.
+    Served from the materialized domain_popularity counts behind an in-process TTL cache.
+    """
+    now = time.monotonic()
+    with _suggestions_lock:
+        if now < _suggestions_cache["expires"]:
+            return list(_suggestions_cache["value"])
+    rows = db.execute(
+        select(DomainPopularity.domain)
+        .where(DomainPopularity.family_count > 0)
+        .order_by(DomainPopularity.family_count.desc(), DomainPopularity.domain)
+        .limit(SUGGESTIONS_LIMIT)
+    ).scalars()
+    value = sorted(rows)
+    with _suggestions_lock:
+        _suggestions_cache.update(expires=now + SUGGESTIONS_TTL_SECONDS, value=value)
+    return list(value)
+
+
+def backfill_family_index(db: Session, prefs: Optional[Iterable[DigestPreference]] = None) -> int:
+    """Reconcile index rows with the CSV columns. Returns the number of preferences visited."""
+    conn = db.connection()
+    n = 0
+    for pref in (prefs if prefs is not None else db.query(DigestPreference).all()):
+        if pref.family_id:
+            if any(sync_preference(conn, pref)):
+                db.info[_SUGGESTIONS_STALE] = True
+            n += 1
+    db.commit()
+    return n
@@ -7,6 +7,9 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from pdfminer.high_level import extract_text as pdf_extract
 import html2text
 
+from .timings import stage
+from .tracing import span
+
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
 
@@ -77,14 +80,16 @@ def extract_text_from_message(service, msg: Dict) -> str:
             body = part.get("body") or {}
             att_id = body.get("attachmentId")
             if att_id:
-                att = service.users().messages().attachments().get(
-                    userId="me", messageId=msg["id"], id=att_id
-                ).execute()
+                with span("gmail.attachment", gmail_id=msg.get("id")):
+                    att = service.users().messages().attachments().get(
+                        userId="me", messageId=msg["id"], id=att_id
+                    ).execute()
                 data = att.get("data")
                 if data:
                     try:
                         pdf_bytes = base64.urlsafe_b64decode(data)
-                        text = pdf_extract(io.BytesIO(pdf_bytes))
+                        with stage("pdf_extract"), span("pdf.extract", gmail_id=msg.get("id"), bytes=len(pdf_bytes)):
+                            text = pdf_extract(io.BytesIO(pdf_bytes))
                         if text and text.strip():
                             plains.append(text)
                     except Exception:
@@ -8,6 +8,8 @@ from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from sqlalchemy.orm import Session
 
+from . import cassette
+from .db import release
 from .models import ProviderAccount, Family
 from .security import encrypt_text, decrypt_text
 from .google_oauth import creds_from_token_json, token_json_from_creds
@@ -78,6 +80,7 @@ def get_google_creds_for_family(db: Session, family_id: int) -> Credentials:
     pa = _load_provider_account_for_family_owner(db, family_id)
     if not pa:
         raise GoogleAuthError("No Google provider account found for family owner.")
+    release(db)  # rehydrating may refresh the token with Google
     creds = _rehydrate_creds(pa)
     return _maybe_refresh_and_persist(db, pa, creds)
 
@@ -85,5 +88,9 @@ def gmail_service_for_family(db: Session, family_id: int):
     """
     Convenience: return a ready Gmail API service for the family owner.
     """
+    cas = cassette.current()
+    if cas is not None and cas.mode == "replay":
+        return cassette.GmailCassette(cas)
     creds = get_google_creds_for_family(db, family_id)
-    return build("gmail", "v1", credentials=creds)
+    service = build("gmail", "v1", credentials=creds)
+    return service if cas is None else cassette.GmailCassette(cas, service)
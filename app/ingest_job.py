@@ -1,14 +1,16 @@
 # app/ingest_job.py
+from dataclasses import dataclass
 from datetime import datetime, timezone
 import email as email_mod
 from email import message_from_string
 from email.message import Message
-from email.utils import parseaddr
+from email.utils import parseaddr, parsedate_to_datetime
+from google.auth.exceptions import RefreshError
 from googleapiclient.errors import HttpError
 import imaplib
 from sqlalchemy.orm import Session
 from typing import List, Tuple, Optional, Dict
-import os, pytz, re
+import base64, os, pytz, quopri, re
 from .gmail_simple import (
     build_query,
     extract_text_from_message,
@@ -16,10 +18,17 @@ from .gmail_simple import (
 )
 from .gmail_tokens import gmail_service_for_family, GoogleAuthError
 from .emailer import send_reconnect_email
+from .family_index import family_for_recipient
+from .event_time import DEFAULT_ALLDAY_LOCAL_HOUR, event_fields, parse_event_time
+from .db import release
 from .security import encrypt_text
+from .timings import stage
+from .tracing import current_span, span, traced
 from .llm import summarize_email_to_points
-from .logger import logger
-from .models import OneLiner, ProcessedEmail, ProviderAccount, Family, DigestPreference, User
+from .llm_usage import over_budget
+from . import cassette, extractors
+from .logger import logger, sampled
+from .models import OneLiner, ProcessedEmail, ProviderAccount, Family, DigestPreference, User, ImapCursor
 
 EMAIL_RE = re.compile(
     r'(?mi)^\s*From:\s*(?:.+?)?<\s*([A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,})\s*>'
@@ -85,6 +94,26 @@ def _email_headers(msg) -> dict:
         "message_id": headers.get("message-id", "") or "",
     }
 
+@dataclass(slots=True)
+class FetchedEmail:
+    """What the pipeline keeps of a Gmail message once its text is extracted; the raw
+    payload (parts, base64 bodies, attachments) is dropped at fetch time."""
+    gmail_id: str
+    subject: str
+    sender: str
+    message_id: str
+    date: str
+    domain: Optional[str]
+    body_text: str          # "" when extraction failed or the message has no text
+
+    @classmethod
+    def from_message(cls, msg: dict, body_text: str) -> "FetchedEmail":
+        hdr = _email_headers(msg)
+        _, addr = parseaddr(hdr["from"])  # e.g., "Mrs. Smith <teacher@schoology.com>"
+        domain = addr.split("@")[-1].lower() if addr and "@" in addr else None
+        return cls(msg.get("id", ""), hdr["subject"], hdr["from"], hdr["message_id"], hdr["date"], domain,
+                   body_text)
+
 def _list_all_ids(service, q: str, page_size: int = 100) -> list[str]:
     ids = []
     page_token = None
@@ -99,7 +128,6 @@ def _list_all_ids(service, q: str, page_size: int = 100) -> list[str]:
     return ids
 
 
-DEFAULT_ALLDAY_LOCAL_HOUR = 8  # 8:00 AM local for date-only items
 
 _DATE_ONLY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 _ZERO_CLOCK_RE = re.compile(r"^(?:\d{4}-\d{2}-\d{2}[T ]|)(00:00(?::00(?:\.0+)?)?)(?:Z|[+\-]\d{2}:\d{2})?$")
@@ -145,6 +173,69 @@ def _to_when_ts_and_flag(when_iso: str, local_tz: str) -> Tuple[Optional[datetim
     except Exception:
         return (None, False)
 
+
+def _rule_based_points(em: FetchedEmail, local_tz: str) -> List[Dict]:
+    """
+    extractors.classify output in summarize_email_to_points' point shape; the fallback once a
+    family is over its daily token budget. Relative dates ("Friday") are anchored to the email's
+    Date header in the family's timezone.
+    """
+    tz = pytz.timezone(local_tz)
+    try:
+        anchor_dt = parsedate_to_datetime(em.date).astimezone(tz)
+    except (TypeError, ValueError):
+        anchor_dt = datetime.now(tz)
+
+    points, seen = [], set()
+    for item in extractors.classify(em.body_text, anchor_dt, subject=em.subject):
+        one = " ".join((item.get("snippet") or "").split())
+        dates = item.get("dates") or []
+        if not one or not dates or one.lower() in seen:
+            continue
+        seen.add(one.lower())
+        iso = dates[0]["iso"]
+        when_iso = ""
+        if item.get("_calendar_url"):
+            # calendar links carry the real start time
+            when_iso = iso
+            start = datetime.fromisoformat(iso).astimezone(tz)
+            day, t = start.date().isoformat(), start.time()
+        else:
+            # otherwise the clock part of iso is just the anchor's; take the time from the text
+            day, t = iso[:10], parse_event_time(one)
+        points.append({
+            "one_liner": one,
+            "when_iso": when_iso,
+            "date_string": day,
+            "time_string": t.strftime("%I:%M %p").lstrip("0") if t else "",
+        })
+    return points
+
+
+def _recover_google_auth(db: Session, family_id: int):
+    """
+    Clear the family owner's broken Google token and email them to reconnect (best effort).
+    NOTE: a background job cannot "log the user out" (no request/session context). Web
+    requests should check for a missing provider token and force a reconnect UX.
+    """
+    fam_owner = db.query(Family).filter_by(id=family_id).first()
+    if not fam_owner:
+        return
+    user = db.query(User).filter_by(id=fam_owner.owner_user_id).first()
+    if not user:
+        return
+    pa = db.query(ProviderAccount).filter_by(user_id=user.id, provider="google").first()
+    if pa and pa.token_json_enc:
+        pa.token_json_enc = None
+        db.add(pa); db.commit()
+    # Fire-and-forget email (best effort)
+    try:
+        send_reconnect_email(user)
+    except Exception:
+        logger.debug("send_reconnect_email failed during ingest", exc_info=True)
+
+
+@traced("collect_recent_emails")
 def collect_recent_emails(
     db: Session,
     family_id: int,
@@ -155,7 +246,7 @@ def collect_recent_emails(
     if not fam:
         raise RuntimeError("Family not found.")
     prov = db.query(ProviderAccount).filter_by(user_id=fam.owner_user_id, provider="google").first()
-    if not prov or not prov.token_json_enc:
+    if (not prov or not prov.token_json_enc) and not cassette.replaying():
         raise RuntimeError("No Google account connected. Connect Google in Settings.")
     if not allowed_domains:
         raise RuntimeError(
@@ -167,117 +258,108 @@ def collect_recent_emails(
     try:
         service = gmail_service_for_family(db, family_id)
     except GoogleAuthError as e:
-        # Attempt recovery: clear the broken token, notify user, and hint they must reconnect.
-        # NOTE: This background job cannot "log the user out" (no request/session context).
-        # Web requests should check for missing provider token and force a reconnect UX.
-        fam_owner = db.query(Family).filter_by(id=family_id).first()
-        if fam_owner:
-            user = db.query(User).filter_by(id=fam_owner.owner_user_id).first()
-            if user:
-                pa = db.query(ProviderAccount).filter_by(user_id=user.id, provider="google").first()
-                if pa and pa.token_json_enc:
-                    pa.token_json_enc = None
-                    db.add(pa); db.commit()
-                # Fire-and-forget email (best effort)
-                try:
-                    send_reconnect_email(user)
-                except Exception:
-                    logger.debug("send_reconnect_email failed during ingest", exc_info=True)
+        _recover_google_auth(db, family_id)
         raise RuntimeError(str(e))
 
-
+    release(db)  # nothing below touches the DB; don't hold a connection across Gmail calls
     q = build_query(days_back=days_back, allowed_domains=allowed_domains)
-    logger.debug(f"[INGEST] family_id={family_id} days_back={days_back} domains={allowed_domains}")
-    logger.debug(f"[INGEST] Gmail query (with domains): {q}")
+    logger.debug("[INGEST] family_id=%s days_back=%s domains=%s", family_id, days_back, allowed_domains)
+    if sampled("ingest.query"):
+        logger.debug("[INGEST] Gmail query (with domains): %s", q)
 
     try:
-        ids = _list_all_ids(service, q)
+        with stage("gmail_list"), span("gmail.list"):
+            ids = _list_all_ids(service, q)
+    except RefreshError as e:
+        _recover_google_auth(db, family_id)
+        raise RuntimeError(str(e))
     except HttpError as he:
         logger.debug(f"[INGEST] List error: {he.status_code if hasattr(he,'status_code') else ''} {he}")
-        return 0, 0
+        return []
 
-    logger.debug(f"[INGEST] Found {len(ids)} message(s) with domain filter)")
+    logger.debug("[INGEST] Found %d message(s) with domain filter", len(ids))
+    current_span().set(domains=",".join(allowed_domains), messages=len(ids))
 
-    emails = []
+    # Text is extracted (attachments fetched, PDFs parsed) as each message arrives, and only
+    # a FetchedEmail is kept, so at most one full payload is alive at a time.
+    emails: List[FetchedEmail] = []
     for mid in ids:
         try:
             # RETRIES on get()
-            msg = service.users().messages().get(userId="me", id=mid, format="full").execute(num_retries=3)
-            emails.append(msg)
+            with stage("gmail_get"), span("gmail.get", gmail_id=mid):
+                msg = service.users().messages().get(userId="me", id=mid, format="full").execute(num_retries=3)
+            try:
+                body_text = extract_text_from_message(service, msg)
+            except RefreshError:
+                raise
+            except Exception as e:
+                logger.debug("[INGEST] extract_text failed (%s): %s", mid, e)
+                body_text = ""
+            emails.append(FetchedEmail.from_message(msg, body_text))
+            del msg
+        except RefreshError as e:
+            # the token died mid-run (revoked, or the refresh failed): same recovery as above
+            _recover_google_auth(db, family_id)
+            raise RuntimeError(str(e))
         except HttpError as he:
             # LOG REAL ERROR DETAILS
             status = getattr(he, "status_code", None)
             err_body = getattr(he, "content", b"").decode("utf-8", errors="ignore")
-            logger.debug(f"[INGEST] HttpError on message {mid}: status={status} body={err_body[:200]}")
+            logger.debug("[INGEST] HttpError on message %s: status=%s body=%s", mid, status, err_body[:200])
             continue
         except Exception as e:
-            logger.debug(f"[INGEST] Connection/Other error on message {mid}: {type(e).__name__}: {e}")
+            logger.debug("[INGEST] Connection/Other error on message %s: %s: %s", mid, type(e).__name__, e)
             continue
 
     return emails
 
+@traced("process_recent_emails_saving_to_points")
 def process_recent_emails_saving_to_points(
         db: Session,
         family_id: int,
-        emails: Dict, 
+        emails: List[FetchedEmail],
         local_tz: str = "America/Los_Angeles",
 ) -> Tuple[int, int]:
+    """
+    Summarize each new email from collect_recent_emails into one-liners. No Gmail calls, so
+    no Google auth to recover here: collect_recent_emails does that (_recover_google_auth).
+    """
     processed_count = 0
     points_created = 0
-    created_local = 0
-    try:
-        service = gmail_service_for_family(db, family_id)
-    except GoogleAuthError as e:
-        # Same recovery logic here: clear token & notify user. See note above re: logout limitations.
-        fam_owner = db.query(Family).filter_by(id=family_id).first()
-        if fam_owner:
-            user = db.query(User).filter_by(id=fam_owner.owner_user_id).first()
-            if user:
-                pa = db.query(ProviderAccount).filter_by(user_id=user.id, provider="google").first()
-                if pa and pa.token_json_enc:
-                    pa.token_json_enc = None
-                    db.add(pa); db.commit()
-                try:
-                    send_reconnect_email(user)
-                except Exception:
-                    logger.debug("send_reconnect_email failed during process_recent_emails", exc_info=True)
-        raise RuntimeError(str(e))
-    
-    for msg in emails:
-        hdr = _email_headers(msg)
-        subj = hdr.get("subject", "")
-        sender = hdr.get("from", "")
-        # Safely parse email address from "From" header
-        _, addr = parseaddr(sender)  # e.g., "Mrs. Smith <teacher@schoology.com>"
-        domain = None
-        if addr and "@" in addr:
-            domain = addr.split("@")[-1].lower()
-
-        try:
-            body_text = extract_text_from_message(service, msg)
-        except Exception as e:
-            logger.debug(f"[INGEST] extract_text failed ({subj}): {e}")
-            continue
+    for em in emails:
+        created_local = 0
+        subj, body_text, domain = em.subject, em.body_text, em.domain
 
-        if not (body_text and body_text.strip()):
+        if not body_text.strip():
             # Skip empty bodies quietly
             continue
 
         h = stable_hash(subj, body_text)
-        if db.query(ProcessedEmail).filter_by(family_id=family_id, content_hash=h).first():
+        seen = db.query(ProcessedEmail.id).filter_by(family_id=family_id, content_hash=h).first()
+        release(db)  # next: OpenAI
+        if seen:
             # Already processed
             continue
 
-        # Summarize with LLM
+        # Summarize with LLM (rule-based once the family is over its daily token budget)
         try:
-            points = summarize_email_to_points(subj, body_text, local_tz=local_tz, domain=domain) or []
-            logger.debug(f"[INGEST] {len(points)} points from LLM")
+            if over_budget(family_id):
+                points = _rule_based_points(em, local_tz)
+                logger.debug("[INGEST] %d points from rule-based extractor", len(points))
+            else:
+                with stage("llm_summarize"), span("email.summarize", message_id=em.message_id,
+                                                  subject=subj[:120], body_chars=len(body_text)) as sp:
+                    points = summarize_email_to_points(subj, body_text, local_tz=local_tz, domain=domain) or []
+                    sp.set(points=len(points))
+                logger.debug("[INGEST] %d points from LLM", len(points))
 
-            for i, p in enumerate(points):
-                logger.debug(f"    [{i}] one_liner={p.get('one_liner')!r} date_string={p.get('date_string')!r} time_string={p.get('time_string')!r}")
+            if sampled("ingest.points"):
+                for i, p in enumerate(points):
+                    logger.debug("    [%d] one_liner=%r date_string=%r time_string=%r",
+                                 i, p.get("one_liner"), p.get("date_string"), p.get("time_string"))
 
         except Exception as e:
-            logger.debug(f"[INGEST] LLM error for ({subj}): {e}")
+            logger.debug("[INGEST] LLM error for (%s): %s", subj, e)
             continue
 
         for p in points:
@@ -297,25 +379,27 @@ def process_recent_emails_saving_to_points(
             # logger.debug("[ADD OneLiner] %s | %s | %s", one, when_ts, when_iso)
             db.add(OneLiner(
                 family_id=family_id,
-                source_msg_id=(hdr.get("message_id") or "Unknown")[:128],
+                source_msg_id=(em.message_id or "Unknown")[:128],
                 one_liner=one[:200],
                 when_ts=when_ts,
                 created_at=datetime.now(timezone.utc),
                 date_string=date_string,         # NEVER None
                 time_string=time_string,         # NEVER None
                 domain=domain,                   # NEVER None
+                **event_fields(date_string, time_string, when_ts, local_tz),
             ))
             created_local += 1
 
         # NEW — ProcessedEmail (columns: gmail_msg_id, subject, processed_at)       
         db.add(ProcessedEmail(
             family_id=family_id,
-            gmail_msg_id=(hdr.get("message_id") or "unknown")[:128],
+            gmail_msg_id=(em.message_id or "unknown")[:128],
             content_hash=h,
             subject=(subj or "")[:1000],
             processed_at=datetime.now(timezone.utc),
         ))
-        db.commit()
+        with stage("db_write"):
+            db.commit()
 
         processed_count += 1
         points_created += created_local
@@ -345,148 +429,324 @@ def extract_senders(raw_email: str) -> Tuple[Optional[str], Optional[str]]:
 
     return current_from, original_from
 
-def process_forwarded_emails_and_update_domains(db: Session):
+
+# --- Forwarded-mail IMAP ingest ---------------------------------------------
+
+FORWARD_FETCH_BATCH = int(os.getenv("FORWARD_IMAP_BATCH", "50"))
+FORWARD_PEEK_BYTES = int(os.getenv("FORWARD_IMAP_PEEK_BYTES", "65536"))
+
+_FETCH_START_RE = re.compile(rb"^\d+ \(")
+_FETCH_UID_RE = re.compile(rb"UID (\d+)")
+_FETCH_SECTION_RE = re.compile(rb"BODY\[([^\]]*)\](?:<\d+>)? \{\d+\}$")
+_SEXP_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+
+
+def _uid_set(uids: List[int]) -> str:
+    return ",".join(str(u) for u in uids)
+
+
+def _parse_sexp(data: bytes, pos: int = 0):
+    """Parse one IMAP parenthesized list (e.g. a BODYSTRUCTURE) into nested lists of str/None."""
+    stack: List[list] = [[]]
+    while pos < len(data):
+        m = _SEXP_TOKEN_RE.match(data, pos)
+        if not m:
+            break
+        pos = m.end()
+        opening, closing, quoted, atom = m.groups()
+        if opening:
+            stack.append([])
+            continue
+        if closing:
+            done = stack.pop()
+            stack[-1].append(done)
+            if len(stack) == 1:
+                return done
+            continue
+        if quoted is not None:
+            stack[-1].append(re.sub(rb"\\(.)", rb"\1", quoted).decode("utf-8", errors="replace"))
+        else:
+            stack[-1].append(None if atom.upper() == b"NIL" else atom.decode("ascii", errors="replace"))
+        if len(stack) == 1:
+            return stack[0][0]
+    return None
+
+
+def _parse_uid_fetch(data) -> Dict[int, Dict[str, bytes]]:
+    """
+    Group an imaplib UID FETCH response by UID.
+    Returns {uid: {"HEADER": b"...", "1": b"...", "": b"..."}} keyed by section, plus
+    "BODYSTRUCTURE" (the raw parenthesized list) when it was requested.
+    """
+    out: Dict[int, Dict[str, bytes]] = {}
+    current: Dict[str, bytes] = {}
+    current_uid: Optional[int] = None
+
+    def _flush():
+        if current_uid is not None:
+            out.setdefault(current_uid, {}).update(current)
+
+    for item in data or []:
+        if isinstance(item, tuple) and len(item) >= 2:
+            prefix, literal = item[0] or b"", item[1] or b""
+            if _FETCH_START_RE.match(prefix):
+                _flush()
+                current, current_uid = {}, None
+            m = _FETCH_UID_RE.search(prefix)
+            if m:
+                current_uid = int(m.group(1))
+            bs = prefix.find(b"BODYSTRUCTURE (")
+            if bs >= 0:
+                current["BODYSTRUCTURE"] = prefix[bs + len(b"BODYSTRUCTURE "):]
+            sec = _FETCH_SECTION_RE.search(prefix)
+            if sec:
+                current[sec.group(1).decode("ascii", errors="ignore").upper()] = literal
+        elif isinstance(item, bytes):
+            # trailing data after a literal, e.g. b" UID 42)" or b")"
+            m = _FETCH_UID_RE.search(item)
+            if m:
+                current_uid = int(m.group(1))
+    _flush()
+    return out
+
+
+def _decode_peeked_part(raw: bytes, cte: Optional[str]) -> str:
+    """Decode a body part fetched via BODY.PEEK[1] per its Content-Transfer-Encoding."""
+    cte = (cte or "").strip().lower()
+    try:
+        if cte == "base64":
+            raw = base64.b64decode(raw, validate=False)
+        elif cte == "quoted-printable":
+            raw = quopri.decodestring(raw)
+    except Exception:
+        pass
+    return raw.decode("utf-8", errors="replace")
+
+
+def _bodystructure_parts(bs) -> List[list]:
+    """Leaf parts (and attached messages) of a parsed BODYSTRUCTURE, depth first."""
+    if not isinstance(bs, list) or not bs:
+        return []
+    if isinstance(bs[0], list):  # multipart: children, then subtype
+        return [leaf for child in bs if isinstance(child, list) for leaf in _bodystructure_parts(child)]
+    return [bs]
+
+
+def _section1_encoding(bs) -> Optional[str]:
+    """Content-Transfer-Encoding of BODY[1]: the body itself, or the first child of a multipart."""
+    if not isinstance(bs, list) or not bs:
+        return None
+    first = bs[0] if isinstance(bs[0], list) else bs
+    if isinstance(first[0], list) or len(first) < 6:
+        return None  # section 1 is itself a multipart; no single encoding
+    return first[5]
+
+
+def _rfc822_sender(bs) -> Optional[str]:
+    """From address in the envelope of the first attached message/rfc822, if any."""
+    for part in _bodystructure_parts(bs):
+        if len(part) > 7 and str(part[0]).lower() == "message" and str(part[1]).lower() == "rfc822":
+            env = part[7]
+            addrs = env[2] if isinstance(env, list) and len(env) > 2 else None
+            if isinstance(addrs, list) and addrs and isinstance(addrs[0], list) and len(addrs[0]) >= 4:
+                mailbox, host = addrs[0][2], addrs[0][3]
+                if mailbox and host:
+                    return f"{mailbox}@{host}"
+    return None
+
+
+def _original_from_peek(structure: Optional[bytes], part: Optional[bytes]) -> Optional[str]:
+    """
+    Find the forwarded sender without downloading the full message: the envelope of an
+    attached message/rfc822 first (a proper forward), then a "From:" line in the first
+    text part, decoded per its BODYSTRUCTURE encoding.
+    """
+    bs = _parse_sexp(structure) if structure else None
+    addr = _rfc822_sender(bs)
+    if addr or not part:
+        return addr
+    return _first_email_in_text(_decode_peeked_part(part, _section1_encoding(bs)))
+
+
+def _load_imap_cursor(db: Session, mailbox: str, uidvalidity: int) -> ImapCursor:
+    cur = db.query(ImapCursor).filter_by(mailbox=mailbox).first()
+    if not cur:
+        cur = ImapCursor(mailbox=mailbox, uidvalidity=uidvalidity, last_uid=0)
+        db.add(cur); db.commit()
+    elif int(cur.uidvalidity or 0) != uidvalidity:
+        # Mailbox was rebuilt server-side; old UIDs mean nothing now.
+        logger.info(f"[FORWARD-INGEST] UIDVALIDITY changed {cur.uidvalidity} -> {uidvalidity}; resetting cursor")
+        cur.uidvalidity = uidvalidity
+        cur.last_uid = 0
+        cur.updated_at = datetime.utcnow()
+        db.add(cur); db.commit()
+    return cur
+
+
+def _match_forwarding_family(db: Session, current_sender: str, imap_user: str) -> Optional[Family]:
+    """Map the forwarding account (top-level From) to a Family."""
+    user = db.query(User).filter(User.email == current_sender).first() if current_sender else None
+    if user:
+        logger.debug(f"[FORWARD-INGEST] user found with email={user.email}")
+        return db.query(Family).filter_by(owner_user_id=user.id).first()
+
+    logger.debug(f"[FORWARD-INGEST] user not found or no current_sender; checking recipients")
+    # If current sender is empty (rare), still allow matching by a recipient list containing IMAP_USER
+    return family_for_recipient(db, current_sender or imap_user)
+
+
+def process_forwarded_emails_and_update_domains(db: Session, imap_factory=None):
     """
     Connect to addschoolbrief@gmail.com via IMAP and app password (from env vars),
     fetch unprocessed emails, extract the ORIGINAL sender's domain from forwarded emails,
     and update DigestPreference.school_domains.
 
     Notes:
-    - Uses extract_senders(raw_email_str) to get (current_from, original_from).
-    - Falls back to parsing top-level From only if an original forwarded sender isn't found.
+    - Incremental: a UIDVALIDITY/UID cursor (ImapCursor) records the highest UID handled,
+      so each run only asks the server for newer UNSEEN messages.
+    - Batched: BODYSTRUCTURE, headers and the first text part are fetched with BODY.PEEK
+      for a whole UID range in one round trip. An attached message/rfc822's envelope
+      gives the original sender directly; the full message is downloaded only when
+      neither it nor the first part yields one.
+    - The cursor only moves over UIDs that were handled, so a message whose headers
+      didn't come back is retried on the next run.
+    - imap_factory(host) -> IMAP4-like object; defaults to imaplib.IMAP4_SSL (tests pass a stand-in).
     """
     IMAP_HOST = os.getenv("FORWARD_IMAP_HOST", "imap.gmail.com")
     IMAP_USER = os.getenv("FORWARD_IMAP_USER", "addschoolbrief@gmail.com")
     IMAP_PASS = os.getenv("FORWARD_IMAP_PASS")
     IS_PROD = os.getenv("APP_ENV", os.getenv("ENV", "")).lower() in ("prod", "production")
 
-    def mark_seen(msg_num: bytes):
-        if IS_PROD:
-            try:
-                mail.store(msg_num, '+FLAGS', '\\Seen')
-            except Exception as e:
-                logger.exception(f"[FORWARD-INGEST] Failed to mark seen: {e}")
-        else:
-            logger.debug("[FORWARD-INGEST] Non-prod run; leaving message UNSEEN")
-
     if not IMAP_PASS:
         logger.warning("IMAP_PASS is NULL")
         return 0
 
-    mail = imaplib.IMAP4_SSL(IMAP_HOST)
+    mail = (imap_factory or imaplib.IMAP4_SSL)(IMAP_HOST)
     mail.login(IMAP_USER, IMAP_PASS)
     try:
-        mail.select("inbox")
-        # Search for all unseen emails
-        typ, data = mail.search(None, 'UNSEEN')
-        logger.debug(f"[FORWARD-INGEST] IMAP search type={typ} data={data}")
+        typ, _ = mail.select("inbox")
         if typ != 'OK':
             return 0
+        _, vals = mail.response("UIDVALIDITY")
+        try:
+            uidvalidity = int((vals or [b"0"])[0])
+        except (TypeError, ValueError):
+            uidvalidity = 0
 
-        msg_nums = data[0].split() if data and data[0] else []
-        new_domains = 0
-
-        for num in msg_nums:
-            typ, msg_data = mail.fetch(num, '(RFC822)')
-            logger.debug(f"[FORWARD-INGEST] IMAP fetch type={typ} msg_data_type={type(msg_data)}")
-            if typ != 'OK' or not msg_data or not msg_data[0]:
-                continue
-
-            raw_bytes = msg_data[0][1]
-            eml = email_mod.message_from_bytes(raw_bytes)
-            raw_str = None
-            try:
-                raw_str = raw_bytes.decode('utf-8', errors='replace')
-            except Exception:
-                # Extremely rare; leave as None to skip extract_senders raw path fallback
-                pass
-
-            # --- Use the helper to extract both senders ---
-            current_from, original_from = extract_senders(raw_str or eml.as_string())
-
-            # Normalize current sender (used to find the Family)
-            current_sender = (current_from or _extract_email_from_header(eml.get("From")) or "").strip().lower()
-            logger.debug(f"[FORWARD-INGEST] current_sender={current_sender} original_from={original_from}")
-
-            # Try to match sender to a user or to_addresses
-            fam = None
-            if current_sender:
-                user = db.query(User).filter(User.email == current_sender).first()
-            else:
-                user = None
-
-            if user:
-                logger.debug(f"[FORWARD-INGEST] user found with email={user.email}")
-                fam = db.query(Family).filter_by(owner_user_id=user.id).first()
-            else:
-                logger.debug(f"[FORWARD-INGEST] user not found or no current_sender; scanning to_addresses")
-                prefs = db.query(DigestPreference).all()
-                for pref in prefs:
-                    if pref.to_addresses:
-                        to_list = [e.strip().lower() for e in pref.to_addresses.split(',') if e.strip()]
-                        if current_sender and current_sender in to_list:
-                            fam = db.query(Family).filter_by(id=pref.family_id).first()
-                            break
-                        # If current sender is empty (rare), still allow matching by the list containing IMAP_USER
-                        if not current_sender and IMAP_USER.lower() in to_list:
-                            fam = db.query(Family).filter_by(id=pref.family_id).first()
-                            break
-
-            if not fam:
-                logger.debug("[FORWARD-INGEST] No family matched; skipping message")
-                # Still mark as seen to avoid infinite reprocessing
-                mark_seen(num)
-                continue
-
-            # --- Derive domain from the ORIGINAL forwarded sender ---
-            orig_email = (original_from or "").strip().lower()
-            if not orig_email:
-                logger.debug("[FORWARD-INGEST] No original forwarded sender found; skipping domain update")
-                mail.store(num, '+FLAGS', '\\Seen')
-                continue
-
-            if '@' not in orig_email:
-                logger.debug(f"[FORWARD-INGEST] original_from lacks '@': {orig_email!r}; skipping")
-                mark_seen(num)
-                continue
-
-            orig_domain = orig_email.split('@', 1)[-1]
-            if not orig_domain:
-                logger.debug("[FORWARD-INGEST] Empty original domain; skipping")
-                mark_seen(num)
-                continue
-
-            # Store in DigestPreference.school_domains (CSV)
-            pref = db.query(DigestPreference).filter_by(family_id=fam.id).first()
-            if not pref:
-                logger.debug(f"[FORWARD-INGEST] No DigestPreference for family_id={fam.id}")
-                mark_seen(num)
-                continue
+        cursor = _load_imap_cursor(db, f"{IMAP_USER.lower()}@{IMAP_HOST}/INBOX", uidvalidity)
+        last_uid = int(cursor.last_uid or 0)
+        release(db)
 
-            domains = []
-            if pref.school_domains:
-                domains = [d.strip().lower() for d in pref.school_domains.split(',') if d.strip()]
+        typ, data = mail.uid('SEARCH', None, f'UID {last_uid + 1}:*', 'UNSEEN')
+        logger.debug(f"[FORWARD-INGEST] IMAP uid search type={typ} last_uid={last_uid} data={data}")
+        if typ != 'OK':
+            return 0
 
-            if orig_domain not in domains:
-                domains.append(orig_domain)
-                pref.school_domains = ','.join(sorted(set(domains)))
-                db.add(pref)
+        # "n:*" always matches the newest message even if its UID < n; drop those.
+        uids = sorted(int(u) for u in (data[0].split() if data and data[0] else []) if int(u) > last_uid)
+        new_domains = 0
+        to_mark_seen: List[int] = []
+        cursor_blocked = False
+
+        for i in range(0, len(uids), FORWARD_FETCH_BATCH):
+            batch = uids[i:i + FORWARD_FETCH_BATCH]
+            typ, fetched = mail.uid(
+                'FETCH', _uid_set(batch),
+                f'(UID BODYSTRUCTURE BODY.PEEK[HEADER] BODY.PEEK[1]<0.{FORWARD_PEEK_BYTES}>)',
+            )
+            if typ != 'OK':
+                logger.debug(f"[FORWARD-INGEST] IMAP fetch failed type={typ} uids={batch}")
+                break
+            by_uid = _parse_uid_fetch(fetched)
+
+            for uid in batch:
+                sections = by_uid.get(uid) or {}
+                header_bytes = sections.get("HEADER")
+                if not header_bytes:
+                    continue
+                hdr = email_mod.message_from_bytes(header_bytes)
+
+                current_sender = (_extract_email_from_header(hdr.get("From")) or "").strip().lower()
+                fam = _match_forwarding_family(db, current_sender, IMAP_USER)
+                if not fam:
+                    logger.debug("[FORWARD-INGEST] No family matched; skipping message")
+                    # Still mark as seen to avoid infinite reprocessing
+                    to_mark_seen.append(uid)
+                    continue
+
+                original_from = _original_from_peek(sections.get("BODYSTRUCTURE"), sections.get("1"))
+                if not original_from:
+                    # Proper forwards carry the original as message/rfc822; need the whole thing.
+                    release(db)
+                    typ, full = mail.uid('FETCH', str(uid), '(BODY.PEEK[])')
+                    raw_bytes = (_parse_uid_fetch(full).get(uid) or {}).get("") if typ == 'OK' else None
+                    if raw_bytes:
+                        _, original_from = extract_senders(raw_bytes.decode('utf-8', errors='replace'))
+                logger.debug("[FORWARD-INGEST] uid=%s current_sender=%s original_from=%s", uid, current_sender, original_from)
+
+                # --- Derive domain from the ORIGINAL forwarded sender ---
+                orig_email = (original_from or "").strip().lower()
+                if not orig_email or '@' not in orig_email:
+                    logger.debug(f"[FORWARD-INGEST] No usable original forwarded sender ({orig_email!r}); skipping domain update")
+                    to_mark_seen.append(uid)
+                    continue
+
+                orig_domain = orig_email.split('@', 1)[-1]
+                if not orig_domain:
+                    logger.debug("[FORWARD-INGEST] Empty original domain; skipping")
+                    to_mark_seen.append(uid)
+                    continue
+
+                # Store in DigestPreference.school_domains (CSV)
+                pref = db.query(DigestPreference).filter_by(family_id=fam.id).first()
+                if not pref:
+                    logger.debug(f"[FORWARD-INGEST] No DigestPreference for family_id={fam.id}")
+                    to_mark_seen.append(uid)
+                    continue
+
+                domains = []
+                if pref.school_domains:
+                    domains = [d.strip().lower() for d in pref.school_domains.split(',') if d.strip()]
+
+                if orig_domain not in domains:
+                    domains.append(orig_domain)
+                    pref.school_domains = ','.join(sorted(set(domains)))
+                    db.add(pref)
+                    new_domains += 1
+                    logger.info(f"[FORWARD-INGEST] Added domain '{orig_domain}' for family_id={fam.id}")
+
+                # Mark as processed in your DB (one marker per IMAP message)
+                marker = stable_hash(f"imap:{uidvalidity}:{uid}", IMAP_USER)
+                if not db.query(ProcessedEmail).filter_by(family_id=fam.id, content_hash=marker).first():
+                    db.add(ProcessedEmail(
+                        family_id=fam.id,
+                        gmail_msg_id=f"imap:{uidvalidity}:{uid}",
+                        content_hash=marker,
+                        subject=(hdr.get('Subject', '') or '')[:1000],
+                        processed_at=datetime.now(timezone.utc),
+                    ))
                 db.commit()
-                new_domains += 1
-                logger.info(f"[FORWARD-INGEST] Added domain '{orig_domain}' for family_id={fam.id}")
-
-            # Mark as processed in your DB
-            db.add(ProcessedEmail(
-                family_id=fam.id,
-                gmail_msg_id=str(num),  # NOTE: this is a sequence number, not a stable Gmail ID
-                content_hash="domain_add",
-                subject=eml.get('Subject', '')[:1000],
-                processed_at=datetime.now(timezone.utc),
-            ))
-            db.commit()
-
-            # Mark email as seen
-            mark_seen(num)
+                to_mark_seen.append(uid)
+
+            # Advance the cursor over the handled UIDs up to the first one that wasn't
+            # (e.g. empty header fetch); that one and everything after it are retried.
+            handled = set(to_mark_seen)
+            for uid in batch:
+                if cursor_blocked or uid not in handled:
+                    cursor_blocked = True
+                    break
+                cursor.last_uid = uid
+            cursor.updated_at = datetime.utcnow()
+            db.add(cursor); release(db)
+
+        if to_mark_seen:
+            if IS_PROD:
+                try:
+                    mail.uid('STORE', _uid_set(to_mark_seen), '+FLAGS', '(\\Seen)')
+                except Exception as e:
+                    logger.exception(f"[FORWARD-INGEST] Failed to mark seen: {e}")
+            else:
+                logger.debug("[FORWARD-INGEST] Non-prod run; leaving messages UNSEEN")
 
         return new_domains
     finally:
@@ -0,0 +1,166 @@
+# app/jobs.py
+"""
+Background execution of the digest pipeline for "Run now".
+
+The POST handler only inserts a PipelineJob row and hands its id to a small
+in-process thread pool; the pipeline runs on its own sessions and reports each stage
+(plus the metrics gathered so far) back to the row, which the dashboard polls via
+GET /app/run-now/<id>. One active job per family, enforced by the partial unique
+index uix_pipeline_jobs_active: a second click (or a concurrent request) returns the
+running job instead of starting another.
+
+Jobs live in this process. While a job is queued or running, a heartbeat thread
+stamps its heartbeat_at every RUN_NOW_HEARTBEAT_SECONDS, however long a stage
+takes; a job with no heartbeat or progress for RUN_NOW_STALE_SECONDS (e.g. the
+instance restarted) is reported as failed, and is closed when the family starts
+a new one.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .db import session_scope
+from .logger import logger
+from .models import PipelineJob
+
+RUN_NOW_WORKERS = int(os.getenv("RUN_NOW_WORKERS", "2"))
+RUN_NOW_HEARTBEAT_SECONDS = int(os.getenv("RUN_NOW_HEARTBEAT_SECONDS", "60"))
+RUN_NOW_STALE_SECONDS = int(os.getenv("RUN_NOW_STALE_SECONDS", "300"))
+
+ACTIVE = ("queued", "running")  # keep in sync with uix_pipeline_jobs_active
+
+_executor: Optional[ThreadPoolExecutor] = None
+_live: Set[int] = set()         # job ids queued or running in this process
+_live_lock = threading.Lock()
+
+
+def _beat_once():
+    with _live_lock:
+        ids = list(_live)
+    if not ids:
+        return
+    try:
+        with session_scope() as db:
+            db.query(PipelineJob).filter(PipelineJob.id.in_(ids)) \
+                .update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+    except Exception as e:
+        logger.warning(f"[RUN-NOW] heartbeat failed for jobs {ids}: {e}")
+
+
+def _heartbeat():
+    while True:
+        time.sleep(RUN_NOW_HEARTBEAT_SECONDS)
+        _beat_once()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=RUN_NOW_WORKERS, thread_name_prefix="run-now")
+        threading.Thread(target=_heartbeat, name="run-now-heartbeat", daemon=True).start()
+    return _executor
+
+
+def _is_stale(job: PipelineJob, now: Optional[datetime] = None) -> bool:
+    now = now or datetime.utcnow()
+    last_seen = max(job.updated_at, job.heartbeat_at or job.updated_at)
+    return job.status in ACTIVE and last_seen < now - timedelta(seconds=RUN_NOW_STALE_SECONDS)
+
+
+def active_job(db: Session, family_id: int) -> Optional[PipelineJob]:
+    job = (
+        db.query(PipelineJob)
+        .filter(PipelineJob.family_id == family_id, PipelineJob.status.in_(ACTIVE))
+        .order_by(PipelineJob.created_at.desc())
+        .first()
+    )
+    return None if job is None or _is_stale(job) else job
+
+
+def _update(job_id: int, **fields):
+    """Write progress on a short session of its own, independent of the pipeline's."""
+    with session_scope() as db:
+        job = db.get(PipelineJob, job_id)
+        if job is None:
+            return
+        if "metrics" in fields:
+            fields["metrics_json"] = json.dumps(fields.pop("metrics"))
+        for k, v in fields.items():
+            setattr(job, k, v)
+        job.updated_at = datetime.utcnow()
+
+
+def run_job(job_id: int):
+    """Worker body: run the whole pipeline for the job's family, then deliver its digest."""
+    from .digest_runner import run_digest_once  # local import: digest_runner pulls in the LLM client
+    from .outbox import drain_outbox
+
+    _update(job_id, status="running", started_at=datetime.utcnow(), stage="starting")
+    try:
+        with session_scope() as db:
+            family_id = db.get(PipelineJob, job_id).family_id
+
+        def progress(stage: str, metrics: Dict[str, int]):
+            _update(job_id, stage=stage, metrics=metrics)
+
+        sent, msg, metrics = run_digest_once(family_id, days_back=7, progress=progress)
+        if sent:
+            progress("send", metrics)
+            delivery = drain_outbox(family_id=family_id)
+            msg = "sent" if delivery["sent"] else "queued (send will be retried)"
+        _update(job_id, status="done" if sent else "failed", stage="done", metrics=metrics,
+                message=msg, finished_at=datetime.utcnow())
+    except Exception as e:
+        logger.exception(f"[RUN-NOW] job {job_id} failed: {e}")
+        _update(job_id, status="failed", stage="done", message=f"{type(e).__name__}: {e}",
+                finished_at=datetime.utcnow())
+    finally:
+        with _live_lock:
+            _live.discard(job_id)
+
+
+def start_run_now(db: Session, family_id: int) -> PipelineJob:
+    """Return the family's active job, or create one and submit it to the worker pool."""
+    now = datetime.utcnow()
+    for job in db.query(PipelineJob).filter(PipelineJob.family_id == family_id, PipelineJob.status.in_(ACTIVE)):
+        if not _is_stale(job, now):
+            return job
+        # free the family's active slot held by a job whose worker is gone
+        job.status, job.stage, job.message, job.finished_at = "failed", "done", "Run was interrupted", now
+    job = PipelineJob(family_id=family_id, status="queued", stage="queued", heartbeat_at=now)
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # a concurrent request inserted the family's active job first
+        db.rollback()
+        existing = active_job(db, family_id)
+        if existing is None:
+            raise
+        return existing
+    db.refresh(job)
+    with _live_lock:
+        _live.add(job.id)
+    _pool().submit(run_job, job.id)
+    return job
+
+
+def job_status(job: PipelineJob) -> Dict[str, Any]:
+    status = "failed" if _is_stale(job) else job.status
+    return {
+        "id": job.id,
+        "status": status,
+        "stage": job.stage,
+        "metrics": json.loads(job.metrics_json) if job.metrics_json else {},
+        "message": "Run was interrupted" if status != job.status else job.message,
+        "done": status not in ACTIVE,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -2,8 +2,10 @@
 import json
 from typing import List, Dict
 from openai import OpenAI
-from .logger import logger
+from .logger import logger, sampled
 from .errors import build_error_notice
+from .tracing import current_span, traced
+from . import cassette, llm_usage
 from datetime import datetime
 from zoneinfo import ZoneInfo  # Python 3.9+
 import os, httpx
@@ -13,8 +15,11 @@ from functools import lru_cache
 
 def get_openai():
     api_key = os.getenv("OPENAI_API_KEY")
+    replaying = cassette.replaying()
     if not api_key:
-        raise RuntimeError("OPENAI_API_KEY not set")
+        if not replaying:
+            raise RuntimeError("OPENAI_API_KEY not set")
+        api_key = "replay"  # never sent: every completion is answered from the cassette
 
     # Normalize base URL
     base_url = os.getenv("OPENAI_BASE_URL")
@@ -33,6 +38,9 @@ def get_openai():
 
     logger.debug(f"[LLM] Using OpenAI base_url={base_url}")
 
+    if replaying:
+        return OpenAI(api_key=api_key, base_url=base_url)
+
     # Optional: quick connectivity sanity check (1s timeout)
     try:
         with httpx.Client(timeout=1.0) as hx:
@@ -108,7 +116,6 @@ Body:
 """
 
 def _coerce_points(obj) -> List[Dict]:
-    logger.debug("")
     if not isinstance(obj, dict):
         return []
     pts = obj.get("points", [])
@@ -131,14 +138,17 @@ def _coerce_points(obj) -> List[Dict]:
             })
     return out
 
+@traced("summarize_email_to_points")
 def summarize_email_to_points(subject: str, body_text: str, domain: str, local_tz: str = "America/Los_Angeles") -> List[Dict]:
     # run_date = datetime.now(ZoneInfo("America/Los_Angeles")).date().isoformat()
     run_date = datetime.now().date().isoformat()
 
     prompt = _USER_TEMPLATE.format(subject=subject or "", body=body_text or "", local_tz=local_tz, run_date=run_date or "", domain=domain)
+    current_span().set(model="gpt-4.1-mini", prompt_chars=len(prompt))
     try:
         logger.debug("calling OpenAI...")
-        resp = client.chat.completions.create(
+        resp = llm_usage.chat(
+            client, "summarize",
             model="gpt-4.1-mini",
             temperature=0.2,
             messages=[
@@ -157,7 +167,8 @@ def summarize_email_to_points(subject: str, body_text: str, domain: str, local_t
 
     text = resp.choices[0].message.content or ""
     raw = text.strip()
-    logger.debug("raw=%s",raw)
+    if sampled("llm.raw"):
+        logger.debug("raw=%s", raw)
     if raw.startswith("```"):
         parts = raw.split("```", 2)
         raw = parts[1] if len(parts) > 1 else raw
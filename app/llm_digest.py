@@ -6,6 +6,7 @@ from datetime import date
 from .logger import logger
 
 from .llm import get_openai
+from . import llm_usage
 
 _client = get_openai()
 
@@ -53,7 +54,8 @@ def format_digest_from_oneliners(
         ),
     }
     from .prompt import WEEKLY_DIGEST_PROMPT, WEEKLY_DIGEST_PROMPT3
-    resp = _client.chat.completions.create(
+    resp = llm_usage.chat(
+        _client, "compile",
         # model="gpt-5-mini",
         model="gpt-4.1-mini",
         temperature=0.2,
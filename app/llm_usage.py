@@ -0,0 +1,196 @@
+# app/llm_usage.py
+"""
+OpenAI accounting and per-family token budgets.
+
+Every chat completion goes through `chat(client, call_site, **create_kwargs)`, which
+times the request and records model, prompt/completion/cached tokens, latency and
+outcome. Each call is stored as a row in llm_calls and added to that day's
+llm_usage_daily total for (family, day, call site). The family comes from
+`family_scope()`, which run_digest_once sets for the whole pipeline, or from an
+explicit family_id.
+
+Budgets: DigestPreference.llm_daily_token_budget (None -> LLM_DAILY_TOKEN_BUDGET,
+0 = unlimited) caps a family's tokens per UTC day. When a family is over its budget,
+call sites check `over_budget()` and degrade instead of failing:
+- summarize falls back to the rule-based extractor (app/extractors.py);
+- compile renders a plain list (app/rule_based.py).
+
+Inside `family_scope()` the budget and the day's usage are read once; each call's
+tokens are then subtracted in memory, so checking per email costs nothing.
+`recheck_budget()` (called by the digest runner at every stage boundary) drops the
+cached numbers so the next check sees other processes' usage and budget edits.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import cassette
+from .db import session_scope
+from .logger import logger
+from .models import DigestPreference, LlmCall, LlmUsageDaily
+from .tracing import current_span
+from .utils import upsert_insert
+
+LLM_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_DAILY_TOKEN_BUDGET", "0"))
+
+_TOTALS = ("calls", "errors", "prompt_tokens", "completion_tokens", "cached_tokens", "latency_ms")
+
+_family: ContextVar[Optional[int]] = ContextVar("llm_family", default=None)
+
+
+class _RunBudget:
+    __slots__ = ("family_id", "budget", "used", "logged")
+
+    def __init__(self, family_id: int):
+        self.family_id = family_id
+        self.budget: Optional[int] = None   # None = not loaded since the last recheck
+        self.used = 0
+        self.logged = False
+
+
+_run_budget: ContextVar[Optional[_RunBudget]] = ContextVar("llm_run_budget", default=None)
+
+
+@contextmanager
+def family_scope(family_id: int) -> Iterator[None]:
+    token = _family.set(family_id)
+    budget_token = _run_budget.set(_RunBudget(family_id))
+    try:
+        yield
+    finally:
+        _run_budget.reset(budget_token)
+        _family.reset(token)
+
+
+def recheck_budget():
+    """Reload the scoped family's budget and usage from the database on the next check."""
+    rb = _run_budget.get()
+    if rb is not None:
+        rb.budget = None
+
+
+def _usage_numbers(resp: Any):
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    return int(usage.prompt_tokens or 0), int(usage.completion_tokens or 0), int(cached or 0)
+
+
+def _add_daily(db: Session, row: dict):
+    stmt = upsert_insert(db.get_bind().dialect.name, LlmUsageDaily)
+    if stmt is not None:
+        stmt = stmt.values(row)
+        if row["family_id"] is None:
+            # matches the partial unique index uix_llm_usage_daily_no_family
+            target = dict(index_elements=[LlmUsageDaily.day, LlmUsageDaily.call_site],
+                          index_where=LlmUsageDaily.family_id.is_(None))
+        else:
+            target = dict(index_elements=[LlmUsageDaily.family_id, LlmUsageDaily.day, LlmUsageDaily.call_site])
+        db.execute(stmt.on_conflict_do_update(
+            set_={k: getattr(LlmUsageDaily, k) + getattr(stmt.excluded, k) for k in _TOTALS}, **target,
+        ))
+        return
+    existing = db.query(LlmUsageDaily).filter_by(
+        family_id=row["family_id"], day=row["day"], call_site=row["call_site"]).first()
+    if existing is None:
+        db.add(LlmUsageDaily(**row))
+    else:
+        for k in _TOTALS:
+            setattr(existing, k, getattr(existing, k) + row[k])
+
+
+def record(family_id: Optional[int], call_site: str, model: Optional[str], prompt_tokens: int,
+           completion_tokens: int, cached_tokens: int, latency_ms: int, error: Optional[str] = None):
+    """Store one call and fold it into the daily rollup. Never raises: accounting must not break a run."""
+    now = datetime.utcnow()
+    try:
+        with session_scope() as db:
+            db.add(LlmCall(
+                family_id=family_id, call_site=call_site, model=model,
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens,
+                latency_ms=latency_ms, outcome="error" if error else "ok",
+                error=error[:1000] if error else None, created_at=now,
+            ))
+            _add_daily(db, {
+                "family_id": family_id, "day": now.date(), "call_site": call_site,
+                "calls": 1, "errors": 1 if error else 0,
+                "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "cached_tokens": cached_tokens, "latency_ms": latency_ms,
+            })
+    except Exception as e:
+        logger.warning(f"[LLM-USAGE] could not record {call_site} call for family_id={family_id}: {e}")
+
+
+def chat(client, call_site: str, *, family_id: Optional[int] = None, **create_kwargs):
+    """client.chat.completions.create(**create_kwargs), accounted under call_site."""
+    family_id = family_id if family_id is not None else _family.get()
+    model = create_kwargs.get("model")
+    cas = cassette.current()
+    t0 = time.perf_counter()
+    try:
+        if cas is None:
+            resp = client.chat.completions.create(**create_kwargs)
+        else:
+            resp = cas.call("openai", cassette.openai_key(call_site, create_kwargs),
+                            lambda: client.chat.completions.create(**create_kwargs),
+                            encode=lambda r: r.model_dump(), decode=cassette.decode_completion)
+    except Exception as e:
+        record(family_id, call_site, model, 0, 0, 0, int((time.perf_counter() - t0) * 1000), error=str(e))
+        raise
+    latency_ms = int((time.perf_counter() - t0) * 1000)
+    prompt, completion, cached = _usage_numbers(resp)
+    current_span().set(prompt_tokens=prompt, completion_tokens=completion, cached_tokens=cached)
+    record(family_id, call_site, getattr(resp, "model", None) or model, prompt, completion, cached, latency_ms)
+    rb = _run_budget.get()
+    if rb is not None and rb.family_id == family_id:
+        rb.used += prompt + completion
+    return resp
+
+
+def tokens_used_today(db: Session, family_id: int, now: Optional[datetime] = None) -> int:
+    day = (now or datetime.utcnow()).date()
+    return db.execute(
+        select(func.coalesce(func.sum(LlmUsageDaily.prompt_tokens + LlmUsageDaily.completion_tokens), 0))
+        .where(LlmUsageDaily.family_id == family_id, LlmUsageDaily.day == day)
+    ).scalar_one()
+
+
+def daily_budget(db: Session, family_id: int) -> int:
+    budget = db.execute(
+        select(DigestPreference.llm_daily_token_budget).where(DigestPreference.family_id == family_id)
+    ).scalar()
+    return LLM_DAILY_TOKEN_BUDGET if budget is None else int(budget)
+
+
+def over_budget(family_id: Optional[int] = None, now: Optional[datetime] = None) -> bool:
+    family_id = family_id if family_id is not None else _family.get()
+    if family_id is None:
+        return False
+    rb = _run_budget.get()
+    if rb is None or rb.family_id != family_id or now is not None:
+        with session_scope() as db:
+            budget = daily_budget(db, family_id)
+            used = tokens_used_today(db, family_id, now) if budget > 0 else 0
+        if budget > 0 and used >= budget:
+            logger.info(f"[LLM-USAGE] family_id={family_id} over daily token budget ({used}/{budget}); degrading")
+            return True
+        return False
+    if rb.budget is None:
+        with session_scope() as db:
+            rb.budget = daily_budget(db, family_id)
+            rb.used = tokens_used_today(db, family_id) if rb.budget > 0 else 0
+    if rb.budget > 0 and rb.used >= rb.budget:
+        if not rb.logged:
+            rb.logged = True
+            logger.info(f"[LLM-USAGE] family_id={family_id} over daily token budget "
+                        f"({rb.used}/{rb.budget}); degrading")
+        return True
+    return False
@@ -1,25 +1,123 @@
+"""
+Application logging.
+
+Environment:
+    LOG_LEVEL              (INFO)  level of the "SchoolBrief" logger; DEBUG for the chatty output
+    LOG_LEVELS             ("")    per-logger overrides, e.g. "googleapiclient=WARNING,urllib3=ERROR"
+    LOG_FORMAT             (text)  "text" or "json" (one JSON object per line, with any `extra=` fields)
+    LOG_ASYNC              (1)     records go through a QueueHandler; a QueueListener thread does the
+                                   formatting and the stdout write, so callers never block on I/O
+    LOG_DEBUG_SAMPLE_EVERY (10)    `sampled(site)` lets 1 in N calls through for high-volume debug sites
+
+Hot loops (per email, per point, raw LLM output) guard their debug lines with
+`if sampled("site"): logger.debug(...)`, which is a single level check when DEBUG is off.
+"""
+import atexit
+import itertools
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower()
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") not in ("0", "false", "no")
+LOG_DEBUG_SAMPLE_EVERY = max(1, int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "10")))
+
+# attributes every LogRecord has; anything else came from `extra=` and goes into the JSON line
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        for k, v in record.__dict__.items():
+            if k not in _RECORD_ATTRS and not k.startswith("_"):
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+
+class _Queueing(logging.handlers.QueueHandler):
+    """QueueHandler that keeps `extra=` fields and the traceback separate for the JSON formatter."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()   # drains what is still queued
+        _listener = None
+
 
 def setup_logger(name: str):
+    global _listener
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)  # 👈 must be DEBUG to see .debug()
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(logging.DEBUG)
-    formatter = logging.Formatter(
-        "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(_formatter())
+    if LOG_ASYNC:
+        q: queue.SimpleQueue = queue.SimpleQueue()
+        logger.addHandler(_Queueing(q))
+        _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)
+    else:
+        logger.addHandler(stream)
     logger.propagate = False
+    for part in LOG_LEVELS.split(","):
+        other, _, level = part.partition("=")
+        if other.strip() and level.strip():
+            logging.getLogger(other.strip()).setLevel(level.strip().upper())
     return logger
 
+
 logger = setup_logger("SchoolBrief")
 
-def example_function():
-    logger.debug("This is a debug log")
-    logger.info("This is an info log")
-    logger.warning("This is a warning")
+_counters: Dict[str, "itertools.count[int]"] = {}
+_counters_lock = threading.Lock()
+
 
-if __name__ == "__main__":
-    example_function()
+def sampled(site: str) -> bool:
+    """True for 1 in LOG_DEBUG_SAMPLE_EVERY calls from `site`, and never when DEBUG is off."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    counter = _counters.get(site)
+    if counter is None:
+        with _counters_lock:
+            counter = _counters.setdefault(site, itertools.count())
+    return next(counter) % LOG_DEBUG_SAMPLE_EVERY == 0
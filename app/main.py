@@ -5,7 +5,7 @@ from fastapi import FastAPI, Request, Query, Header, HTTPException
 
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware 
 
 # Only load .env locally (don’t rely on it in Cloud Run)
@@ -17,13 +17,16 @@ if os.getenv("K_SERVICE") is None:  # not on Cloud Run
     except Exception:
         pass
 
-from .db import init_db
+from .db import init_db, pool_stats
+from .timings import render_prometheus
 from .session import add_session_middleware
 from .auth import router as auth_router
 from .views import router as views_router
 from .billing import router as billing_router
 from .scheduler import start_scheduler
 from .scheduler import tick as scheduler_tick
+from .retention import run_retention
+from .outbox import drain_outbox
 from .errors import build_error_notice
 from .logger import logger 
 
@@ -94,7 +97,17 @@ def on_startup():
 
 @app.get("/healthz")
 def healthz():
-    return {"ok": True}
+    return {"ok": True, "db_pool": pool_stats()}
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape: per-stage pipeline histograms plus DB pool gauges."""
+    pool = pool_stats()
+    body = render_prometheus({
+        "schoolbrief_db_pool_in_use": pool["in_use"],
+        "schoolbrief_db_pool_peak": pool["peak"],
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
 
 @app.get("/favicon.ico")
 def favicon():
@@ -112,16 +125,41 @@ def oauth_redirect_debug():
 
 # Cloud Scheduler trigger (set CRON_TOKEN env var; pass ?token= or X-Cron-Token header)
 
+def _require_cron_token(token: str | None, x_cron_token: str | None):
+    expected = os.getenv("CRON_TOKEN")
+    provided = token or x_cron_token
+    if not expected or provided != expected:
+        raise HTTPException(status_code=401, detail="unauthorized")
+
 @app.post("/cron/tick")
 def cron_tick(
     token: str | None = Query(None),
     x_cron_token: str | None = Header(None),
     force: bool = Query(False),   # ← FastAPI/Pydantic parses true/false/1/0/yes/no
 ):
-    expected = os.getenv("CRON_TOKEN")
-    provided = token or x_cron_token
-    if not expected or provided != expected:
-        raise HTTPException(status_code=401, detail="unauthorized")
+    _require_cron_token(token, x_cron_token)
 
     count = scheduler_tick(force=force)
     return {"triggered": count, "force": force}
+
+# Sends queued digests and due retries; schedule every minute or so.
+@app.post("/cron/outbox")
+def cron_outbox(
+    token: str | None = Query(None),
+    x_cron_token: str | None = Header(None),
+):
+    _require_cron_token(token, x_cron_token)
+
+    return drain_outbox()
+
+# Daily is plenty; dry_run=true only reports how many rows each policy would touch.
+@app.post("/cron/retention")
+def cron_retention(
+    token: str | None = Query(None),
+    x_cron_token: str | None = Header(None),
+    dry_run: bool = Query(False),
+):
+    _require_cron_token(token, x_cron_token)
+
+    report = run_retention(dry_run=dry_run)
+    return {"dry_run": dry_run, "rows": report}
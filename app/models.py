@@ -1,8 +1,9 @@
 
 from datetime import datetime
 from typing import Optional
-from sqlalchemy.orm import declarative_base, relationship, Mapped, mapped_column
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, UniqueConstraint
+from sqlalchemy.orm import declarative_base, deferred, relationship, Mapped, mapped_column
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Time, ForeignKey, Text, Boolean, Index, LargeBinary, UniqueConstraint, Float, text
+from .utils import pack_text, unpack_text
 
 Base = declarative_base()
 
@@ -21,7 +22,7 @@ class User(Base):
 class Family(Base):
     __tablename__ = "families"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    owner_user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    owner_user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     display_name: Mapped[Optional[str]] = mapped_column(String(200))
 
     owner = relationship("User", back_populates="families")
@@ -67,11 +68,13 @@ class ProviderAccount(Base):
 
     user = relationship("User", back_populates="providers")
 
+    __table_args__ = (Index("ix_provider_accounts_user_provider", "user_id", "provider"),)
+
 # app/models.py (or wherever DigestPreference lives)
 class DigestPreference(Base):
     __tablename__ = "digest_prefs"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    family_id: Mapped[int] = mapped_column(ForeignKey("families.id"))
+    family_id: Mapped[int] = mapped_column(ForeignKey("families.id"), index=True)
     cadence: Mapped[str] = mapped_column(String(20), default="weekly")  # daily/weekly
     send_time_local: Mapped[str] = mapped_column(String(5), default="07:00")
     timezone: Mapped[str] = mapped_column(String(64), default="America/Los_Angeles")
@@ -82,21 +85,59 @@ class DigestPreference(Base):
 
     # NEW
     detail_level: Mapped[str] = mapped_column(String(20), default="full")  # "full" | "focused"
+    # OpenAI tokens per UTC day; None = LLM_DAILY_TOKEN_BUDGET, 0 = unlimited (see llm_usage.py)
+    llm_daily_token_budget: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # one-shot: profile the next digest run (see profiling.py)
+    profile_next_run: Mapped[bool] = mapped_column(Boolean, default=False)
 
     family = relationship("Family", back_populates="prefs")
 
 
+class FamilyRecipient(Base):
+    """One row per address in DigestPreference.to_addresses (lowercased).
+
+    Mirrors the CSV so sender -> family lookups are an index probe.
+    Maintained by the flush hook in family_index.py.
+    """
+    __tablename__ = "family_recipients"
+    id = Column(Integer, primary_key=True)
+    family_id = Column(Integer, ForeignKey("families.id", ondelete="CASCADE"), nullable=False, index=True)
+    email = Column(String(320), nullable=False, index=True)
+
+    __table_args__ = (UniqueConstraint("family_id", "email", name="uix_family_recipient"),)
+
+
+class FamilyDomain(Base):
+    """One row per domain in DigestPreference.school_domains (lowercased, no '@')."""
+    __tablename__ = "family_domains"
+    id = Column(Integer, primary_key=True)
+    family_id = Column(Integer, ForeignKey("families.id", ondelete="CASCADE"), nullable=False, index=True)
+    domain = Column(String(255), nullable=False, index=True)
+
+    __table_args__ = (UniqueConstraint("family_id", "domain", name="uix_family_domain"),)
+
+
+class DomainPopularity(Base):
+    """How many families list each domain; feeds the settings-page suggestions.
+
+    Adjusted incrementally by family_index.py whenever family_domains changes.
+    """
+    __tablename__ = "domain_popularity"
+    domain = Column(String(255), primary_key=True)
+    family_count = Column(Integer, nullable=False, default=0)
+
+
 # --- Subscription -------------------------------------------
 class Subscription(Base):
     __tablename__ = "subscriptions"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
     # two FKs pointing at families.id:
-    family_id: Mapped[int] = mapped_column(ForeignKey("families.id"))
+    family_id: Mapped[int] = mapped_column(ForeignKey("families.id"), index=True)
     referrer_family_id: Mapped[Optional[int]] = mapped_column(ForeignKey("families.id"))
 
-    stripe_customer_id: Mapped[Optional[str]] = mapped_column(String(120))
-    stripe_subscription_id: Mapped[Optional[str]] = mapped_column(String(120))
+    stripe_customer_id: Mapped[Optional[str]] = mapped_column(String(120), index=True)        # webhook lookups
+    stripe_subscription_id: Mapped[Optional[str]] = mapped_column(String(120), index=True)
     plan: Mapped[Optional[str]] = mapped_column(String(120))
     status: Mapped[Optional[str]] = mapped_column(String(30))  # trialing/active/past_due/canceled
     current_period_end: Mapped[Optional[datetime]] = mapped_column(DateTime)
@@ -138,9 +179,22 @@ class DigestRun(Base):
     items_found: Mapped[int] = mapped_column(Integer, default=0)
     email_sent: Mapped[bool] = mapped_column(Boolean, default=False)
     error: Mapped[Optional[str]] = mapped_column(Text)
+    profile_path: Mapped[Optional[str]] = mapped_column(String(512))  # <path>.pstats / <path>.collapsed
 
     family = relationship("Family", back_populates="runs")
 
+    __table_args__ = (Index("ix_digest_runs_family_started", "family_id", "started_at"),)  # dashboard
+
+
+class DigestRunStage(Base):
+    """Wall time one pipeline stage took in a DigestRun (see app/timings.py for stage names)."""
+    __tablename__ = "digest_run_stages"
+    id = Column(Integer, primary_key=True)
+    digest_run_id = Column(Integer, ForeignKey("digest_runs.id", ondelete="CASCADE"), nullable=False, index=True)
+    stage = Column(String(32), nullable=False)
+    seconds = Column(Float, nullable=False, default=0.0)
+    calls = Column(Integer, nullable=False, default=0)   # e.g. one per Gmail get / LLM summarize
+
 class ProcessedEmail(Base):
     __tablename__ = "processed_emails"
     id = Column(Integer, primary_key=True)
@@ -149,7 +203,11 @@ class ProcessedEmail(Base):
     content_hash = Column(String(64), nullable=False)   # sha256 hex
     subject = Column(Text, nullable=True)
     processed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    __table_args__ = (UniqueConstraint("family_id", "content_hash", name="uix_family_hash"),)
+    __table_args__ = (
+        UniqueConstraint("family_id", "content_hash", name="uix_family_hash"),
+        Index("ix_processed_emails_family_msg", "family_id", "gmail_msg_id"),
+        Index("ix_processed_emails_family_processed", "family_id", "processed_at"),  # /data
+    )
 
 class OneLiner(Base):
     __tablename__ = "one_liners"
@@ -162,6 +220,23 @@ class OneLiner(Base):
     date_string = Column(String(20), nullable=True)     # e.g. "2025-09-04"
     time_string = Column(String(20), nullable=True)     # e.g. "3:15 PM"
     domain      = Column(String(255), nullable=True)    # e.g. "schoology.com"
+    # Typed mirrors of date_string/time_string (see app/event_time.py)
+    event_date  = Column(Date, nullable=True)
+    event_time  = Column(Time, nullable=True)
+    event_at    = Column(DateTime, nullable=True)       # naive UTC; when_ts or date+time in family tz
+
+    __table_args__ = (
+        # Digest compile: family + event_date window, ordered by (event_date, created_at).
+        # On Postgres the payload columns ride along so the scan is index-only.
+        Index(
+            "ix_one_liners_family_event_date", "family_id", "event_date", "created_at",
+            postgresql_include=["one_liner", "date_string", "time_string", "domain"],
+        ),
+        # Preview: dated items by event_at, undated ones (event_at IS NULL) by created_at.
+        Index("ix_one_liners_family_event_at", "family_id", "event_at", "created_at"),
+        # Schoology materialization anti-join and the /data one-liner lookup.
+        Index("ix_one_liners_family_source", "family_id", "source_msg_id"),
+    )
 
 
 class SchoologyItem(Base):
@@ -181,8 +256,185 @@ class SchoologyItem(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     course_title = Column(String(255), nullable=True)
-    raw_json = Column(Text, nullable=True)                     # debugging/trace
+    # debugging/trace only: zlib-compressed JSON, deferred so normal queries never load it.
+    # raw_json is the legacy uncompressed column (migration 0004 moves it into raw_json_z).
+    raw_json = deferred(Column(Text, nullable=True))
+    raw_json_z = deferred(Column(LargeBinary, nullable=True))
 
     __table_args__ = (
         UniqueConstraint("family_id", "schoology_id", name="uix_family_schoology_id"),
     )
+
+    @property
+    def raw_payload(self) -> Optional[str]:
+        """Original API JSON (decompressed on access)."""
+        if self.raw_json_z is not None:
+            return unpack_text(self.raw_json_z)
+        return self.raw_json
+
+    @raw_payload.setter
+    def raw_payload(self, value: Optional[str]):
+        self.raw_json_z = pack_text(value)
+        self.raw_json = None
+
+
+class SchoologySyncState(Base):
+    """Per provider-account sync bookkeeping for one Schoology list endpoint.
+
+    resource is "sections" or "sections/<id>/assignments" / "sections/<id>/events".
+    Stores the HTTP validators from the last 200 response (for conditional GETs),
+    when it was last synced, and for "sections" the cached section list itself.
+    """
+    __tablename__ = "schoology_sync_state"
+    id = Column(Integer, primary_key=True)
+    provider_account_id = Column(Integer, ForeignKey("provider_accounts.id", ondelete="CASCADE"), nullable=False)
+    resource = Column(String(255), nullable=False)
+    etag = Column(String(255), nullable=True)
+    last_modified = Column(String(64), nullable=True)          # HTTP-date as sent by the server
+    last_synced_at = Column(DateTime, nullable=True)
+    payload_json = Column(Text, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("provider_account_id", "resource", name="uix_schoology_sync_resource"),
+    )
+
+
+class ImapCursor(Base):
+    """High-water mark for an IMAP mailbox, keyed by UIDVALIDITY.
+
+    UIDs are only stable while the server's UIDVALIDITY is unchanged; when it
+    changes the cursor is reset and the mailbox is rescanned.
+    """
+    __tablename__ = "imap_cursors"
+    id = Column(Integer, primary_key=True)
+    mailbox = Column(String(400), nullable=False, unique=True)   # "user@host/INBOX"
+    uidvalidity = Column(BigInteger, nullable=False, default=0)
+    last_uid = Column(BigInteger, nullable=False, default=0)    # highest UID handled
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class OneLinerArchive(Base):
+    """Past-dated one-liners moved out of one_liners by the retention job (app/retention.py)."""
+    __tablename__ = "one_liners_archive"
+    id = Column(Integer, primary_key=True)                  # same id as in one_liners
+    family_id = Column(Integer, nullable=False, index=True)
+    source_msg_id = Column(String(128), nullable=False)
+    one_liner = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    date_string = Column(String(20), nullable=True)
+    time_string = Column(String(20), nullable=True)
+    domain = Column(String(255), nullable=True)
+    event_date = Column(Date, nullable=True)
+    event_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class DigestRunRollup(Base):
+    """Per family, per UTC day totals of DigestRun rows pruned by the retention job."""
+    __tablename__ = "digest_run_rollups"
+    id = Column(Integer, primary_key=True)
+    family_id = Column(Integer, ForeignKey("families.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+    runs = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    items_found = Column(Integer, nullable=False, default=0)
+    messages_scanned = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("family_id", "day", name="uix_digest_run_rollup_day"),
+    )
+
+
+class EmailOutbox(Base):
+    """A rendered email waiting to be (or already) sent; drained by app/outbox.py.
+
+    idempotency_key is unique, so re-enqueuing the same digest run is a no-op, and
+    it doubles as the Message-ID so a retried send is recognizable downstream.
+    """
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String(128), nullable=False, unique=True)
+    family_id = Column(Integer, ForeignKey("families.id"), nullable=True)
+    digest_run_id = Column(Integer, ForeignKey("digest_runs.id", ondelete="SET NULL"), nullable=True, index=True)
+    to_addresses = Column(Text, nullable=False)                 # CSV
+    subject = Column(Text, nullable=False)
+    html = Column(Text, nullable=True)
+    text = Column(Text, nullable=True)
+    status = Column(String(20), nullable=False, default="pending")  # pending/sending/sent/dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_email_outbox_status_due", "status", "next_attempt_at"),)
+
+
+class LlmCall(Base):
+    """One OpenAI request: who it was for, where it came from, what it cost (see app/llm_usage.py)."""
+    __tablename__ = "llm_calls"
+    id = Column(Integer, primary_key=True)
+    family_id = Column(Integer, ForeignKey("families.id", ondelete="CASCADE"), nullable=True)
+    call_site = Column(String(40), nullable=False)      # summarize | compile | digest_from_emails
+    model = Column(String(64), nullable=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False, default=0)
+    outcome = Column(String(20), nullable=False)        # ok | error
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (Index("ix_llm_calls_family_created", "family_id", "created_at"),)
+
+
+class LlmUsageDaily(Base):
+    """Per family, per UTC day, per call site totals of llm_calls; budgets are checked against these."""
+    __tablename__ = "llm_usage_daily"
+    id = Column(Integer, primary_key=True)
+    family_id = Column(Integer, ForeignKey("families.id", ondelete="CASCADE"), nullable=True)
+    day = Column(Date, nullable=False)
+    call_site = Column(String(40), nullable=False)
+    calls = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("family_id", "day", "call_site", name="uix_llm_usage_daily"),
+        # NULLs never conflict in the constraint above; calls outside any family roll up here
+        Index("uix_llm_usage_daily_no_family", "day", "call_site", unique=True,
+              sqlite_where=text("family_id IS NULL"), postgresql_where=text("family_id IS NULL")),
+    )
+
+
+class PipelineJob(Base):
+    """A background run of the digest pipeline (Run now), with stage progress for polling."""
+    __tablename__ = "pipeline_jobs"
+    id = Column(Integer, primary_key=True)
+    family_id = Column(Integer, ForeignKey("families.id"), nullable=False)
+    status = Column(String(20), nullable=False, default="queued")   # queued/running/done/failed
+    stage = Column(String(40), nullable=True)                       # see digest_runner.run_digest_once
+    metrics_json = Column(Text, nullable=True)
+    message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    heartbeat_at = Column(DateTime, nullable=True)                   # worker liveness, see app/jobs.py
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_pipeline_jobs_family_created", "family_id", "created_at"),
+        # at most one queued/running job per family
+        Index("uix_pipeline_jobs_active", "family_id", unique=True,
+              sqlite_where=text("status IN ('queued', 'running')"),
+              postgresql_where=text("status IN ('queued', 'running')")),
+    )
+
+
+# Keep the normalized recipient/domain tables in sync with the CSV columns.
+from . import family_index  # noqa: E402,F401
@@ -0,0 +1,170 @@
+# app/outbox.py
+"""
+Durable outbox between digest rendering and SMTP.
+
+compile jobs call `enqueue_email` (in the same transaction that records the run), so a
+rendered digest is persisted before any network I/O. `drain_outbox` claims due rows,
+sends them through `send_email`, and writes the outcome back to the row and its
+DigestRun. Failures are retried with exponential backoff until OUTBOX_MAX_ATTEMPTS,
+after which the row is marked dead and the run records the error.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_, and_, select, update
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal, release
+from .emailer import close_smtp_pool, send_email
+from .logger import logger
+from .models import DigestRun, EmailOutbox
+from .timings import observe, save_stage
+from .tracing import link_run, span
+from .utils import csv_to_list, list_to_csv
+
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE_SECONDS = int(os.getenv("OUTBOX_BACKOFF_BASE", "60"))
+BACKOFF_MAX_SECONDS = int(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))
+CLAIM_TIMEOUT_SECONDS = int(os.getenv("OUTBOX_CLAIM_TIMEOUT", "600"))  # reclaim rows of a crashed sender
+DRAIN_BATCH = int(os.getenv("OUTBOX_DRAIN_BATCH", "50"))
+
+MESSAGE_ID_DOMAIN = os.getenv("OUTBOX_MESSAGE_ID_DOMAIN", "schoolbrief.app")
+
+
+def digest_run_key(run_id: int) -> str:
+    return f"digest-run-{run_id}"
+
+
+def enqueue_email(db: Session, *, idempotency_key: str, subject: str, html: str, text: str,
+                  to_addrs: List[str], family_id: Optional[int] = None,
+                  digest_run_id: Optional[int] = None) -> EmailOutbox:
+    """Add (or return the existing) outbox row for this key. Caller commits."""
+    existing = db.query(EmailOutbox).filter_by(idempotency_key=idempotency_key).first()
+    if existing:
+        return existing
+    entry = EmailOutbox(
+        idempotency_key=idempotency_key,
+        family_id=family_id,
+        digest_run_id=digest_run_id,
+        to_addresses=list_to_csv(to_addrs),
+        subject=subject or "SchoolBrief",
+        html=html,
+        text=text,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(entry)
+    db.flush()
+    return entry
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1)))
+
+
+def _due(now: datetime):
+    stale = now - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)
+    return or_(
+        and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == "sending", EmailOutbox.claimed_at < stale),
+    )
+
+
+def _claim(db: Session, entry_id: int, now: datetime) -> bool:
+    """Flip one due row to 'sending'; False if another worker got there first."""
+    res = db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id == entry_id, _due(now))
+        .values(status="sending", claimed_at=now)
+    )
+    db.commit()
+    return res.rowcount == 1
+
+
+def _record_run(db: Session, entry: EmailOutbox, sent: bool, error: Optional[str]):
+    if not entry.digest_run_id:
+        return
+    run = db.get(DigestRun, entry.digest_run_id)
+    if run is None:
+        return
+    run.email_sent = sent
+    run.error = error
+    if sent:
+        run.ended_at = datetime.utcnow()
+    db.add(run)
+
+
+def deliver(db: Session, entry: EmailOutbox, now: Optional[datetime] = None) -> str:
+    """Send one claimed entry and persist the outcome. Returns the new status."""
+    now = now or datetime.utcnow()
+    entry.attempts = (entry.attempts or 0) + 1
+    release(db)  # the attempt counts even if we die mid-send; no connection held during SMTP
+    t0 = time.perf_counter()
+    try:
+        with span("outbox.deliver", outbox_id=entry.id, attempt=entry.attempts):
+            if entry.digest_run_id:
+                link_run(entry.digest_run_id)
+            send_email(entry.subject, entry.html, entry.text, csv_to_list(entry.to_addresses),
+                       message_id=f"<{entry.idempotency_key}@{MESSAGE_ID_DOMAIN}>")
+        error = None
+    except Exception as e:
+        error = e
+    smtp_seconds = time.perf_counter() - t0
+    observe("smtp", smtp_seconds)
+    if entry.digest_run_id:
+        save_stage(db, entry.digest_run_id, "smtp", smtp_seconds)
+
+    if error is not None:
+        e = error
+        entry.last_error = str(e)[:2000]
+        if entry.attempts >= MAX_ATTEMPTS:
+            entry.status = "dead"
+            _record_run(db, entry, False, f"Send failed after {entry.attempts} attempts: {e}")
+        else:
+            entry.status = "pending"
+            entry.next_attempt_at = now + _backoff(entry.attempts)
+            _record_run(db, entry, False, f"Send attempt {entry.attempts} failed, will retry: {e}")
+        logger.warning(f"[OUTBOX] id={entry.id} attempt={entry.attempts} status={entry.status} error={e}")
+    else:
+        entry.status = "sent"
+        entry.sent_at = datetime.utcnow()
+        entry.last_error = None
+        _record_run(db, entry, True, None)
+    entry.claimed_at = None
+    db.add(entry)
+    db.commit()
+    return entry.status
+
+
+def drain_outbox(db: Optional[Session] = None, limit: int = DRAIN_BATCH,
+                 now: Optional[datetime] = None, family_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    Send up to `limit` due entries (optionally only one family's), then QUIT the idle
+    pooled SMTP sessions so nothing sits open between drains.
+    Returns {"sent", "retrying", "dead", "skipped"}; skipped = claimed by another worker.
+    """
+    own = db is None
+    db = db or SessionLocal()
+    now = now or datetime.utcnow()
+    counts = {"sent": 0, "retrying": 0, "dead": 0, "skipped": 0}
+    try:
+        stmt = select(EmailOutbox.id).where(_due(now)).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(limit)
+        if family_id is not None:
+            stmt = stmt.where(EmailOutbox.family_id == family_id)
+        for entry_id in list(db.execute(stmt).scalars()):
+            if not _claim(db, entry_id, now):
+                counts["skipped"] += 1
+                continue
+            status = deliver(db, db.get(EmailOutbox, entry_id), now)
+            counts["retrying" if status == "pending" else status] += 1
+        if any(counts.values()):
+            logger.info(f"[OUTBOX] drained {counts}")
+        return counts
+    finally:
+        if any(counts.values()):
+            close_smtp_pool()
+        if own:
+            db.close()
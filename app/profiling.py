@@ -0,0 +1,288 @@
+# app/profiling.py
+"""
+On-demand profiling of a single family's digest run.
+
+A run is profiled when either
+    PROFILE_FAMILIES    ("")        CSV of family ids, or "*" for every family
+    digest_prefs.profile_next_run   one-shot admin flag, cleared once the profiled run ends
+                                    (`python -m app.profiling <family_id> [--now]` sets it)
+
+    PROFILE_MODE             (cprofile)  CSV of "cprofile" (cProfile + stack sampler), "sample" (sampler
+                                         only), "memory" (tracemalloc per stage), e.g. "sample,memory"
+    PROFILE_DIR              (./profiles)
+    PROFILE_SAMPLE_INTERVAL  (0.005)     seconds between stack samples
+    PROFILE_MEMORY_FRAMES    (1)         traceback depth tracemalloc keeps per allocation (deeper = slower)
+
+Artifacts are written to PROFILE_DIR/run_<digest_run_id>.* (family_<id>_<utc> when
+compile never created a DigestRun), and the base path is stored in
+DigestRun.profile_path:
+    <base>.pstats      cProfile stats (python -m pstats, snakeviz)
+    <base>.collapsed   "frame;frame;frame count" lines for flamegraph.pl / speedscope
+    <base>.memory.txt  per-stage peak/retained allocations and the top allocation sites
+                       at each stage's highest peak
+
+cProfile and the sampler cover the thread that runs `run_digest_once`. Schoology's
+fetch pool threads show up only as the time the run thread spends waiting on them.
+tracemalloc is process-wide: other runs in the same process are counted too, so
+profile memory with one run at a time (the scheduler tick, or `--now`).
+"""
+import cProfile
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .db import session_scope
+from .logger import logger
+from .models import DigestPreference, DigestRun
+from .timings import RunTimings
+
+PROFILE_FAMILIES = os.getenv("PROFILE_FAMILIES", "")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile").strip().lower()
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_MEMORY_FRAMES = int(os.getenv("PROFILE_MEMORY_FRAMES", "1"))
+
+
+def _env_requested(family_id: int) -> bool:
+    ids = {p.strip() for p in PROFILE_FAMILIES.split(",") if p.strip()}
+    return "*" in ids or str(family_id) in ids
+
+
+def requested(family_id: int) -> bool:
+    if _env_requested(family_id):
+        return True
+    with session_scope() as db:
+        return bool(db.query(DigestPreference.profile_next_run).filter_by(family_id=family_id).scalar())
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval: Optional[float] = None):
+        self.thread_id, self.interval = thread_id, interval or PROFILE_SAMPLE_INTERVAL
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.counts.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+class _Frame:
+    __slots__ = ("name", "start", "peak")
+
+    def __init__(self, name: str, start: int):
+        self.name, self.start, self.peak = name, start, start
+
+
+class MemoryTracker:
+    """
+    tracemalloc over a run, broken down by timings stage (RunTimings.memory; stage() calls
+    enter/exit). For each stage: calls, the highest traced peak above its entry, and the
+    bytes still allocated at exit (summed over calls, so a stage that hoards shows up).
+    Whenever a stage pushes the run peak up by 10% a snapshot is taken; the last one per
+    stage is reported as allocation sites grown since the start of the run.
+    """
+    SNAPSHOT_GROWTH = 1.1
+    TOP = 15
+
+    def __init__(self):
+        self.stats: Dict[str, List[int]] = {}   # stage -> [calls, max peak above entry, net retained]
+        self.snapshots: Dict[str, Tuple[int, tracemalloc.Snapshot]] = {}
+        self._stack: List[_Frame] = []
+        self._started = False
+        self.baseline = self.peak = self.end = 0
+        self._last_snapshot_peak = 0
+        self._first: Optional[tracemalloc.Snapshot] = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_MEMORY_FRAMES)
+            self._started = True
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self._first = tracemalloc.take_snapshot()
+        self._last_snapshot_peak = self.baseline
+
+    def _fold_peak(self) -> int:
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peak = max(self.peak, peak)
+        for f in self._stack:
+            f.peak = max(f.peak, peak)
+        return peak
+
+    def enter(self, name: str):
+        self._fold_peak()
+        tracemalloc.reset_peak()
+        self._stack.append(_Frame(name, tracemalloc.get_traced_memory()[0]))
+
+    def exit(self, name: str):
+        self._fold_peak()
+        if not self._stack or self._stack[-1].name != name:
+            return
+        f = self._stack.pop()
+        current = tracemalloc.get_traced_memory()[0]
+        row = self.stats.setdefault(name, [0, 0, 0])
+        row[0] += 1
+        row[1] = max(row[1], f.peak - f.start)
+        row[2] += current - f.start
+        if f.peak > self._last_snapshot_peak * self.SNAPSHOT_GROWTH:
+            self._last_snapshot_peak = f.peak
+            self.snapshots[name] = (f.peak, tracemalloc.take_snapshot())
+
+    @property
+    def peak_bytes(self) -> int:
+        return self.peak - self.baseline
+
+    def stop(self):
+        self._fold_peak()
+        self.end = tracemalloc.get_traced_memory()[0]
+        if self._started:
+            tracemalloc.stop()
+
+    def report(self) -> str:
+        mib = 1024 * 1024
+        lines = [f"run: peak {(self.peak - self.baseline) / mib:.1f} MiB above start, "
+                 f"{(self.end - self.baseline) / mib:.1f} MiB retained at end", "",
+                 f"{'stage':<16}{'calls':>7}{'peak KiB':>12}{'net KiB':>12}"]
+        for name, (calls, peak, net) in sorted(self.stats.items(), key=lambda kv: -kv[1][1]):
+            lines.append(f"{name:<16}{calls:>7}{peak // 1024:>12}{net // 1024:>12}")
+        for name, (peak, snap) in sorted(self.snapshots.items(), key=lambda kv: -kv[1][0]):
+            lines += ["", f"top allocations at {name} peak ({(peak - self.baseline) / mib:.1f} MiB above start):"]
+            snap = snap.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            for diff in snap.compare_to(self._first, "lineno")[:self.TOP]:
+                lines.append(f"  {diff.size_diff // 1024:>9} KiB {diff.count_diff:>7}  {diff.traceback[0]}")
+        return "\n".join(lines) + "\n"
+
+
+class RunProfile:
+    def __init__(self, mode: Optional[str] = None):
+        modes = {m.strip() for m in (mode or PROFILE_MODE).split(",")}
+        self.sampler = StackSampler(threading.get_ident()) if modes & {"cprofile", "sample"} else None
+        self.profiler: Optional[cProfile.Profile] = cProfile.Profile() if "cprofile" in modes else None
+        self.memory: Optional[MemoryTracker] = MemoryTracker() if "memory" in modes else None
+
+    def start(self):
+        if self.memory is not None:
+            self.memory.start()
+        if self.sampler is not None:
+            self.sampler.start()
+        if self.profiler is not None:
+            try:
+                self.profiler.enable()
+            except ValueError as e:  # another profiler (debugger, coverage) owns the hook
+                logger.warning(f"[PROFILE] cProfile unavailable, sampling only: {e}")
+                self.profiler = None
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.memory is not None:
+            self.memory.stop()
+
+    def write(self, base: str) -> List[str]:
+        os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+        files = []
+        if self.sampler is not None:
+            files.append(f"{base}.collapsed")
+            self.sampler.write(files[-1])
+        if self.profiler is not None:
+            files.append(f"{base}.pstats")
+            self.profiler.dump_stats(files[-1])
+        if self.memory is not None:
+            files.append(f"{base}.memory.txt")
+            with open(files[-1], "w", encoding="utf-8") as f:
+                f.write(self.memory.report())
+        return files
+
+
+def _link(family_id: int, digest_run_id: Optional[int], base: str):
+    with session_scope() as db:
+        if digest_run_id:
+            db.query(DigestRun).filter_by(id=digest_run_id).update({"profile_path": base})
+        db.query(DigestPreference).filter_by(family_id=family_id, profile_next_run=True) \
+            .update({"profile_next_run": False})
+
+
+last_profile: Optional[RunProfile] = None   # most recent profiled run in this process (CLI, benchmarks)
+
+
+@contextmanager
+def profile_run(family_id: int, timings: RunTimings) -> Iterator[Optional[RunProfile]]:
+    """Profile the block if the family asked for it; artifacts are linked from the run's DigestRun."""
+    global last_profile
+    if not requested(family_id):
+        yield None
+        return
+    prof = RunProfile()
+    timings.memory = prof.memory
+    prof.start()
+    try:
+        yield prof
+    finally:
+        prof.stop()
+        timings.memory = None
+        last_profile = prof
+        if timings.digest_run_id:
+            base = os.path.join(PROFILE_DIR, f"run_{timings.digest_run_id}")
+        else:
+            base = os.path.join(PROFILE_DIR, f"family_{family_id}_{datetime.utcnow():%Y%m%dT%H%M%S}")
+        try:
+            files = prof.write(base)
+            _link(family_id, timings.digest_run_id, base)
+            logger.info(f"[family_id={family_id}] profile written: {', '.join(files)}")
+        except Exception as e:
+            logger.warning(f"[family_id={family_id}] could not save profile: {e}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Profile a family's next digest run.")
+    ap.add_argument("family_id", type=int)
+    ap.add_argument("--now", action="store_true", help="run the digest here instead of waiting for the scheduler")
+    args = ap.parse_args()
+    with session_scope() as db:
+        n = db.query(DigestPreference).filter_by(family_id=args.family_id).update({"profile_next_run": True})
+    if not n:
+        sys.exit(f"family {args.family_id} has no digest preferences")
+    if args.now:
+        from .digest_runner import run_digest_once
+        print(run_digest_once(args.family_id))
+        with session_scope() as db:
+            run = db.query(DigestRun).filter_by(family_id=args.family_id).order_by(DigestRun.id.desc()).first()
+            print(f"profile: {run.profile_path if run else None}")
+    else:
+        print(f"family {args.family_id} will be profiled on its next run")
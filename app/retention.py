@@ -0,0 +1,225 @@
+# app/retention.py
+"""
+Retention / compaction for the tables that otherwise grow forever.
+
+Policies (days; 0 disables a policy):
+
+    RETENTION_ONELINER_DAYS     (90)   move one-liners whose event_date is more than N days
+                                       in the past into one_liners_archive
+    RETENTION_PROCESSED_DAYS    (30)   drop processed_emails dedupe hashes older than N days;
+                                       never less than the ingest look-back + 1 day
+    RETENTION_RUNS_DAYS         (90)   fold digest_runs older than N days into
+                                       digest_run_rollups (per family per day), then delete
+                                       them with their digest_run_stages
+    RETENTION_SCHOOLOGY_DAYS    (0)    drop schoology_items due more than N days ago
+    RETENTION_OUTBOX_DAYS       (14)   drop sent/dead email_outbox rows older than N days
+    RETENTION_LLM_CALLS_DAYS    (30)   drop per-call llm_calls rows older than N days
+                                       (llm_usage_daily keeps the totals)
+
+Every policy walks its table in primary-key order and deletes at most
+RETENTION_CHUNK rows per statement, committing between chunks, so no single
+transaction holds locks for long. With dry_run=True nothing is written and the
+report holds the number of rows each policy would touch.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import DateTime, and_, delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .logger import logger
+from .models import (DigestRun, DigestRunRollup, DigestRunStage, EmailOutbox, LlmCall, OneLiner, OneLinerArchive,
+                     ProcessedEmail, SchoologyItem)
+from .utils import upsert_insert
+
+ONELINER_DAYS = int(os.getenv("RETENTION_ONELINER_DAYS", "90"))
+PROCESSED_DAYS = int(os.getenv("RETENTION_PROCESSED_DAYS", "30"))
+RUNS_DAYS = int(os.getenv("RETENTION_RUNS_DAYS", "90"))
+SCHOOLOGY_DAYS = int(os.getenv("RETENTION_SCHOOLOGY_DAYS", "0"))
+OUTBOX_DAYS = int(os.getenv("RETENTION_OUTBOX_DAYS", "14"))
+LLM_CALLS_DAYS = int(os.getenv("RETENTION_LLM_CALLS_DAYS", "30"))
+CHUNK = int(os.getenv("RETENTION_CHUNK", "1000"))
+
+# run_digest_once looks back this many days; hashes must outlive it or mail is re-summarized.
+INGEST_WINDOW_DAYS = 7
+
+_ARCHIVE_COLS = ("id", "family_id", "source_msg_id", "one_liner", "created_at",
+                 "date_string", "time_string", "domain", "event_date", "event_at")
+
+
+def _chunks(db: Session, pk, where, chunk: int):
+    """Yield lists of primary keys matching `where`, in key order, `chunk` at a time."""
+    last = None
+    while True:
+        stmt = select(pk).where(where).order_by(pk).limit(chunk)
+        if last is not None:
+            stmt = stmt.where(pk > last)
+        ids = list(db.execute(stmt).scalars())
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def _count(db: Session, model, where) -> int:
+    return db.execute(select(func.count()).select_from(model).where(where)).scalar_one()
+
+
+def _delete_chunked(db: Session, model, where, chunk: int,
+                    before_delete: Optional[Callable[[List[int]], None]] = None) -> int:
+    n = 0
+    for ids in _chunks(db, model.id, where, chunk):
+        if before_delete:
+            before_delete(ids)
+        db.execute(delete(model).where(model.id.in_(ids)))
+        db.commit()
+        n += len(ids)
+    return n
+
+
+# ---- policies ----
+
+def archive_one_liners(db: Session, now: datetime, days: int = ONELINER_DAYS,
+                       dry_run: bool = False, chunk: int = CHUNK) -> int:
+    if days <= 0:
+        return 0
+    where = OneLiner.event_date < (now - timedelta(days=days)).date()
+    if dry_run:
+        return _count(db, OneLiner, where)
+
+    cols = [getattr(OneLiner, c) for c in _ARCHIVE_COLS]
+
+    def copy(ids):
+        db.execute(
+            insert(OneLinerArchive).from_select(
+                list(_ARCHIVE_COLS) + ["archived_at"],
+                select(*cols, literal(now, DateTime)).where(OneLiner.id.in_(ids)),
+            )
+        )
+
+    return _delete_chunked(db, OneLiner, where, chunk, before_delete=copy)
+
+
+def prune_processed_emails(db: Session, now: datetime, days: int = PROCESSED_DAYS,
+                           dry_run: bool = False, chunk: int = CHUNK) -> int:
+    if days <= 0:
+        return 0
+    days = max(days, INGEST_WINDOW_DAYS + 1)
+    where = ProcessedEmail.processed_at < now - timedelta(days=days)
+    if dry_run:
+        return _count(db, ProcessedEmail, where)
+    return _delete_chunked(db, ProcessedEmail, where, chunk)
+
+
+def _add_rollups(db: Session, totals: Dict[tuple, Dict[str, int]]):
+    rows = [{"family_id": f, "day": d, **t} for (f, d), t in sorted(totals.items())]
+    stmt = upsert_insert(db.get_bind().dialect.name, DigestRunRollup)
+    if stmt is not None:
+        stmt = stmt.values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[DigestRunRollup.family_id, DigestRunRollup.day],
+            set_={k: getattr(DigestRunRollup, k) + getattr(stmt.excluded, k)
+                  for k in ("runs", "sent", "failed", "items_found", "messages_scanned")},
+        ))
+        return
+    for r in rows:
+        existing = db.query(DigestRunRollup).filter_by(family_id=r["family_id"], day=r["day"]).first()
+        if existing is None:
+            db.add(DigestRunRollup(**r))
+            continue
+        for k in ("runs", "sent", "failed", "items_found", "messages_scanned"):
+            setattr(existing, k, getattr(existing, k) + r[k])
+    db.flush()
+
+
+def rollup_digest_runs(db: Session, now: datetime, days: int = RUNS_DAYS,
+                       dry_run: bool = False, chunk: int = CHUNK) -> int:
+    if days <= 0:
+        return 0
+    where = DigestRun.started_at < now - timedelta(days=days)
+    if dry_run:
+        return _count(db, DigestRun, where)
+
+    def fold(ids):
+        totals = defaultdict(lambda: {"runs": 0, "sent": 0, "failed": 0, "items_found": 0, "messages_scanned": 0})
+        for r in db.execute(
+            select(DigestRun.family_id, DigestRun.started_at, DigestRun.email_sent, DigestRun.error,
+                   DigestRun.items_found, DigestRun.messages_scanned)
+            .where(DigestRun.id.in_(ids))
+        ):
+            t = totals[(r.family_id, r.started_at.date())]
+            t["runs"] += 1
+            t["sent"] += 1 if r.email_sent else 0
+            t["failed"] += 1 if (r.error and not r.email_sent) else 0
+            t["items_found"] += r.items_found or 0
+            t["messages_scanned"] += r.messages_scanned or 0
+        if totals:
+            _add_rollups(db, totals)
+        db.execute(delete(DigestRunStage).where(DigestRunStage.digest_run_id.in_(ids)))
+
+    return _delete_chunked(db, DigestRun, where, chunk, before_delete=fold)
+
+
+def prune_schoology_items(db: Session, now: datetime, days: int = SCHOOLOGY_DAYS,
+                          dry_run: bool = False, chunk: int = CHUNK) -> int:
+    if days <= 0:
+        return 0
+    where = and_(SchoologyItem.due_at.isnot(None), SchoologyItem.due_at < now - timedelta(days=days))
+    if dry_run:
+        return _count(db, SchoologyItem, where)
+    return _delete_chunked(db, SchoologyItem, where, chunk)
+
+
+def prune_email_outbox(db: Session, now: datetime, days: int = OUTBOX_DAYS,
+                       dry_run: bool = False, chunk: int = CHUNK) -> int:
+    if days <= 0:
+        return 0
+    where = and_(EmailOutbox.status.in_(("sent", "dead")), EmailOutbox.created_at < now - timedelta(days=days))
+    if dry_run:
+        return _count(db, EmailOutbox, where)
+    return _delete_chunked(db, EmailOutbox, where, chunk)
+
+
+def prune_llm_calls(db: Session, now: datetime, days: int = LLM_CALLS_DAYS,
+                    dry_run: bool = False, chunk: int = CHUNK) -> int:
+    if days <= 0:
+        return 0
+    where = LlmCall.created_at < now - timedelta(days=days)
+    if dry_run:
+        return _count(db, LlmCall, where)
+    return _delete_chunked(db, LlmCall, where, chunk)
+
+
+POLICIES = {
+    "one_liners": archive_one_liners,
+    "processed_emails": prune_processed_emails,
+    "digest_runs": rollup_digest_runs,
+    "schoology_items": prune_schoology_items,
+    "email_outbox": prune_email_outbox,
+    "llm_calls": prune_llm_calls,
+}
+
+
+def run_retention(db: Optional[Session] = None, dry_run: bool = False,
+                  now: Optional[datetime] = None, chunk: int = CHUNK) -> Dict[str, int]:
+    """Apply every policy. Returns {table: rows archived/deleted (or that would be, if dry_run)}."""
+    own = db is None
+    db = db or SessionLocal()
+    now = now or datetime.utcnow()
+    report = {}
+    try:
+        for table, policy in POLICIES.items():
+            try:
+                report[table] = policy(db, now, dry_run=dry_run, chunk=chunk)
+            except Exception as e:
+                db.rollback()
+                logger.exception(f"[RETENTION] {table} failed: {e}")
+                report[table] = -1
+        logger.info(f"[RETENTION] dry_run={dry_run} report={report}")
+        return report
+    finally:
+        if own:
+            db.close()
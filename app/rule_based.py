@@ -0,0 +1,25 @@
+# app/rule_based.py
+"""
+LLM-free digest rendering, used when a family is over its daily token budget (llm_usage.py).
+
+render_digest: a plain list of one-liners, in the same (subject, html, text) form
+    as format_digest_from_oneliners. (Over-budget emails are summarized by
+    extractors.classify; see ingest_job._rule_based_points.)
+
+Cruder than the LLM, but the digest still goes out.
+"""
+import html as html_mod
+from typing import Dict, List, Tuple
+
+
+def render_digest(family_display_name: str, cadence: str, items: List[Dict]) -> Tuple[str, str, str]:
+    title = "Daily" if (cadence or "").lower() == "daily" else "Weekly"
+    subject = f"SchoolBrief — {title} School Digest" + (f" for {family_display_name}" if family_display_name else "")
+    lines, lis = [], []
+    for it in items:
+        when = " ".join(x for x in (it.get("date_string"), it.get("time_string")) if x)
+        text = f"{when}: {it['one_liner']}" if when else it["one_liner"]
+        lines.append(f"- {text}")
+        lis.append(f"<li>{html_mod.escape(text)}</li>")
+    html = f"<h2>{html_mod.escape(subject)}</h2><ul>{''.join(lis)}</ul>"
+    return subject, html, subject + "\n\n" + "\n".join(lines)
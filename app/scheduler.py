@@ -15,22 +15,19 @@ import logging
 from datetime import datetime
 import pytz
 from sqlalchemy.orm import Session
-from .db import SessionLocal
+from .db import SessionLocal, session_scope
 from .models import DigestPreference, User, Family
 from .digest_runner import run_digest_once  # ← NEW
+from .retention import run_retention
+from .outbox import DRAIN_BATCH, drain_outbox
 from .logger import logger
 
 DEFAULT_TZ = os.getenv("DEFAULT_TIMEZONE", "America/Los_Angeles")
 
-def run_digest_for_family(db: Session, family_id: int):
+def run_digest_for_family(family_id: int):
     logger.debug(f"[SCHEDULER] run_digest_for_family.family_id={family_id}")
-    pref = db.query(DigestPreference).filter_by(family_id=family_id).first()
-    if not pref:
-        return False, "No DigestPreference found for family"
-
     try:
-        owner_email = getattr(pref.family.owner, "email", None) if pref.family and pref.family.owner else None
-        sent, msg, metrics = run_digest_once(db, family_id, pref, user_email_fallback=owner_email)
+        sent, msg, metrics = run_digest_once(family_id)
         logger.info(f"[family_id={family_id}] sent={sent} msg={msg} metrics={metrics}")
         return sent, msg
     except Exception as e:
@@ -53,25 +50,31 @@ def _should_run_now(pref, now_local):
 def tick(force=False):
     """Run scheduling pass; return count of families whose digest was triggered."""
     logger.debug(f"[SCHEDULER] tick(force={force})")
-    db: Session = SessionLocal()
     triggered = 0
-    try:
+    # pick the due families on a short session; each pipeline opens its own per stage
+    with session_scope() as db:
         prefs = db.query(DigestPreference).all()
         now_utc = pytz.utc.localize(datetime.utcnow())
+        due = []
         for p in prefs:
             tz = pytz.timezone(p.timezone or os.getenv("DEFAULT_TIMEZONE","America/Los_Angeles"))
             now_local = now_utc.astimezone(tz)
             if _should_run_now(p, now_local) or force:
-                run_digest_for_family(db, p.family_id)
-                triggered += 1
-        db.commit()
-        return triggered
-    finally:
-        db.close()
+                due.append(p.family_id)
+    for family_id in due:
+        run_digest_for_family(family_id)
+        triggered += 1
+    # compile only queued the digests; send them now over the pooled SMTP sessions
+    drain_outbox(limit=max(triggered, DRAIN_BATCH))
+    return triggered
 
 def start_scheduler():
     sched = BackgroundScheduler(timezone="UTC")
     # Run at :00 and :30 each hour
     sched.add_job(tick, 'cron', minute='0,30', id='tick')
+    # Retries and anything a tick left behind
+    sched.add_job(drain_outbox, 'interval', minutes=1, id='outbox')
+    # Retention/compaction once a day, off the half-hour digest ticks
+    sched.add_job(run_retention, 'cron', hour=3, minute=15, id='retention')
     sched.start()
     return sched
@@ -1,14 +1,41 @@
-import os, time, json, hmac, hashlib, base64, random, urllib.parse
+import os, time, json, hmac, hashlib, base64, random, threading, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import Optional, Dict, Any, List, Tuple
+import pytz
 import requests
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth1
+from sqlalchemy import and_, insert, literal, or_, select, update
 from sqlalchemy.orm import Session
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
-from .models import ProviderAccount, SchoologyItem, Family
+from . import cassette
+from .db import release
+from .event_time import event_fields
+from .models import DigestPreference, ProviderAccount, SchoologyItem, SchoologySyncState, Family
+from .utils import chunked, pack_text, upsert_insert
 from .logger import logger
+from .tracing import current_span, traced
 
 SCHO_BASE = os.getenv("SCHOOLOGY_API_BASE", "https://api.schoology.com/v1")
+DEFAULT_TZ = os.getenv("DEFAULT_TIMEZONE", "America/Los_Angeles")
+
+# Due-date window for turning SchoologyItems into OneLiners (undated items always qualify)
+WINDOW_PAST_DAYS = int(os.getenv("SCHOOLOGY_WINDOW_PAST_DAYS", "7"))
+WINDOW_FUTURE_DAYS = int(os.getenv("SCHOOLOGY_WINDOW_FUTURE_DAYS", "120"))
+UPSERT_CHUNK = 500
+
+# Section fetches run on a small worker pool, throttled to stay under Schoology's API limits
+MAX_WORKERS = int(os.getenv("SCHOOLOGY_MAX_WORKERS", "4"))
+RATE_PER_SEC = float(os.getenv("SCHOOLOGY_RATE_PER_SEC", "8"))
+
+# List endpoints are paged with start/limit (Schoology caps limit at 200)
+PAGE_SIZE = 200
+MAX_PAGES = 50
+# Section list is cached in schoology_sync_state; a section's items are re-requested at most this often
+SECTIONS_TTL = int(os.getenv("SCHOOLOGY_SECTIONS_TTL", "21600"))
+SECTION_MIN_INTERVAL = int(os.getenv("SCHOOLOGY_SECTION_MIN_INTERVAL", "900"))
 
 # Environment variables required:
 #   SCHOOLGY_CONSUMER_KEY
@@ -37,22 +64,127 @@ def _schoology_oauth_session(token: Optional[str], token_secret: Optional[str]):
     return OAuth1(ck, cs, token, token_secret, signature_method='HMAC-SHA1')
 
 
-def _request(db: Session, pa: ProviderAccount, method: str, path: str, params: Dict[str,Any]=None) -> Dict[str,Any]:
-    url = f"{SCHO_BASE}{path}" if not path.startswith("http") else path
-    token_data = {}
-    if pa.token_json_enc:
+@dataclass
+class Listing:
+    items: List[Dict[str,Any]]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate_per_sec: float):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec and rate_per_sec > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SchoologyClient:
+    """API client for one sync run.
+
+    Holds a pooled requests.Session (keep-alive across calls), decrypts the
+    provider token and builds the OAuth1 signer once, and rate-limits calls made
+    from the worker pool used by sync_schoology.
+    """
+
+    def __init__(self, pa: ProviderAccount, http: Optional[requests.Session] = None,
+                 max_workers: int = MAX_WORKERS, rate_per_sec: float = RATE_PER_SEC):
+        self.cassette = cassette.current()  # captured here: fetches run on worker threads
+        token_data = {}
+        if pa.token_json_enc:
+            try:
+                token_data = json.loads(decrypt_text(pa.token_json_enc))
+            except Exception:
+                pass
+        if self.cassette is not None and self.cassette.mode == "replay":
+            self.auth = None  # requests are answered from the cassette, never signed
+        else:
+            self.auth = _schoology_oauth_session(token_data.get("oauth_token"), token_data.get("oauth_token_secret"))
+        self.max_workers = max(1, max_workers)
+        self.http = http or requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+        self._limiter = _RateLimiter(rate_per_sec)
+
+    def _send(self, method: str, path: str, params: Dict[str,Any]=None, headers: Dict[str,str]=None) -> requests.Response:
+        url = f"{SCHO_BASE}{path}" if not path.startswith("http") else path
+
+        def send():
+            self._limiter.wait()
+            return self.http.request(method.upper(), url, params=params, headers=headers, auth=self.auth, timeout=20)
+
+        if self.cassette is None:
+            r = send()
+        else:
+            r = self.cassette.call("schoology", cassette.schoology_key(method, url, params), send,
+                                   encode=cassette.encode_response, decode=cassette.decode_response)
+        if r.status_code >= 400:
+            raise SchoologyAuthError(f"Schoology API error {r.status_code}: {r.text[:200]}")
+        return r
+
+    def request(self, method: str, path: str, params: Dict[str,Any]=None) -> Dict[str,Any]:
+        r = self._send(method, path, params)
         try:
-            token_data = json.loads(decrypt_text(pa.token_json_enc))
+            return r.json()
         except Exception:
-            pass
-    auth = _schoology_oauth_session(token_data.get("oauth_token"), token_data.get("oauth_token_secret"))
-    r = requests.request(method.upper(), url, params=params, auth=auth, timeout=20)
-    if r.status_code >= 400:
-        raise SchoologyAuthError(f"Schoology API error {r.status_code}: {r.text[:200]}")
-    try:
-        return r.json()
-    except Exception:
-        return {"raw": r.text}
+            return {"raw": r.text}
+
+    def get_all(self, path: str, key: str, params: Dict[str,Any]=None,
+                etag: Optional[str]=None, last_modified: Optional[str]=None) -> "Listing":
+        """GET every page of a list endpoint, following links.next.
+
+        The first request is conditional when validators are given; a 304 comes
+        back as Listing(not_modified=True) with the old validators.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        r = self._send("GET", path, {"start": 0, "limit": PAGE_SIZE, **(params or {})}, headers)
+        if r.status_code == 304:
+            return Listing([], etag, last_modified, not_modified=True)
+
+        listing = Listing([], r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        seen = set()
+        for _ in range(MAX_PAGES):
+            try:
+                data = r.json()
+            except Exception:
+                break
+            if not isinstance(data, dict):
+                break
+            listing.items.extend(data.get(key) or [])
+            nxt = (data.get("links") or {}).get("next")
+            if not nxt or nxt in seen:
+                break
+            seen.add(nxt)
+            r = self._send("GET", nxt)
+        else:
+            logger.warning(f"Schoology pagination stopped at {MAX_PAGES} pages: {path}")
+        return listing
+
+    def close(self):
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 def get_or_create_schoology_provider(db: Session, user_id: int) -> ProviderAccount:
@@ -91,24 +223,26 @@ def exchange_access_token(oauth_token: str, oauth_token_secret: str, oauth_verif
 
 # ---- Fetchers ----
 
-def fetch_me(db: Session, pa: ProviderAccount) -> Dict[str,Any]:
-    return _request(db, pa, "GET", "/users/me")
+def fetch_me(client: SchoologyClient) -> Dict[str,Any]:
+    return client.request("GET", "/users/me")
 
 
-def fetch_sections(db: Session, pa: ProviderAccount) -> List[Dict[str,Any]]:
-    data = _request(db, pa, "GET", "/users/me/sections")
-    return data.get('section', []) if isinstance(data, dict) else []
+def fetch_sections(client: SchoologyClient, etag: Optional[str]=None, last_modified: Optional[str]=None) -> Listing:
+    return client.get_all("/users/me/sections", "section", etag=etag, last_modified=last_modified)
 
 
-def fetch_section_assignments(db: Session, pa: ProviderAccount, section_id: str) -> List[Dict[str,Any]]:
+def fetch_section_assignments(client: SchoologyClient, section_id: str,
+                              etag: Optional[str]=None, last_modified: Optional[str]=None) -> Listing:
     # assignments endpoint
-    data = _request(db, pa, "GET", f"/sections/{section_id}/assignments")
-    return data.get('assignment', []) if isinstance(data, dict) else []
+    return client.get_all(f"/sections/{section_id}/assignments", "assignment", etag=etag, last_modified=last_modified)
 
 
-def fetch_section_events(db: Session, pa: ProviderAccount, section_id: str) -> List[Dict[str,Any]]:
-    data = _request(db, pa, "GET", f"/sections/{section_id}/events")
-    return data.get('event', []) if isinstance(data, dict) else []
+def fetch_section_events(client: SchoologyClient, section_id: str,
+                         etag: Optional[str]=None, last_modified: Optional[str]=None) -> Listing:
+    # Only events from the materialization window onward; older ones would be ignored anyway.
+    since = (datetime.utcnow() - timedelta(days=WINDOW_PAST_DAYS)).strftime("%Y-%m-%d")
+    return client.get_all(f"/sections/{section_id}/events", "event", params={"start_date": since},
+                          etag=etag, last_modified=last_modified)
 
 # ---- Persistence / normalization ----
 
@@ -125,100 +259,218 @@ def _parse_dt(ts: Optional[str]) -> Optional[datetime]:
         return None
 
 
-def store_items(db: Session, family_id: int, pa: ProviderAccount, items: List[Dict[str,Any]], item_type: str, course_title: Optional[str]):
-    created = 0
-    for it in items:
-        sid = str(it.get('id') or it.get('assignment_id') or it.get('event_id') or '')
-        if not sid:
-            continue
-        existing = db.query(SchoologyItem).filter_by(family_id=family_id, schoology_id=sid).first()
-        due_ts = _parse_dt(str(it.get('due')) if it.get('due') else str(it.get('start')))
-        title = it.get('title') or it.get('name') or '(Untitled)'
-        desc = it.get('description') or ''
-        if existing:
-            # update minimal fields
-            existing.title = title[:500]
-            existing.description = (desc or '')[:4000]
-            existing.due_at = due_ts
-            existing.updated_at = datetime.utcnow()
-            existing.course_title = course_title
-            db.add(existing)
-            continue
-        db.add(SchoologyItem(
-            family_id=family_id,
-            provider_account_id=pa.id,
-            schoology_id=sid,
-            item_type=item_type,
-            title=title[:500],
-            description=(desc or '')[:4000],
-            due_at=due_ts,
-            course_title=course_title,
-            raw_json=json.dumps(it)[:10000],
-        ))
-        created += 1
-    if created:
-        db.commit()
-    return created
+def _item_row(family_id: int, pa: ProviderAccount, it: Dict[str,Any], item_type: str, course_title: Optional[str], now: datetime) -> Optional[Dict[str,Any]]:
+    sid = str(it.get('id') or it.get('assignment_id') or it.get('event_id') or '')
+    if not sid:
+        return None
+    due_ts = _parse_dt(str(it.get('due')) if it.get('due') else str(it.get('start')))
+    title = it.get('title') or it.get('name') or '(Untitled)'
+    desc = it.get('description') or ''
+    return {
+        "family_id": family_id,
+        "provider_account_id": pa.id,
+        "schoology_id": sid,
+        "item_type": item_type,
+        "title": title[:500],
+        "description": (desc or '')[:4000],
+        "due_at": due_ts,
+        "course_title": course_title,
+        "created_at": now,
+        "updated_at": now,
+        "raw_json_z": pack_text(json.dumps(it)[:10000]),
+    }
 
 
+def store_items(db: Session, family_id: int, pa: ProviderAccount, items: List[Dict[str,Any]], item_type: str, course_title: Optional[str]):
+    """Upsert items on (family_id, schoology_id); returns how many were new.
+
+    One SELECT for the existing ids plus one INSERT .. ON CONFLICT DO UPDATE per
+    chunk, instead of a SELECT per item. Existing rows only get their display
+    fields refreshed (title/description/due/course), as before.
+    """
+    now = datetime.utcnow()
+    rows: Dict[str, Dict[str,Any]] = {}
+    for it in items:
+        row = _item_row(family_id, pa, it, item_type, course_title, now)
+        if row:
+            rows[row["schoology_id"]] = row
+    if not rows:
+        return 0
+
+    existing = set()
+    for ids in chunked(rows, UPSERT_CHUNK):
+        existing.update(db.execute(
+            select(SchoologyItem.schoology_id)
+            .where(SchoologyItem.family_id == family_id, SchoologyItem.schoology_id.in_(ids))
+        ).scalars())
+
+    stmt = upsert_insert(db.get_bind().dialect.name, SchoologyItem)
+    if stmt is not None:
+        for batch in chunked(rows.values(), UPSERT_CHUNK):
+            ins = stmt.values(batch)
+            db.execute(ins.on_conflict_do_update(
+                index_elements=[SchoologyItem.family_id, SchoologyItem.schoology_id],
+                set_={
+                    "title": ins.excluded.title,
+                    "description": ins.excluded.description,
+                    "due_at": ins.excluded.due_at,
+                    "course_title": ins.excluded.course_title,
+                    "updated_at": ins.excluded.updated_at,
+                },
+            ))
+    else:
+        new_rows = [r for sid, r in rows.items() if sid not in existing]
+        if new_rows:
+            db.execute(insert(SchoologyItem), new_rows)
+        for sid in existing:
+            r = rows[sid]
+            db.execute(
+                update(SchoologyItem)
+                .where(SchoologyItem.family_id == family_id, SchoologyItem.schoology_id == sid)
+                .values(title=r["title"], description=r["description"], due_at=r["due_at"],
+                        course_title=r["course_title"], updated_at=now)
+            )
+    return len(rows.keys() - existing)
+
+
+@traced("sync_schoology")
 def sync_schoology(db: Session, family_id: int) -> Dict[str,int]:
     fam = db.query(Family).filter_by(id=family_id).first()
     if not fam:
         return {"created":0, "updated":0}
     pa = db.query(ProviderAccount).filter_by(user_id=fam.owner_user_id, provider=PROVIDER_NAME).first()
-    if not pa or not pa.token_json_enc:
+    if not pa or not (pa.token_json_enc or cassette.replaying()):
         return {"created":0, "updated":0}
 
-    sections = fetch_sections(db, pa)
-    created_total = 0
-    for s in sections:
-        sec_id = str(s.get('id') or '')
-        course_title = s.get('course_title') or s.get('course_title_display') or None
-        if not sec_id:
-            continue
-        try:
-            assigns = fetch_section_assignments(db, pa, sec_id)
-            created_total += store_items(db, family_id, pa, assigns, 'assignment', course_title)
-        except Exception as e:
-            logger.debug(f"Schoology assignments fetch failed section={sec_id}: {e}")
-        try:
-            events = fetch_section_events(db, pa, sec_id)
-            created_total += store_items(db, family_id, pa, events, 'event', course_title)
-        except Exception as e:
-            logger.debug(f"Schoology events fetch failed section={sec_id}: {e}")
+    now = datetime.utcnow()
+    states = {st.resource: st for st in db.query(SchoologySyncState).filter_by(provider_account_id=pa.id)}
 
-    return {"created": created_total, "updated": 0}
+    def _state(resource: str) -> SchoologySyncState:
+        st = states.get(resource)
+        if not st:
+            st = states[resource] = SchoologySyncState(provider_account_id=pa.id, resource=resource)
+            db.add(st)
+        return st
 
-
-def materialize_schoology_items_as_oneliners(db: Session, family_id: int) -> int:
+    created_total = 0
+    stats = {"requested": 0, "not_modified": 0, "skipped": 0}
+    with SchoologyClient(pa) as client:
+        sec_state = _state("sections")
+        release(db)  # every fetch below goes to Schoology; each section's store is committed on its own
+        if sec_state.payload_json and sec_state.last_synced_at and now - sec_state.last_synced_at < timedelta(seconds=SECTIONS_TTL):
+            sections = json.loads(sec_state.payload_json)
+        else:
+            listing = fetch_sections(client, sec_state.etag, sec_state.last_modified)
+            if listing.not_modified and sec_state.payload_json:
+                sections = json.loads(sec_state.payload_json)
+            else:
+                sections = [
+                    {"id": str(s.get('id') or ''), "course_title": s.get('course_title') or s.get('course_title_display') or None}
+                    for s in listing.items
+                ]
+                sec_state.payload_json = json.dumps(sections)
+                sec_state.etag, sec_state.last_modified = listing.etag, listing.last_modified
+            sec_state.last_synced_at = now
+
+        # (section_id, course_title, item_type, fetcher, state); stores happen on this thread
+        jobs = []
+        for s in sections:
+            sec_id = str(s.get('id') or '')
+            if not sec_id:
+                continue
+            for item_type, fetcher in (('assignment', fetch_section_assignments), ('event', fetch_section_events)):
+                st = _state(f"sections/{sec_id}/{item_type}s")
+                if st.last_synced_at and now - st.last_synced_at < timedelta(seconds=SECTION_MIN_INTERVAL):
+                    stats["skipped"] += 1
+                    continue
+                jobs.append((sec_id, s.get('course_title'), item_type, fetcher, st))
+
+        with ThreadPoolExecutor(max_workers=client.max_workers, thread_name_prefix="schoology") as pool:
+            futures = [(job, pool.submit(job[3], client, job[0], job[4].etag, job[4].last_modified)) for job in jobs]
+            release(db)
+            for (sec_id, course_title, item_type, _, st), fut in futures:
+                stats["requested"] += 1
+                try:
+                    listing = fut.result()
+                except Exception as e:
+                    logger.debug(f"Schoology {item_type}s fetch failed section={sec_id}: {e}")
+                    continue
+                st.last_synced_at = now
+                if listing.not_modified:
+                    stats["not_modified"] += 1
+                    continue
+                try:
+                    # a bad section rolls back to the savepoint; the others still land
+                    with db.begin_nested():
+                        created_total += store_items(db, family_id, pa, listing.items, item_type, course_title)
+                except Exception as e:
+                    logger.debug(f"Schoology {item_type}s store failed section={sec_id}: {e}")
+                else:
+                    # only a stored listing may be answered with 304 next time
+                    st.etag, st.last_modified = listing.etag, listing.last_modified
+                release(db)  # back to waiting on Schoology
+
+    db.commit()
+    logger.debug(f"Schoology sync family_id={family_id} sections={len(sections)} {stats}")
+    current_span().set(sections=len(sections), created=created_total, **stats)
+    return {"created": created_total, "updated": 0, **stats}
+
+
+def materialize_schoology_items_as_oneliners(db: Session, family_id: int, now: Optional[datetime] = None,
+                                             tz_name: Optional[str] = None) -> int:
     """Create OneLiner rows from SchoologyItem if not already summarized.
 
     We use schoology_id as source_msg_id with a prefix to avoid clash with gmail ids.
+    Only items due within [now - SCHOOLOGY_WINDOW_PAST_DAYS, now + SCHOOLOGY_WINDOW_FUTURE_DAYS]
+    (or undated) are considered; missing ones are found with a single anti-join and
+    inserted in one executemany.
+
+    due_at is UTC; date/time strings and event_date/event_time are in the family's
+    timezone (tz_name, else DigestPreference.timezone), like one-liners from email.
     """
-    from .models import OneLiner, SchoologyItem  # local import to avoid circular
-    created = 0
-    rows = db.query(SchoologyItem).filter_by(family_id=family_id).all()
-    for r in rows:
-        source_id = f"sch_{r.schoology_id}"[:128]
-        exists = db.query(OneLiner).filter_by(family_id=family_id, source_msg_id=source_id).first()
-        if exists:
-            continue
+    from .models import OneLiner  # local import to avoid circular
+    now = now or datetime.utcnow()
+    lo = now - timedelta(days=WINDOW_PAST_DAYS)
+    hi = now + timedelta(days=WINDOW_FUTURE_DAYS)
+    source_id = literal("sch_") + SchoologyItem.schoology_id
+
+    missing = db.execute(
+        select(SchoologyItem.schoology_id, SchoologyItem.title, SchoologyItem.course_title, SchoologyItem.due_at)
+        .outerjoin(OneLiner, and_(OneLiner.family_id == SchoologyItem.family_id, OneLiner.source_msg_id == source_id))
+        .where(
+            SchoologyItem.family_id == family_id,
+            OneLiner.id.is_(None),
+            or_(SchoologyItem.due_at.is_(None), SchoologyItem.due_at.between(lo, hi)),
+        )
+    ).all()
+    if not missing:
+        return 0
+
+    if tz_name is None:
+        tz_name = db.execute(
+            select(DigestPreference.timezone).where(DigestPreference.family_id == family_id)
+        ).scalar()
+    tz = pytz.timezone(tz_name or DEFAULT_TZ)
+    created_at = datetime.utcnow()
+    rows = []
+    for r in missing:
         # Build one-liner text
         when_dt = r.due_at
-        date_string = when_dt.strftime('%Y-%m-%d') if when_dt else None
-        time_string = when_dt.strftime('%I:%M %p').lstrip('0') if when_dt else None
+        local = pytz.utc.localize(when_dt).astimezone(tz) if when_dt else None
+        date_string = local.strftime('%Y-%m-%d') if local else None
+        time_string = local.strftime('%I:%M %p').lstrip('0') if local else None
         course_part = f"[{r.course_title}] " if r.course_title else ""
-        one = f"{course_part}{r.title}"[:200]
-        db.add(OneLiner(
-            family_id=family_id,
-            source_msg_id=source_id,
-            one_liner=one,
-            when_ts=when_dt,
-            date_string=date_string,
-            time_string=time_string,
-            domain='schoology.com'
-        ))
-        created += 1
-    if created:
-        db.commit()
-    return created
+        rows.append({
+            "family_id": family_id,
+            "source_msg_id": f"sch_{r.schoology_id}"[:128],
+            "one_liner": f"{course_part}{r.title}"[:200],
+            "when_ts": when_dt,
+            "created_at": created_at,
+            "date_string": date_string,
+            "time_string": time_string,
+            "domain": 'schoology.com',
+            **event_fields(date_string, time_string, when_dt, tz_name),
+        })
+    db.execute(insert(OneLiner), rows)
+    db.commit()
+    return len(rows)
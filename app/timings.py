@@ -0,0 +1,157 @@
+# app/timings.py
+"""
+Per-stage wall-clock timings for the digest pipeline.
+
+Code wraps each slow step in `with stage("gmail_get"):`. The elapsed time
+(time.perf_counter) goes to two places:
+
+- a process-wide histogram, rendered in Prometheus text format by `render_prometheus`
+  (served at GET /metrics);
+- the current run's RunTimings, if one is active. `run_digest_once` opens one with
+  `run_timings()`. compile_and_send_digest binds it to its DigestRun and the runner
+  saves it to digest_run_stages. SMTP time is saved by the outbox when it delivers.
+
+The current run is held in a ContextVar, so deep helpers (PDF extraction, LLM calls)
+need no extra parameters. Worker threads each start with no active run.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .models import DigestRunStage
+
+STAGES = (
+    "forwarded_imap",   # IMAP scan of forwarded mail for new school domains
+    "gmail_list",       # messages.list pages
+    "gmail_get",        # one messages.get per email
+    "pdf_extract",      # pdfminer on PDF attachments
+    "llm_summarize",    # one OpenAI call per new email
+    "db_write",         # one-liner + processed-email inserts
+    "schoology",        # Schoology sync + materialize
+    "compile_llm",      # digest render
+    "smtp",             # outbox delivery
+)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Histogram:
+    """Minimal labelled Prometheus histogram (cumulative buckets, sum, count)."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Tuple[float, ...] = BUCKETS):
+        self.name, self.help, self.label, self.buckets = name, help_text, label, buckets
+        self._lock = threading.Lock()
+        self._series: Dict[str, List[float]] = {}   # label value -> bucket counts + [sum, count]
+
+    def observe(self, value_label: str, seconds: float):
+        with self._lock:
+            row = self._series.setdefault(value_label, [0.0] * (len(self.buckets) + 2))
+            for i, le in enumerate(self.buckets):
+                if seconds <= le:
+                    row[i] += 1
+            row[-2] += seconds
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for value, row in sorted(series.items()):
+            lbl = f'{self.label}="{value}"'
+            for le, n in zip(self.buckets, row):
+                lines.append(f'{self.name}_bucket{{{lbl},le="{le}"}} {int(n)}')
+            lines.append(f'{self.name}_bucket{{{lbl},le="+Inf"}} {int(row[-1])}')
+            lines.append(f"{self.name}_sum{{{lbl}}} {row[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{lbl}}} {int(row[-1])}")
+        return lines
+
+
+stage_seconds = Histogram("schoolbrief_stage_seconds", "Wall time of one digest pipeline step.", "stage")
+
+
+class RunTimings:
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.digest_run_id: Optional[int] = None
+        self.memory = None   # profiling.MemoryTracker while the run is memory-profiled
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def summary(self) -> Dict[str, float]:
+        return {k: round(v, 3) for k, v in self.seconds.items()}
+
+
+_current: ContextVar[Optional[RunTimings]] = ContextVar("run_timings", default=None)
+
+
+def observe(name: str, seconds: float):
+    stage_seconds.observe(name, seconds)
+    cur = _current.get()
+    if cur is not None:
+        cur.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    cur = _current.get()
+    memory = cur.memory if cur is not None else None
+    if memory is not None:
+        memory.enter(name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0)
+        if memory is not None:
+            memory.exit(name)
+
+
+@contextmanager
+def run_timings() -> Iterator[RunTimings]:
+    """Collect every stage() inside this block (on this thread) into one RunTimings."""
+    timings = RunTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def bind_run(digest_run_id: int):
+    """Called by compile once the DigestRun exists, so the runner knows where to save."""
+    cur = _current.get()
+    if cur is not None:
+        cur.digest_run_id = digest_run_id
+
+
+def save_stage(db: Session, digest_run_id: int, name: str, seconds: float, calls: int = 1):
+    """Add (or accumulate into) one digest_run_stages row. Caller commits."""
+    row = db.query(DigestRunStage).filter_by(digest_run_id=digest_run_id, stage=name).first()
+    if row is None:
+        db.add(DigestRunStage(digest_run_id=digest_run_id, stage=name, seconds=seconds, calls=calls))
+    else:
+        row.seconds += seconds
+        row.calls += calls
+
+
+def save(db: Session, timings: RunTimings) -> bool:
+    """Persist a run's stages against its DigestRun; False if compile never created one."""
+    if not timings.digest_run_id:
+        return False
+    for name, seconds in timings.seconds.items():
+        save_stage(db, timings.digest_run_id, name, seconds, timings.calls.get(name, 1))
+    return True
+
+
+def render_prometheus(extra_gauges: Optional[Dict[str, float]] = None) -> str:
+    lines = stage_seconds.render()
+    for name, value in (extra_gauges or {}).items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
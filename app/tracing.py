@@ -0,0 +1,224 @@
+# app/tracing.py
+"""
+Lightweight tracing for the digest pipeline.
+
+    with span("llm.summarize", chars=len(body)) as sp:
+        ...
+        sp.set(points=len(points))
+
+A span opened with no active parent starts a new trace. Its children are collected
+through a ContextVar (per thread, like app/timings.py). When the root span ends,
+the whole trace is handed to the exporter in one batch, stamped with the
+DigestRun it belongs to (`link_run`, called by compile and by the outbox).
+
+TRACE_EXPORT selects the exporter:
+    ""/"off"  (default) spans are not recorded; span() costs one ContextVar lookup
+    "jsonl"   one JSON object per span appended to TRACE_JSONL_PATH
+    "otlp"    OTLP/HTTP JSON POST to TRACE_OTLP_ENDPOINT (e.g. http://collector:4318/v1/traces)
+
+Gmail retries (googleapiclient logs each one before sleeping) are added to the
+current span as "retry" events.
+"""
+import functools
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+from .logger import logger
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "schoolbrief")
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "").strip().lower()
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "/tmp/schoolbrief-traces.jsonl" if os.getenv("K_SERVICE")
+                             else "./traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "events", "error", "root", "spans", "digest_run_id")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes)
+        self.events: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.root: "Span" = parent.root if parent else self
+        self.spans: List["Span"] = []        # finished spans of the trace; used on the root only
+        self.digest_run_id: Optional[int] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name: str, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "digest_run_id": self.root.digest_run_id,
+            "attributes": self.attributes,
+            "events": self.events,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def event(self, name: str, **attributes):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+# ---- exporters ----
+
+_write_lock = threading.Lock()
+
+
+def _export_jsonl(spans: List[Span]):
+    lines = "".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans)
+    with _write_lock, open(TRACE_JSONL_PATH, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def _otlp_value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def _otlp_attrs(attrs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items() if v is not None]
+
+
+def otlp_payload(spans: List[Span]) -> Dict[str, Any]:
+    out = []
+    for s in spans:
+        attrs = dict(s.attributes)
+        if s.root.digest_run_id:
+            attrs["digest_run.id"] = s.root.digest_run_id
+        out.append({
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+            "name": s.name,
+            "kind": 1,  # INTERNAL
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": _otlp_attrs(attrs),
+            "events": [{"name": e["name"], "timeUnixNano": str(e["time_ns"]),
+                        "attributes": _otlp_attrs(e["attributes"])} for e in s.events],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attrs({"service.name": SERVICE_NAME})},
+        "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": out}],
+    }]}
+
+
+def _export_otlp(spans: List[Span]):
+    r = requests.post(TRACE_OTLP_ENDPOINT, json=otlp_payload(spans), timeout=5)
+    r.raise_for_status()
+
+
+EXPORTERS = {"jsonl": _export_jsonl, "otlp": _export_otlp}
+
+
+def _export(spans: List[Span]):
+    exporter = EXPORTERS.get(TRACE_EXPORT)
+    if exporter is None:
+        return
+    try:
+        exporter(spans)
+    except Exception as e:
+        # tracing must never fail a digest run
+        logger.warning(f"[TRACE] export via {TRACE_EXPORT} failed: {e}")
+
+
+# ---- API ----
+
+def enabled() -> bool:
+    return TRACE_EXPORT in EXPORTERS
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Any]:
+    if not enabled():
+        yield _NOOP
+        return
+    parent = _current.get()
+    sp = Span(name, parent, attributes)
+    token = _current.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        _current.reset(token)
+        sp.end_ns = time.time_ns()
+        sp.root.spans.append(sp)
+        if parent is None:
+            _export(sp.spans)
+
+
+def traced(name: str):
+    """Decorator form of span() for whole functions."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def current_span() -> Any:
+    return _current.get() or _NOOP
+
+
+def link_run(digest_run_id: int):
+    """Tie the current trace to its DigestRun; every exported span carries the id."""
+    sp = _current.get()
+    if sp is not None:
+        sp.root.digest_run_id = digest_run_id
+        sp.root.set(**{"digest_run.id": digest_run_id})
+
+
+class _RetryEvents(logging.Handler):
+    """googleapiclient warns "Sleeping N seconds before retry k of n ..." before each retry."""
+
+    def emit(self, record: logging.LogRecord):
+        sp = _current.get()
+        if sp is not None and "before retry" in record.getMessage():
+            sp.event("retry", message=record.getMessage()[:300])
+
+
+logging.getLogger("googleapiclient.http").addHandler(_RetryEvents(logging.WARNING))
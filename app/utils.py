@@ -1,3 +1,5 @@
+import zlib
+from typing import Optional
 
 def csv_to_list(csv_str: str):
     if not csv_str:
@@ -6,3 +8,29 @@ def csv_to_list(csv_str: str):
 
 def list_to_csv(lst):
     return ",".join(lst or [])
+
+def upsert_insert(dialect_name: str, table):
+    """insert() construct with on_conflict_do_update for SQLite/Postgres; None elsewhere."""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(table)
+
+def chunked(seq, size: int):
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+def pack_text(s: Optional[str]) -> Optional[bytes]:
+    """zlib-compress text for a LargeBinary column."""
+    if s is None:
+        return None
+    return zlib.compress(s.encode("utf-8"), 6)
+
+def unpack_text(b: Optional[bytes]) -> Optional[str]:
+    if b is None:
+        return None
+    return zlib.decompress(b).decode("utf-8")
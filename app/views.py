@@ -1,6 +1,7 @@
 # views.py (top imports)
 import email
 import re
+from email.utils import parseaddr
 
 from fastapi import APIRouter, Request, Form, BackgroundTasks
 from fastapi.responses import RedirectResponse
@@ -16,7 +17,7 @@ from sqlalchemy.orm import Session
 from .db import SessionLocal
 from .models import (
     User, Family, Child, DigestRun, DigestPreference,
-    Subscription, ReferralCode, OneLiner, ProcessedEmail
+    Subscription, ReferralCode, OneLiner, ProcessedEmail, PipelineJob
 )
 from .stripe_sync import ensure_subscription_items
 from urllib.parse import quote_plus
@@ -32,7 +33,9 @@ from sqlalchemy import or_, and_
 from .logger import logger
 from .digest_from_emails import compile_and_send_digest_from_emails
 import pytz
-from .digest_runner import run_digest_once  # ← NEW
+from .jobs import active_job, job_status, start_run_now
+from fastapi.responses import JSONResponse
+from .family_index import family_for_recipient, domain_suggestions as popular_domains
 
 
 router = APIRouter()
@@ -82,6 +85,15 @@ def index(request: Request):
     finally:
         db.close()
 
+def _dashboard_job(db: Session, family_id: int, job_id: str = None):
+    """The job named in ?job= (right after Run now), else whatever is still running."""
+    if job_id and job_id.isdigit():
+        job = db.get(PipelineJob, int(job_id))
+        if job and job.family_id == family_id:
+            return job_status(job)
+    job = active_job(db, family_id)
+    return job_status(job) if job else None
+
 @router.get("/app", response_class=HTMLResponse)
 def dashboard(request: Request):
     db = _db()
@@ -113,6 +125,7 @@ def dashboard(request: Request):
                 "pref": pref,
                 "sub": sub,
                 "recent_runs": recent_runs,  # <-- IMPORTANT: match template
+                "job": _dashboard_job(db, fam.id, request.query_params.get("job")),
             },
         )
     finally:
@@ -220,31 +233,12 @@ def run_now(request: Request):
         if not fam:
             return RedirectResponse("/app?flash=" + quote_plus("No family configured"), status_code=303)
 
-        pref = fam.prefs
-        if not pref:
+        if not fam.prefs:
             return RedirectResponse("/app?flash=" + quote_plus("No preferences configured"), status_code=303)
 
-        # Single call does the whole pipeline
-        sent, msg, metrics = run_digest_once(
-            db=db,
-            family_id=fam.id,
-            pref=pref,
-            user_email_fallback=user.email,  # keeps your original fallback
-            days_back=7,
-        )
-
-        if sent:
-            flash = (
-                f"Digest sent — processed {metrics['processed_count']} email(s), "
-                f"added {metrics['points_created']} item(s)."
-            )
-        else:
-            flash = (
-                f"Digest not sent: {msg} — processed {metrics['processed_count']} "
-                f"email(s), added {metrics['points_created']} item(s)."
-            )
-
-        return RedirectResponse("/app?flash=" + quote_plus(flash), status_code=303)
+        # The pipeline runs in the background (app/jobs.py); the dashboard polls its progress.
+        job = start_run_now(db, fam.id)
+        return RedirectResponse(f"/app?job={job.id}&flash=" + quote_plus("Digest run started"), status_code=303)
 
     except Exception as e:
         notice = build_error_notice(e, {"op": "run-now"})
@@ -254,6 +248,22 @@ def run_now(request: Request):
         db.close()
 
 
+@router.get("/app/run-now/{job_id}")
+def run_now_status(request: Request, job_id: int):
+    db = _db()
+    try:
+        user = _current_user(db, request)
+        if not user:
+            return JSONResponse({"error": "not signed in"}, status_code=401)
+        job = db.get(PipelineJob, job_id)
+        fam = db.query(Family).filter_by(owner_user_id=user.id).first()
+        if not job or not fam or job.family_id != fam.id:
+            return JSONResponse({"error": "not found"}, status_code=404)
+        return JSONResponse(job_status(job))
+    finally:
+        db.close()
+
+
 @router.get("/app/settings")
 def settings_get(request: Request):
     db = _db()
@@ -418,26 +428,8 @@ def settings_family(request: Request):
         pref = fam.prefs
         kids = db.query(Child).filter_by(family_id=fam.id).all()
         rc = db.query(ReferralCode).filter_by(family_id=fam.id).first()
-        # views.py (inside the GET handler for settings page)
-        from collections import Counter
-        from sqlalchemy import select
-        from .models import DigestPreference
-
-        # collect all school_domains from all families
-        rows = db.execute(select(DigestPreference.school_domains)).all()
-
-        counter = Counter()
-        for (csv_str,) in rows:
-            if not csv_str:
-                continue
-            # normalize: split csv, trim, lowercase, strip leading '@'
-            doms = {d.strip().lower().lstrip("@") for d in csv_str.split(",") if d.strip()}
-            # count each unique domain once per family pref row
-            for d in doms:
-                counter[d] += 1
-
-        # alphabetize
-        domain_suggestions = [pair[0] for pair in sorted(counter.items(), key=lambda x: x[0])]  # [(domain, count), ...]
+        # popular domains across families (materialized counts, cached)
+        domain_suggestions = popular_domains(db)
 
         # pass to template
         ctx = {
@@ -641,12 +633,13 @@ def data_preview(request: Request):
             db.query(OneLiner)
             .filter(OneLiner.family_id == fam.id)
             .filter(
+                # both branches are range scans on ix_one_liners_family_event_at
                 or_(
-                    and_(OneLiner.when_ts != None, OneLiner.when_ts >= start_utc, OneLiner.when_ts < end_utc),
-                    and_(OneLiner.when_ts == None, OneLiner.created_at >= start_utc, OneLiner.created_at < end_utc),
+                    and_(OneLiner.event_at >= start_utc, OneLiner.event_at < end_utc),
+                    and_(OneLiner.event_at == None, OneLiner.created_at >= start_utc, OneLiner.created_at < end_utc),
                 )
             )
-            .order_by(OneLiner.when_ts.is_(None), OneLiner.when_ts, OneLiner.created_at.desc())
+            .order_by(OneLiner.event_at.is_(None), OneLiner.event_at, OneLiner.created_at.desc())
             .all()
         )
         return templates.TemplateResponse("data_preview.html", {
@@ -686,21 +679,15 @@ async def inbound_forwarded_email(request: Request):
         raw_email = data.decode(errors="ignore")
         # Parse sender (the user who forwarded)
         msg = email.message_from_string(raw_email)
-        sender = msg.get('From', '').strip().lower()
+        sender = (parseaddr(msg.get('From', ''))[1] or '').strip().lower()
         # Find user by sender email or by to_addresses
         user = db.query(User).filter(User.email == sender).first()
         fam = None
         if user:
             fam = db.query(Family).filter_by(owner_user_id=user.id).first()
         else:
-            # Try to match sender to any family's to_addresses
-            prefs = db.query(DigestPreference).all()
-            for pref in prefs:
-                if pref.to_addresses:
-                    to_list = [e.strip().lower() for e in pref.to_addresses.split(',') if e.strip()]
-                    if sender in to_list:
-                        fam = db.query(Family).filter_by(id=pref.family_id).first()
-                        break
+            # Try to match sender to any family's to_addresses (indexed)
+            fam = family_for_recipient(db, sender)
         if not fam:
             return {"ok": False, "reason": "Sender not recognized as user or recipient"}
         # Extract original sender domain
@@ -0,0 +1,132 @@
+# benchmarks/bench_compile.py
+"""
+Digest compile payload benchmark: loading one family's one-liners at N historical rows.
+
+    python -m benchmarks.bench_compile --rows 50000 --upcoming 60
+
+Compares the windowed, column-only query in app.compile_job with the original
+full-history ORM load + Python date filter (kept below as `legacy_items` and
+`_filter_future_items`, the baseline for the payload check).
+Only the payload load is timed; no LLM or SMTP calls are made.
+"""
+import argparse, os, tempfile, time, tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, User, Family, OneLiner
+from app.compile_job import _upcoming_oneliner_items
+from app.event_time import event_fields
+
+
+def _filter_future_items(items, today_str):
+    """
+    Keep only items where date_string >= today (if date_string exists).
+    Items without a date_string are kept.
+    """
+    today = datetime.strptime(today_str, "%Y-%m-%d").date()
+    kept = []
+
+    for it in items:
+        ds = it.get("date_string")
+        if ds:
+            try:
+                d = datetime.strptime(ds, "%Y-%m-%d").date()
+                if d >= today:
+                    kept.append(it)
+            except ValueError:
+                # malformed date_string -> keep
+                kept.append(it)
+        else:
+            # no date_string -> keep
+            kept.append(it)
+
+    return kept
+
+
+def legacy_items(db, family_id, today_str):
+    rows = (
+        db.query(OneLiner)
+        .filter(OneLiner.family_id == family_id)
+        .order_by(OneLiner.date_string.asc().nulls_last(), OneLiner.created_at.asc())
+        .all()
+    )
+    items = [{"one_liner": it.one_liner, "date_string": it.date_string,
+              "time_string": it.time_string, "domain": it.domain} for it in rows]
+    return _filter_future_items(items, today_str)
+
+
+def _seed(db, family_id: int, rows: int, upcoming: int, today: datetime):
+    # `rows` one-liners spread over the past ~3 years, plus `upcoming` in the next weeks.
+    batch = []
+    for i in range(rows + upcoming):
+        if i < rows:
+            d = today - timedelta(days=1 + (i * 1100) // rows)
+        else:
+            d = today + timedelta(days=(i - rows) % 45)
+        ds = d.strftime("%Y-%m-%d") if i % 10 else None
+        ts = "3:15 PM" if i % 3 == 0 else None
+        batch.append({
+            "family_id": family_id,
+            "source_msg_id": f"msg{i}",
+            "one_liner": f"Reminder {i}: bring the signed permission slip and a packed lunch.",
+            "created_at": d - timedelta(days=3),
+            "date_string": ds,
+            "time_string": ts,
+            "domain": "school.org",
+            **event_fields(ds, ts),
+        })
+        if len(batch) == 5000:
+            db.execute(insert(OneLiner), batch); batch = []
+    if batch:
+        db.execute(insert(OneLiner), batch)
+    db.commit()
+
+
+def _measure(label, fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn()
+    dt = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<12} {dt * 1000:9.1f} ms  peak {peak / 1e6:7.2f} MB  -> {len(out)} items")
+    return out
+
+
+def run(rows: int, upcoming: int, families: int, db_url: str = None):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = db_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_engine(url)
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        today = datetime.now()
+        today_str = today.strftime("%Y-%m-%d")
+        fids = []
+        for f in range(families):
+            u = User(email=f"bench{f}@example.com"); db.add(u); db.commit()
+            fam = Family(owner_user_id=u.id); db.add(fam); db.commit()
+            _seed(db, fam.id, rows, upcoming, today)
+            fids.append(fam.id)
+        print(f"{families} families x {rows} historical + {upcoming} upcoming one-liners ({engine.dialect.name})")
+        for fid in fids:
+            db.expunge_all()
+            old = _measure("legacy", lambda: legacy_items(db, fid, today_str))
+            db.expunge_all()
+            new = _measure("windowed", lambda: _upcoming_oneliner_items(db, fid, today_str))
+            assert old == new, "payload mismatch"
+        db.close()
+        if db_url:
+            Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=50000)
+    ap.add_argument("--upcoming", type=int, default=60)
+    ap.add_argument("--families", type=int, default=1)
+    ap.add_argument("--db-url", default=None, help="defaults to a temp SQLite file (Postgres: dropped after)")
+    args = ap.parse_args()
+    run(args.rows, args.upcoming, args.families, args.db_url)
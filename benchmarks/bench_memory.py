@@ -0,0 +1,76 @@
+# benchmarks/bench_memory.py
+"""
+Peak-memory gate for one family's digest run over a heavy synthetic week.
+
+    python -m benchmarks.bench_memory --emails 500 --pdf-every 10 --max-peak-mb 60
+
+Runs run_digest_once once against FakeGmail (benchmarks/fakes.py) and the OpenAI
+stand-in, with the run memory-profiled (PROFILE_MODE=memory, see app/profiling.py).
+Prints the traced (tracemalloc) peak above the start of the run, the process peak
+RSS and the per-stage breakdown. Exits non-zero when the traced peak exceeds
+--max-peak-mb, or the peak RSS exceeds --max-rss-mb (0 = not checked).
+
+The mailbox itself is built before the run starts, so the peak is what the pipeline
+allocates: fetched payloads, decoded bodies, PDF text, parse trees, ORM rows. The
+OpenAI stand-in runs in-process and its few KiB per request are counted too.
+"""
+import argparse, glob, os, sys, tempfile, time
+
+from benchmarks.bench_pipeline import _peak_rss_mb, seed_families
+from benchmarks.fakes import FakeGmail, OpenAIStandIn, synthetic_mailbox
+
+
+def run(emails, pdf_every, body_bytes, pdf_lines, max_peak_mb, max_rss_mb) -> bool:
+    stand_in = OpenAIStandIn().start()
+    tmp = tempfile.TemporaryDirectory()
+    # app modules read these at import time
+    os.environ.update({
+        "OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": stand_in.url,
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp.name, 'bench.db')}",
+        "PROFILE_FAMILIES": "*", "PROFILE_MODE": "memory", "PROFILE_DIR": os.path.join(tmp.name, "profiles"),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "ERROR"),
+    })
+    os.environ.pop("FORWARD_IMAP_PASS", None)
+    try:
+        from app import db as app_db, ingest_job, profiling
+        from app.digest_runner import run_digest_once
+        from app.models import Base
+
+        Base.metadata.create_all(app_db.engine)
+        fid = seed_families(1)[0]
+        mailbox, files = synthetic_mailbox(emails, body_bytes=body_bytes, pdf_every=pdf_every, pdf_lines=pdf_lines)
+        ingest_job.gmail_service_for_family = lambda db, fid: FakeGmail(mailbox, files, fresh=True)
+        print(f"{emails} emails ({body_bytes} B bodies), {len(files)} PDFs of {pdf_lines} lines, one family")
+
+        t0 = time.perf_counter()
+        sent, msg, metrics = run_digest_once(fid)
+        wall = time.perf_counter() - t0
+        peak_mb = profiling.last_profile.memory.peak_bytes / (1024 * 1024)
+
+        rss_mb = _peak_rss_mb()
+        print(f"  run {wall:.2f}s  sent={sent} ({msg})  fetched {metrics.get('emails_fetched')}"
+              f"  points {metrics.get('points_created')}")
+        print(f"  traced peak {peak_mb:7.1f} MiB above run start (ceiling {max_peak_mb:g})")
+        print(f"  peak RSS    {rss_mb:7.1f} MB" + (f" (ceiling {max_rss_mb:g})" if max_rss_mb else ""))
+        for path in glob.glob(os.path.join(tmp.name, "profiles", "*.memory.txt")):
+            print("\n" + open(path, encoding="utf-8").read())
+
+        ok = peak_mb <= max_peak_mb and (not max_rss_mb or rss_mb <= max_rss_mb)
+        print("PASS" if ok else "FAIL: memory ceiling exceeded")
+        return ok
+    finally:
+        stand_in.stop()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--emails", type=int, default=500)
+    ap.add_argument("--pdf-every", type=int, default=10, help="attach a PDF to every Nth message (0 = none)")
+    ap.add_argument("--body-bytes", type=int, default=20000, help="size of each plain/HTML alternative")
+    ap.add_argument("--pdf-lines", type=int, default=400)
+    ap.add_argument("--max-peak-mb", type=float, default=60.0, help="tracemalloc peak ceiling (MiB)")
+    ap.add_argument("--max-rss-mb", type=float, default=0.0, help="peak RSS ceiling (MB, 0 = not checked)")
+    args = ap.parse_args()
+    sys.exit(0 if run(args.emails, args.pdf_every, args.body_bytes, args.pdf_lines, args.max_peak_mb,
+                      args.max_rss_mb) else 1)
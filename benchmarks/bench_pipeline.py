@@ -0,0 +1,165 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end digest pipeline benchmark against local stand-ins (benchmarks/fakes.py).
+
+    pip install aiosmtpd
+    python -m benchmarks.bench_pipeline --families 10 100 1000 --emails 20 --llm-latency 0.05
+
+For each scale, seeds that many families and drives the whole pipeline:
+    runner  run_digest_once per family (--workers threads), then drain_outbox
+    tick    scheduler.tick(force=True): the production path, serial per family
+
+Gmail is an in-memory FakeGmail (--gmail-latency, --body-bytes, --pdf-every, or a
+--mailbox fixture written by benchmarks/gen_data.py),
+OpenAI an HTTP stand-in with log-normal latency (--llm-latency median, --llm-sigma),
+SMTP an aiosmtpd sink. Reports families/min, p50/p95 per-family latency, peak RSS
+and DB queries (total and per family).
+"""
+import argparse, os, resource, statistics, sys, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeGmail, OpenAIStandIn, SmtpSink, load_mailbox, lognormal, synthetic_mailbox
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KiB on Linux
+
+
+class QueryCounter:
+    """Counts statements per thread, so a family's run can be attributed while others run."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.total = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args, **kw):
+        self._local.n = getattr(self._local, "n", 0) + 1
+        with self._lock:
+            self.total += 1
+
+    def thread_count(self) -> int:
+        return getattr(self._local, "n", 0)
+
+
+def _env(stand_in: OpenAIStandIn, sink: SmtpSink, db_url: str):
+    # app modules read these at import time
+    os.environ.update({
+        "OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": stand_in.url, "DATABASE_URL": db_url,
+        "SMTP_HOST": sink.host, "SMTP_PORT": str(sink.port), "SMTP_USERNAME": "bench@example.com",
+        "SMTP_PASSWORD": "bench", "SMTP_STARTTLS": "0", "LOG_LEVEL": os.getenv("LOG_LEVEL", "ERROR"),
+    })
+    os.environ.pop("FORWARD_IMAP_PASS", None)
+
+
+def seed_families(n: int, domain: str = "school.org"):
+    from app.db import session_scope
+    from app.models import DigestPreference, Family, ProviderAccount, User
+    ids = []
+    with session_scope() as db:
+        for i in range(n):
+            user = User(email=f"parent{i}@example.com"); db.add(user); db.flush()
+            fam = Family(owner_user_id=user.id, display_name=f"Family {i}"); db.add(fam); db.flush()
+            db.add(DigestPreference(family_id=fam.id, to_addresses=user.email, school_domains=domain,
+                                    cadence="weekly"))
+            db.add(ProviderAccount(user_id=user.id, provider="google", token_json_enc="bench"))
+            ids.append(fam.id)
+    return ids
+
+
+def _report(label, families, wall, latencies, queries, sink_before, sink, stand_in_before, stand_in):
+    print(f"  {label:<7} {families:5d} families in {wall:7.2f}s -> {families / wall * 60:8.1f} families/min"
+          f"  p50 {_pct(latencies, 50) * 1000:7.1f} ms  p95 {_pct(latencies, 95) * 1000:7.1f} ms"
+          f"  peak RSS {_peak_rss_mb():7.1f} MB")
+    print(f"          {queries} queries ({queries / max(families, 1):.1f}/family)"
+          f"  LLM requests {stand_in.requests - stand_in_before}  emails delivered {sink.count - sink_before}")
+
+
+def run(scales, emails, workers, gmail_latency, llm_latency, llm_sigma, body_bytes, pdf_every, modes, db_url=None,
+        mailbox_path=None):
+    stand_in = OpenAIStandIn(lognormal(llm_latency, llm_sigma)).start()
+    sink = SmtpSink().start()
+    tmp = tempfile.TemporaryDirectory()
+    _env(stand_in, sink, db_url or f"sqlite:///{os.path.join(tmp.name, 'bench.db')}")
+    try:
+        from app import db as app_db, ingest_job, scheduler
+        from app.digest_runner import run_digest_once
+        from app.models import Base
+        from app.outbox import drain_outbox
+
+        counter = QueryCounter(app_db.engine)
+        if mailbox_path:
+            mailbox, files = load_mailbox(mailbox_path)
+            source = f"{len(mailbox)} emails/family from {mailbox_path}"
+        else:
+            mailbox, files = synthetic_mailbox(emails, body_bytes=body_bytes, pdf_every=pdf_every)
+            source = f"{emails} emails/family ({body_bytes} B bodies, PDF every {pdf_every or '-'})"
+        ingest_job.gmail_service_for_family = lambda db, fid: FakeGmail(mailbox, files, gmail_latency)
+
+        print(f"{source}, Gmail {gmail_latency * 1000:.0f} ms,"
+              f" LLM median {llm_latency * 1000:.0f} ms (sigma {llm_sigma}), {workers} workers, {app_db.engine.dialect.name}")
+        for n in scales:
+            for mode in modes:
+                Base.metadata.drop_all(app_db.engine)
+                Base.metadata.create_all(app_db.engine)
+                fids = seed_families(n)
+                latencies, per_family_queries = [], []
+                sent0, req0, q0 = sink.count, stand_in.requests, counter.total
+
+                def one(fid, run=run_digest_once):
+                    c0, t0 = counter.thread_count(), time.perf_counter()
+                    out = run(fid)
+                    latencies.append(time.perf_counter() - t0)
+                    per_family_queries.append(counter.thread_count() - c0)
+                    return out
+
+                t0 = time.perf_counter()
+                if mode == "runner":
+                    with ThreadPoolExecutor(max_workers=workers) as ex:
+                        list(ex.map(one, fids))
+                    drain_outbox(limit=n)
+                else:
+                    real = scheduler.run_digest_for_family
+                    scheduler.run_digest_for_family = lambda fid: one(fid, real)
+                    try:
+                        scheduler.tick(force=True)
+                    finally:
+                        scheduler.run_digest_for_family = real
+                wall = time.perf_counter() - t0
+                _report(mode, n, wall, latencies, counter.total - q0, sent0, sink, req0, stand_in)
+                if per_family_queries:
+                    print(f"          per-family queries p50 {statistics.median(per_family_queries):.0f}"
+                          f"  max {max(per_family_queries)}")
+    finally:
+        stand_in.stop()
+        sink.stop()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--families", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--emails", type=int, default=20, help="messages per family mailbox")
+    ap.add_argument("--workers", type=int, default=4, help="runner mode threads")
+    ap.add_argument("--gmail-latency", type=float, default=0.01, help="seconds per Gmail request")
+    ap.add_argument("--llm-latency", type=float, default=0.05, help="median seconds per completion")
+    ap.add_argument("--llm-sigma", type=float, default=0.5, help="log-normal spread (0 = constant)")
+    ap.add_argument("--body-bytes", type=int, default=4000)
+    ap.add_argument("--pdf-every", type=int, default=10, help="attach a PDF to every Nth message (0 = none)")
+    ap.add_argument("--mailbox", default=None, help="gen_data fixture (family_<id>.json.gz) served to every family")
+    ap.add_argument("--mode", choices=("runner", "tick", "both"), default="both")
+    ap.add_argument("--db-url", default=None, help="defaults to a temp SQLite file (tables are dropped per scale)")
+    args = ap.parse_args()
+    run(args.families, args.emails, args.workers, args.gmail_latency, args.llm_latency, args.llm_sigma,
+        args.body_bytes, args.pdf_every, ("runner", "tick") if args.mode == "both" else (args.mode,), args.db_url,
+        args.mailbox)
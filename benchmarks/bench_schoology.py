@@ -0,0 +1,117 @@
+# benchmarks/bench_schoology.py
+"""
+Schoology persistence benchmark: store_items + materialize at N items per family.
+
+    python -m benchmarks.bench_schoology --items 5000 --families 3
+
+Compares the set-based implementation in app.schoology with the original
+per-item SELECT / per-row existence-check loop (kept below as `legacy_*`).
+"""
+import argparse, json, os, tempfile, time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, User, Family, ProviderAccount, SchoologyItem, OneLiner
+from app.schoology import store_items, materialize_schoology_items_as_oneliners, _parse_dt
+
+
+def legacy_store_items(db, family_id, pa, items, item_type, course_title):
+    created = 0
+    for it in items:
+        sid = str(it.get('id') or '')
+        existing = db.query(SchoologyItem).filter_by(family_id=family_id, schoology_id=sid).first()
+        due_ts = _parse_dt(str(it.get('due')) if it.get('due') else str(it.get('start')))
+        title = it.get('title') or '(Untitled)'
+        if existing:
+            existing.title = title[:500]
+            existing.due_at = due_ts
+            existing.updated_at = datetime.utcnow()
+            db.add(existing)
+            continue
+        db.add(SchoologyItem(family_id=family_id, provider_account_id=pa.id, schoology_id=sid,
+                             item_type=item_type, title=title[:500], due_at=due_ts,
+                             course_title=course_title, raw_json=json.dumps(it)[:10000]))
+        created += 1
+    db.commit()
+    return created
+
+
+def legacy_materialize(db, family_id):
+    created = 0
+    for r in db.query(SchoologyItem).filter_by(family_id=family_id).all():
+        source_id = f"sch_{r.schoology_id}"[:128]
+        if db.query(OneLiner).filter_by(family_id=family_id, source_msg_id=source_id).first():
+            continue
+        db.add(OneLiner(family_id=family_id, source_msg_id=source_id, one_liner=r.title, when_ts=r.due_at,
+                        date_string=r.due_at.strftime('%Y-%m-%d') if r.due_at else None, domain='schoology.com'))
+        created += 1
+    db.commit()
+    return created
+
+
+def _items(n: int, family_idx: int):
+    # Spread due dates over ~2 school years so most are outside the materialize window.
+    now = int(time.time())
+    return [{
+        "id": f"{family_idx}{i:07d}",
+        "title": f"Assignment {i}",
+        "description": "Read chapter and answer questions. " * 8,
+        "due": str(now - 86400 * 600 + (i * 86400 * 700) // n),
+    } for i in range(n)]
+
+
+def _setup(url: str, families: int):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    counter = {"n": 0}
+    event.listen(engine, "before_cursor_execute", lambda *a, **k: counter.__setitem__("n", counter["n"] + 1))
+    db = sessionmaker(bind=engine)()
+    out = []
+    for f in range(families):
+        u = User(email=f"bench{f}@example.com"); db.add(u); db.commit()
+        fam = Family(owner_user_id=u.id); db.add(fam); db.commit()
+        pa = ProviderAccount(user_id=u.id, provider="schoology"); db.add(pa); db.commit()
+        out.append((fam.id, pa))
+    return engine, db, counter, out
+
+
+def _timed(label, counter, fn):
+    counter["n"] = 0
+    t0 = time.perf_counter()
+    result = fn()
+    dt = time.perf_counter() - t0
+    print(f"  {label:<28} {dt * 1000:9.1f} ms  {counter['n']:6d} queries  -> {result}")
+    return dt
+
+
+def run(items: int, families: int, db_url: str = None):
+    for impl in ("legacy", "set-based"):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = db_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            engine, db, counter, fams = _setup(url, families)
+            store = legacy_store_items if impl == "legacy" else store_items
+            mat = legacy_materialize if impl == "legacy" else materialize_schoology_items_as_oneliners
+            print(f"[{impl}] {families} families x {items} items ({engine.dialect.name})")
+            total = 0.0
+            for idx, (fid, pa) in enumerate(fams):
+                data = _items(items, idx)
+                total += _timed(f"store_items (insert) f{fid}", counter, lambda: store(db, fid, pa, data, "assignment", "Math"))
+                total += _timed(f"store_items (update) f{fid}", counter, lambda: store(db, fid, pa, data, "assignment", "Math"))
+                total += _timed(f"materialize (first) f{fid}", counter, lambda: mat(db, fid))
+                total += _timed(f"materialize (steady) f{fid}", counter, lambda: mat(db, fid))
+            print(f"  total {total:.2f}s\n")
+            db.close()
+            if db_url:
+                Base.metadata.drop_all(engine)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=5000)
+    ap.add_argument("--families", type=int, default=1)
+    ap.add_argument("--db-url", default=None, help="defaults to a temp SQLite file (Postgres: dropped after)")
+    args = ap.parse_args()
+    run(args.items, args.families, args.db_url)
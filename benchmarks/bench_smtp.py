@@ -0,0 +1,97 @@
+# benchmarks/bench_smtp.py
+"""
+SMTP send throughput: one connection + LOGIN per message vs the pooled sender.
+
+    pip install aiosmtpd
+    python -m benchmarks.bench_smtp --messages 300 --auth-delay 0.05 --workers 4
+
+Runs a local aiosmtpd stand-in (AUTH LOGIN/PLAIN over plain TCP) and reports
+messages/second. --auth-delay makes each LOGIN cost what it does against a real
+provider (TLS + auth round-trips are ~50-300 ms to Gmail).
+"""
+import argparse, logging, smtplib, socket, time, warnings
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from app.emailer import SMTPPool
+
+warnings.filterwarnings("ignore", message="Session.login_data is deprecated")
+logging.getLogger("mail.log").setLevel(logging.ERROR)
+
+
+class _Sink:
+    def __init__(self):
+        self.count = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.count += 1
+        return "250 OK"
+
+
+def _authenticator(delay: float):
+    def check(server, session, envelope, mechanism, auth_data):
+        time.sleep(delay)  # runs on the server loop, like a slow remote LOGIN
+        return AuthResult(success=True)
+    return check
+
+
+def _message(i: int) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = f"Digest {i}"
+    msg["From"] = "SchoolBrief <bench@example.com>"
+    msg["To"] = f"family{i}@example.com"
+    msg.set_content("This week: field trip Friday, bring lunch.\n" * 40)
+    msg.add_alternative("<p>This week: field trip Friday, bring lunch.</p>" * 40, subtype="html")
+    return msg
+
+
+def send_unpooled(host, port, msg):
+    # what emailer.send_email did before: connect, EHLO, LOGIN, send, QUIT per message
+    with smtplib.SMTP(host, port, timeout=20) as server:
+        server.ehlo()
+        server.login("bench", "secret")
+        server.send_message(msg)
+
+
+def _run(label, n, workers, send):
+    msgs = [_message(i) for i in range(n)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(send, msgs))
+    dt = time.perf_counter() - t0
+    print(f"  {label:<10} {n} msgs in {dt:6.2f}s  -> {n / dt:8.1f} msg/s")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run(messages: int, auth_delay: float, workers: int):
+    sink = _Sink()
+    host, port = "127.0.0.1", _free_port()
+    ctl = Controller(sink, hostname=host, port=port, authenticator=_authenticator(auth_delay),
+                     auth_require_tls=False)
+    ctl.start()
+    try:
+        print(f"{messages} messages, {workers} sender threads, LOGIN delay {auth_delay * 1000:.0f} ms")
+        _run("unpooled", messages, workers, lambda m: send_unpooled(host, port, m))
+        pool = SMTPPool(host, port, "bench", "secret", starttls=False, size=workers)
+        _run("pooled", messages, workers, pool.send)
+        pool.close()
+        print(f"  pooled logins: {pool.connects}; messages received: {sink.count}")
+    finally:
+        ctl.stop()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=300)
+    ap.add_argument("--auth-delay", type=float, default=0.05)
+    ap.add_argument("--workers", type=int, default=2)
+    args = ap.parse_args()
+    run(args.messages, args.auth_delay, args.workers)
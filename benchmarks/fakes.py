@@ -0,0 +1,320 @@
+# benchmarks/fakes.py
+"""
+Local stand-ins for the services the digest pipeline talks to, for benchmarks.
+
+    FakeGmail       the subset of the Gmail API client the pipeline uses
+                    (messages.list/get, messages.attachments.get) over an in-memory
+                    mailbox, with a configurable per-request latency
+    gmail_message   builds one message payload (plain/HTML alternatives, optional PDF)
+    synthetic_mailbox
+                    a seeded week of school email: plain/HTML bodies of a chosen size,
+                    and a small PDF attached to every Nth message
+    save_mailbox / load_mailbox
+                    mailbox fixtures on disk (gzipped JSON), e.g. from benchmarks/gen_data.py
+    OpenAIStandIn   an OpenAI-compatible HTTP server (/v1/models, /v1/chat/completions)
+                    with log-normal response latency; point OPENAI_BASE_URL at .url
+    SmtpSink        an aiosmtpd server that accepts AUTH and counts delivered messages
+
+Nothing here touches the network beyond 127.0.0.1.
+"""
+import base64
+import gzip
+import json
+import math
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+Latency = Union[float, Callable[[], float]]
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def _sleep(latency: Latency):
+    s = latency() if callable(latency) else latency
+    if s > 0:
+        time.sleep(s)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---- Gmail ----
+
+class _Request:
+    def __init__(self, fn, latency: Latency, counter: Dict[str, int], kind: str):
+        self.fn, self.latency, self.counter, self.kind = fn, latency, counter, kind
+
+    def execute(self, num_retries=0):
+        _sleep(self.latency)
+        self.counter[self.kind] = self.counter.get(self.kind, 0) + 1
+        return self.fn()
+
+
+class FakeGmail:
+    """gmail_service_for_family() replacement: service.users().messages().list/get/attachments()."""
+
+    def __init__(self, messages: Dict[str, dict], attachments: Optional[Dict[Tuple[str, str], str]] = None,
+                 latency: Latency = 0.0, fresh: bool = False):
+        self.inbox, self.files, self.latency = messages, attachments or {}, latency
+        self.fresh = fresh   # each get() parses its own copy, as the real client does (memory benchmarks)
+        self.calls: Dict[str, int] = {}
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def attachments(self):
+        return _Attachments(self)
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None, **kw):
+        ids = list(self.inbox)
+        start = int(pageToken or 0)
+        page = ids[start:start + maxResults]
+        more = start + maxResults < len(ids)
+
+        def result():
+            return {"messages": [{"id": i} for i in page], **({"nextPageToken": str(start + maxResults)} if more else {})}
+        return _Request(result, self.latency, self.calls, "list")
+
+    def get(self, userId, id, format="full", **kw):
+        if self.fresh:
+            raw = json.dumps(self.inbox[id])
+            return _Request(lambda: json.loads(raw), self.latency, self.calls, "get")
+        return _Request(lambda: self.inbox[id], self.latency, self.calls, "get")
+
+
+class _Attachments:
+    def __init__(self, gmail: FakeGmail):
+        self.gmail = gmail
+
+    def get(self, userId, messageId, id, **kw):
+        return _Request(lambda: {"data": self.gmail.files[(messageId, id)]}, self.gmail.latency,
+                        self.gmail.calls, "attachment")
+
+
+def make_pdf(lines: List[str]) -> bytes:
+    """A minimal single-page PDF with one text line per entry (enough for pdfminer)."""
+    text = "BT /F1 11 Tf 50 750 Td 14 TL " + " ".join(
+        "(%s) '" % ln.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for ln in lines) + " ET"
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(text), text.encode("latin-1", "replace")),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+_TOPICS = ["field trip to the science museum", "picture day", "math quiz on fractions", "band concert",
+           "parent-teacher conferences", "early dismissal", "book fair", "soccer practice", "spelling test",
+           "library books due", "class party", "science fair projects due"]
+_FILLER = ("Thank you for a wonderful week in our classroom. Students have been working hard on "
+           "their reading goals and we are proud of their progress. ")
+
+
+def gmail_message(mid: str, headers: List[Tuple[str, str]], *, plain: Optional[str] = None,
+                  html: Optional[str] = None, pdf: Optional[bytes] = None, pdf_name: str = "attachment.pdf"
+                  ) -> Tuple[dict, Dict[Tuple[str, str], str]]:
+    """One Gmail API "full" message (+ its attachment bodies, which Gmail serves separately)."""
+    parts = []
+    if plain is not None:
+        parts.append({"mimeType": "text/plain", "body": {"data": _b64(plain.encode())}})
+    if html is not None:
+        parts.append({"mimeType": "text/html", "body": {"data": _b64(html.encode())}})
+    payload = {"mimeType": "multipart/alternative", "parts": parts}
+    files = {}
+    if pdf is not None:
+        att_id = f"att{mid}"
+        files[(mid, att_id)] = _b64(pdf)
+        payload = {"mimeType": "multipart/mixed", "parts": [
+            payload, {"mimeType": "application/pdf", "filename": pdf_name,
+                      "body": {"attachmentId": att_id, "size": len(pdf)}}]}
+    payload["headers"] = [{"name": k, "value": v} for k, v in headers]
+    snippet = (plain or html or "")[:100]
+    return {"id": mid, "threadId": mid, "labelIds": ["INBOX"], "snippet": snippet, "payload": payload}, files
+
+
+def synthetic_mailbox(emails: int, *, body_bytes: int = 4000, pdf_every: int = 10, pdf_lines: int = 40,
+                      domain: str = "school.org", seed: int = 1, now: Optional[datetime] = None
+                      ) -> Tuple[Dict[str, dict], Dict[Tuple[str, str], str]]:
+    """
+    A week of school mail as Gmail API "full" payloads: {id: message}, {(id, attachment id): base64}.
+    Every message has text/plain + text/html alternatives of about body_bytes each;
+    every pdf_every-th one (0 = none) also carries a PDF attachment.
+    """
+    rnd = random.Random(seed)
+    now = now or datetime.now()
+    messages, files = {}, {}
+    for i in range(emails):
+        mid = f"{seed:x}{i:07x}"
+        topic = rnd.choice(_TOPICS)
+        when = now + timedelta(days=rnd.randint(1, 21))
+        lines = [f"Reminder: {topic} on {when:%B} {when.day} at {rnd.randint(8, 15)}:{rnd.choice(['00', '30'])}."]
+        while sum(len(ln) for ln in lines) < body_bytes:
+            lines.append(_FILLER)
+        sent = now - timedelta(hours=rnd.randint(1, 24 * 7))
+        headers = [("From", f"Teacher {i % 17} <teacher{i % 17}@{domain}>"), ("To", "parent@example.com"),
+                   ("Subject", f"Week {i}: {topic}"), ("Date", format_datetime(sent)),
+                   ("Message-ID", f"<{mid}@{domain}>")]
+        pdf = None
+        if pdf_every and i % pdf_every == 0:
+            pdf = make_pdf([f"Newsletter {i}: {rnd.choice(_TOPICS)} on {when:%m/%d}."] * pdf_lines)
+        messages[mid], att = gmail_message(
+            mid, headers, plain="\n".join(lines),
+            html="<html><body>" + "".join(f"<p>{ln}</p>" for ln in lines) + "</body></html>",
+            pdf=pdf, pdf_name=f"newsletter{i}.pdf")
+        files.update(att)
+    return messages, files
+
+
+def save_mailbox(path: str, messages: Dict[str, dict], attachments: Dict[Tuple[str, str], str]):
+    doc = {"messages": messages, "attachments": [[m, a, data] for (m, a), data in attachments.items()]}
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(doc, f)
+
+
+def load_mailbox(path: str) -> Tuple[Dict[str, dict], Dict[Tuple[str, str], str]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        doc = json.load(f)
+    return doc["messages"], {(m, a): data for m, a, data in doc["attachments"]}
+
+
+# ---- OpenAI ----
+
+def lognormal(median: float, sigma: float, seed: int = 1) -> Callable[[], float]:
+    """Latency sampler: log-normal around `median` seconds (sigma 0 = constant)."""
+    rnd = random.Random(seed)
+    lock = threading.Lock()
+    mu = math.log(median) if median > 0 else 0.0
+
+    def sample() -> float:
+        if median <= 0:
+            return 0.0
+        with lock:
+            return rnd.lognormvariate(mu, sigma) if sigma > 0 else median
+    return sample
+
+
+class OpenAIStandIn:
+    """
+    Answers every chat completion with one JSON object that satisfies both prompts:
+    "points" for summarize_email_to_points, subject/html/text for the digest render.
+    """
+
+    def __init__(self, latency: Latency = 0.0, points: int = 2):
+        self.latency, self.points = latency, points
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", free_port()), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="openai-stand-in", daemon=True)
+
+    def completion(self) -> dict:
+        day = (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d")
+        content = {
+            "points": [{"one_liner": f"Bring item {i} to school", "when_iso": "", "date_string": day,
+                        "time_string": "8:30 AM"} for i in range(self.points)],
+            "subject": "SchoolBrief — Weekly School Digest",
+            "html": "<h2>This week</h2><ul><li>Bring lunch</li></ul>",
+            "text": "This week\n- Bring lunch",
+        }
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+            "model": "gpt-4.1-mini",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(content)}}],
+            "usage": {"prompt_tokens": 900, "completion_tokens": 120, "total_tokens": 1020,
+                      "prompt_tokens_details": {"cached_tokens": 0}},
+        }
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, obj):
+                body = json.dumps(obj).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._json({"object": "list", "data": [{"id": "gpt-4.1-mini", "object": "model"}]})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                _sleep(stand_in.latency)
+                with stand_in._lock:
+                    stand_in.requests += 1
+                self._json(stand_in.completion())
+
+        return Handler
+
+    def start(self) -> "OpenAIStandIn":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ---- SMTP ----
+
+class SmtpSink:
+    """aiosmtpd on a free local port; any AUTH succeeds. Needs `pip install aiosmtpd`."""
+
+    def __init__(self):
+        self.count = 0
+        self.host, self.port = "127.0.0.1", free_port()
+        self._controller = None
+
+    async def handle_DATA(self, server, session, envelope):
+        self.count += 1
+        return "250 OK"
+
+    def start(self) -> "SmtpSink":
+        import logging
+        import warnings
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.smtp import AuthResult
+
+        warnings.filterwarnings("ignore", message="Session.login_data is deprecated")
+        logging.getLogger("mail.log").setLevel(logging.ERROR)
+        self._controller = Controller(self, hostname=self.host, port=self.port, auth_require_tls=False,
+                                      authenticator=lambda *a: AuthResult(success=True))
+        self._controller.start()
+        return self
+
+    def stop(self):
+        if self._controller is not None:
+            self._controller.stop()
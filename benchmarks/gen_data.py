@@ -0,0 +1,273 @@
+# benchmarks/gen_data.py
+"""
+Synthetic tenants, history and mailboxes for scale testing.
+
+    python -m benchmarks.gen_data --families 5000 --months 6 --seed 7 \
+        --db-url sqlite:///scale.db --mailbox-dir fixtures/scale
+
+Deterministic for a given --seed and --anchor (default: today). Writes:
+
+    database     users, families, digest_prefs (mixed timezones, daily/weekly cadences,
+                 send times, shared school domains), Google + some Schoology provider
+                 accounts, and --months of history before the anchor: processed_emails,
+                 one_liners (with the typed event columns), schoology_items, digest_runs
+    mailboxes    for the first --mailbox-families families, <dir>/family_<id>.json.gz with
+                 the week before the anchor as Gmail API payloads (plain notes, HTML-only
+                 newsletters, forwarded notices, PDFs); load with benchmarks.fakes.load_mailbox
+    forwarded    <dir>/forwarded/NNNNN.eml: parents forwarding a school email (as
+                 message/rfc822) to the forwarding inbox, for the IMAP domain scan
+
+Tables must be empty or absent (they are created); the run does not delete anything.
+"""
+import argparse, hashlib, os, random, time
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+from email.utils import format_datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.event_time import event_fields
+from app.models import (Base, DigestPreference, DigestRun, Family, OneLiner, ProcessedEmail, ProviderAccount,
+                        SchoologyItem, User)
+from benchmarks.fakes import gmail_message, make_pdf, save_mailbox
+
+BATCH = 5000
+
+TIMEZONES = [("America/Los_Angeles", 30), ("America/Denver", 8), ("America/Chicago", 20),
+             ("America/New_York", 35), ("America/Phoenix", 3), ("Pacific/Honolulu", 1), ("Europe/London", 2),
+             ("Asia/Singapore", 1)]
+SEND_TIMES = ["06:00", "06:30", "07:00", "07:00", "07:30", "08:00", "18:00", "20:00"]
+VENDOR_DOMAINS = ["parentsquare.com", "schoology.com", "seesaw.me", "remind.com", "classdojo.com",
+                  "konstella.com", "smore.com"]
+EVENTS = ["Field trip to the science museum", "Picture day", "Math quiz on fractions", "Band concert",
+          "Parent-teacher conferences", "Early dismissal", "Book fair", "Soccer practice", "Spelling test",
+          "Library books due", "Class party", "Science fair projects due", "Minimum day", "PTA meeting",
+          "Flu shot clinic", "Spirit week: pajama day", "Reading log due", "Walk-a-thon"]
+ASSIGNMENTS = ["Chapter 4 worksheet", "Lab report", "Vocabulary quiz", "Book report draft", "Unit test",
+               "Poster project", "Fractions practice", "Essay outline"]
+_FILLER = ("We had a busy and joyful week. Thank you to all the families who volunteered and "
+           "helped make our classroom a great place to learn. ")
+
+
+def _weighted(rnd: random.Random, pairs):
+    items, weights = zip(*pairs)
+    return rnd.choices(items, weights=weights, k=1)[0]
+
+
+def _school_domains(n: int) -> List[Tuple[str, int]]:
+    # Zipf-ish popularity: a few big districts, a long tail of small schools
+    return [(f"school{i}.k12.example.org", max(1, 400 // (i + 1))) for i in range(max(10, n // 20))]
+
+
+def _time_string(rnd: random.Random):
+    if rnd.random() < 0.4:
+        return None
+    h = rnd.choice([8, 9, 10, 12, 13, 14, 15, 18, 19])
+    return f"{(h - 1) % 12 + 1}:{rnd.choice(['00', '15', '30'])} {'AM' if h < 12 else 'PM'}"
+
+
+class Generator:
+    def __init__(self, seed: int, anchor: datetime, months: int, emails_per_week: int):
+        self.rnd = random.Random(seed)
+        self.seed, self.anchor, self.months, self.emails_per_week = seed, anchor, months, emails_per_week
+        self.domains = None
+
+    def tenants(self, db, families: int) -> List[dict]:
+        """Users, families, prefs and provider accounts (ORM, so the family index hooks run)."""
+        rnd, out = self.rnd, []
+        self.domains = _school_domains(families)
+        for i in range(families):
+            user = User(email=f"parent{i:06d}@example.com", name=f"Parent {i}",
+                        created_at=self.anchor - timedelta(days=rnd.randint(30, 30 * self.months + 60)))
+            db.add(user); db.flush()
+            fam = Family(owner_user_id=user.id, display_name=f"The {rnd.choice('ABCDEFGHJKLMNPRSTW')}. family")
+            db.add(fam); db.flush()
+            domains = {_weighted(rnd, self.domains) for _ in range(rnd.randint(1, 2))}
+            domains |= set(rnd.sample(VENDOR_DOMAINS, rnd.randint(0, 2)))
+            daily = rnd.random() < 0.3
+            recipients = [user.email] + ([f"coparent{i:06d}@example.com"] if rnd.random() < 0.35 else [])
+            db.add(DigestPreference(
+                family_id=fam.id, cadence="daily" if daily else "weekly",
+                send_time_local=rnd.choice(SEND_TIMES), timezone=_weighted(rnd, TIMEZONES),
+                days_of_week=None if daily else ",".join(sorted(rnd.sample("0123456", rnd.randint(1, 2)))),
+                school_domains=",".join(sorted(domains)), to_addresses=",".join(recipients),
+                detail_level=rnd.choice(["full", "full", "focused"]),
+            ))
+            google = ProviderAccount(user_id=user.id, provider="google", email_on_provider=user.email,
+                                     token_json_enc="synthetic")
+            db.add(google)
+            schoology = None
+            if rnd.random() < 0.3:
+                schoology = ProviderAccount(user_id=user.id, provider="schoology", token_json_enc="synthetic")
+                db.add(schoology)
+            db.flush()
+            out.append({"family_id": fam.id, "daily": daily, "domains": sorted(domains), "email": user.email,
+                        "schoology_pa": schoology.id if schoology else None})
+            if i % 500 == 499:
+                db.commit()
+        db.commit()
+        return out
+
+    def history(self, t: dict):
+        """Rows per table for one family's --months of history, ending at the anchor."""
+        rnd, fid = self.rnd, t["family_id"]
+        rows: Dict[type, List[dict]] = {ProcessedEmail: [], OneLiner: [], SchoologyItem: [], DigestRun: []}
+        start = self.anchor - timedelta(days=30 * self.months)
+        weeks = (self.anchor - start).days // 7
+        for w in range(weeks):
+            week0 = start + timedelta(weeks=w)
+            for e in range(max(0, int(rnd.gauss(self.emails_per_week, self.emails_per_week / 4)))):
+                at = week0 + timedelta(seconds=rnd.randint(0, 7 * 86400))
+                mid = f"{fid:x}w{w:03d}e{e:03d}"
+                subject = f"{rnd.choice(EVENTS)} - week of {week0:%b %d}"
+                rows[ProcessedEmail].append({
+                    "family_id": fid, "gmail_msg_id": mid, "subject": subject, "processed_at": at,
+                    "content_hash": hashlib.sha256(f"{self.seed}:{mid}".encode()).hexdigest()})
+                for p in range(rnd.choice([0, 1, 1, 2, 2, 3])):
+                    ev = at + timedelta(days=rnd.randint(-2, 21))
+                    ds = ev.strftime("%Y-%m-%d") if rnd.random() < 0.85 else None
+                    ts = _time_string(rnd) if ds else None
+                    rows[OneLiner].append({
+                        "family_id": fid, "source_msg_id": mid, "created_at": at,
+                        "one_liner": f"{rnd.choice(EVENTS)}{' - bring a water bottle' if p else ''}",
+                        "date_string": ds, "time_string": ts, "domain": rnd.choice(t["domains"]),
+                        **event_fields(ds, ts)})
+            if t["schoology_pa"]:
+                for a in range(rnd.randint(2, 6)):
+                    due = week0 + timedelta(days=rnd.randint(0, 10), hours=23, minutes=59)
+                    rows[SchoologyItem].append({
+                        "family_id": fid, "provider_account_id": t["schoology_pa"],
+                        "schoology_id": f"{fid}{w:03d}{a:02d}", "item_type": rnd.choice(["assignment", "event"]),
+                        "title": rnd.choice(ASSIGNMENTS), "due_at": due, "course_title": rnd.choice(["Math", "ELA", "Science"]),
+                        "created_at": week0, "updated_at": week0})
+            for d in (range(7) if t["daily"] else [rnd.randint(0, 6)]):
+                began = week0 + timedelta(days=d, hours=14, seconds=rnd.randint(0, 1800))
+                ok = rnd.random() < 0.96
+                rows[DigestRun].append({
+                    "family_id": fid, "started_at": began, "ended_at": began + timedelta(seconds=rnd.uniform(5, 90)),
+                    "cadence": "daily" if t["daily"] else "weekly", "messages_scanned": rnd.randint(0, 40),
+                    "items_found": rnd.randint(0, 25), "email_sent": ok,
+                    "error": None if ok else rnd.choice(["No one-liners to include.", "LLM returned empty content."])})
+        return rows
+
+    def mailbox(self, t: dict):
+        """The week before the anchor as Gmail payloads: notes, newsletters, forwards, PDFs."""
+        rnd, fid = self.rnd, t["family_id"]
+        messages, files = {}, {}
+        for i in range(self.emails_per_week):
+            mid = f"{fid:x}m{i:04x}"
+            domain = rnd.choice(t["domains"])
+            sender = f"{rnd.choice(['Ms. Lee', 'Mr. Diaz', 'Principal Ng', 'Coach Ray'])} <staff{i % 9}@{domain}>"
+            when = self.anchor + timedelta(days=rnd.randint(1, 20))
+            event = rnd.choice(EVENTS)
+            sent = self.anchor - timedelta(minutes=rnd.randint(10, 7 * 1440))
+            headers = [("From", sender), ("To", t["email"]), ("Date", format_datetime(sent)),
+                       ("Message-ID", f"<{mid}@{domain}>")]
+            kind = rnd.choices(["note", "newsletter", "forward", "pdf"], weights=[50, 25, 10, 15])[0]
+            ts = _time_string(rnd)
+            line = f"{event} is on {when:%A, %B} {when.day}" + (f" at {ts}." if ts else ".")
+            if kind == "note":
+                msg, att = gmail_message(mid, headers + [("Subject", event)],
+                                         plain=f"Hi families,\n\n{line}\n\n{_FILLER * rnd.randint(1, 4)}")
+            elif kind == "newsletter":
+                items = "".join(f"<li><b>{rnd.choice(EVENTS)}</b> - {(when + timedelta(days=k)):%m/%d}</li>"
+                                for k in range(rnd.randint(4, 12)))
+                html = (f"<html><body><table><tr><td><h1>Weekly Newsletter</h1><p>{_FILLER * 3}</p>"
+                        f"<h2>Upcoming Events</h2><ul><li>{line}</li>{items}</ul>"
+                        f"<h2>Reminders</h2><p>{_FILLER}</p></td></tr></table></body></html>")
+                msg, att = gmail_message(mid, headers + [("Subject", "This week at school")], html=html)
+            elif kind == "forward":
+                body = (f"FYI from the district.\n\n---------- Forwarded message ---------\nFrom: District Office "
+                        f"<news@{domain}>\nDate: {sent:%a, %b %d, %Y}\nSubject: {event}\n\n{line}\n{_FILLER}")
+                msg, att = gmail_message(mid, headers + [("Subject", f"Fwd: {event}")], plain=body)
+            else:
+                pdf = make_pdf([line] + [f"{rnd.choice(EVENTS)} on {(when + timedelta(days=k)):%m/%d}."
+                                         for k in range(rnd.randint(10, 60))])
+                msg, att = gmail_message(mid, headers + [("Subject", "Monthly calendar (PDF)")],
+                                         plain="Please see the attached calendar.", pdf=pdf, pdf_name="calendar.pdf")
+            messages[mid] = msg
+            files.update(att)
+        return messages, files
+
+    def forwarded(self, t: dict, n: int, forward_to: str) -> EmailMessage:
+        """A parent forwarding a school email to the forwarding inbox, original attached as message/rfc822."""
+        domain = self.rnd.choice(t["domains"])
+        original = EmailMessage()
+        original["From"] = f"School Office <office@{domain}>"
+        original["To"] = t["email"]
+        original["Subject"] = self.rnd.choice(EVENTS)
+        original["Date"] = format_datetime(self.anchor - timedelta(days=2))
+        original.set_content(f"{original['Subject']} is next week.\n\n{_FILLER}")
+        fwd = EmailMessage()
+        fwd["From"] = t["email"]
+        fwd["To"] = forward_to
+        fwd["Subject"] = f"Fwd: {original['Subject']}"
+        fwd["Date"] = format_datetime(self.anchor - timedelta(days=1))
+        fwd["Message-ID"] = f"<fwd{n}.{self.seed}@example.com>"
+        fwd.set_content("Please add this school.")
+        fwd.add_attachment(original)
+        return fwd
+
+
+def _flush(engine, rows: Dict[type, List[dict]], force: bool = False):
+    with engine.begin() as conn:
+        for model, batch in rows.items():
+            if batch and (force or len(batch) >= BATCH):
+                conn.execute(insert(model), batch)
+                batch.clear()
+
+
+def run(families: int, months: int, seed: int, db_url: str, mailbox_dir: str, mailbox_families: int,
+        emails_per_week: int, forwarded: int, forward_to: str, anchor: date):
+    t0 = time.perf_counter()
+    engine = create_engine(db_url)
+    Base.metadata.create_all(engine)
+    gen = Generator(seed, datetime.combine(anchor, datetime.min.time()).replace(hour=6), months, emails_per_week)
+
+    db = sessionmaker(bind=engine)()
+    tenants = gen.tenants(db, families)
+    db.close()
+    print(f"{families} families, {sum(1 for t in tenants if t['daily'])} daily, "
+          f"{sum(1 for t in tenants if t['schoology_pa'])} with Schoology  ({time.perf_counter() - t0:.1f}s)")
+
+    totals: Dict[str, int] = {}
+    pending: Dict[type, List[dict]] = {ProcessedEmail: [], OneLiner: [], SchoologyItem: [], DigestRun: []}
+    for t in tenants:
+        for model, batch in gen.history(t).items():
+            pending[model].extend(batch)
+            totals[model.__tablename__] = totals.get(model.__tablename__, 0) + len(batch)
+        _flush(engine, pending)
+    _flush(engine, pending, force=True)
+    print("history: " + ", ".join(f"{k}={v}" for k, v in totals.items()) + f"  ({time.perf_counter() - t0:.1f}s)")
+
+    if mailbox_dir:
+        os.makedirs(os.path.join(mailbox_dir, "forwarded"), exist_ok=True)
+        for t in tenants[:mailbox_families]:
+            messages, files = gen.mailbox(t)
+            save_mailbox(os.path.join(mailbox_dir, f"family_{t['family_id']}.json.gz"), messages, files)
+        for n in range(forwarded):
+            msg = gen.forwarded(tenants[n % len(tenants)], n, forward_to)
+            with open(os.path.join(mailbox_dir, "forwarded", f"{n:05d}.eml"), "wb") as f:
+                f.write(msg.as_bytes())
+        print(f"mailboxes: {min(mailbox_families, len(tenants))} x {emails_per_week} messages, "
+              f"{forwarded} forwarded .eml -> {mailbox_dir}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--families", type=int, default=1000)
+    ap.add_argument("--months", type=int, default=6, help="history length before the anchor")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--anchor", type=date.fromisoformat, default=date.today(), help="YYYY-MM-DD 'now' of the data")
+    ap.add_argument("--db-url", default="sqlite:///./scale.db")
+    ap.add_argument("--emails-per-week", type=int, default=25)
+    ap.add_argument("--mailbox-dir", default=None, help="write Gmail/forwarded fixtures here")
+    ap.add_argument("--mailbox-families", type=int, default=50)
+    ap.add_argument("--forwarded", type=int, default=100, help=".eml forwards to write (with --mailbox-dir)")
+    ap.add_argument("--forward-to", default="addschoolbrief@gmail.com")
+    args = ap.parse_args()
+    run(args.families, args.months, args.seed, args.db_url, args.mailbox_dir, args.mailbox_families,
+        args.emails_per_week, args.forwarded, args.forward_to, args.anchor)
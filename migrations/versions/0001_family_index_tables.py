@@ -0,0 +1,75 @@
+"""family_recipients / family_domains index tables + backfill from CSV
+
+Revision ID: 0001_family_index
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001_family_index"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    # init_db() may already have created these via create_all; only backfill then.
+    if not _has_table("family_recipients"):
+        op.create_table(
+            "family_recipients",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("family_id", sa.Integer, sa.ForeignKey("families.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("email", sa.String(320), nullable=False),
+            sa.UniqueConstraint("family_id", "email", name="uix_family_recipient"),
+        )
+        op.create_index("ix_family_recipients_family_id", "family_recipients", ["family_id"])
+        op.create_index("ix_family_recipients_email", "family_recipients", ["email"])
+    if not _has_table("family_domains"):
+        op.create_table(
+            "family_domains",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("family_id", sa.Integer, sa.ForeignKey("families.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("domain", sa.String(255), nullable=False),
+            sa.UniqueConstraint("family_id", "domain", name="uix_family_domain"),
+        )
+        op.create_index("ix_family_domains_family_id", "family_domains", ["family_id"])
+        op.create_index("ix_family_domains_domain", "family_domains", ["domain"])
+
+    bind = op.get_bind()
+    prefs = sa.table(
+        "digest_prefs",
+        sa.column("family_id", sa.Integer),
+        sa.column("to_addresses", sa.Text),
+        sa.column("school_domains", sa.Text),
+    )
+    recipients = sa.table("family_recipients", sa.column("family_id", sa.Integer), sa.column("email", sa.String))
+    domains = sa.table("family_domains", sa.column("family_id", sa.Integer), sa.column("domain", sa.String))
+
+    bind.execute(sa.delete(recipients))
+    bind.execute(sa.delete(domains))
+    rec_rows, dom_rows = set(), set()
+    for family_id, to_csv, dom_csv in bind.execute(sa.select(prefs.c.family_id, prefs.c.to_addresses, prefs.c.school_domains)):
+        if not family_id:
+            continue
+        for e in (to_csv or "").split(","):
+            if e.strip():
+                rec_rows.add((family_id, e.strip().lower()))
+        for d in (dom_csv or "").split(","):
+            d = d.strip().lstrip("@").lower()
+            if d:
+                dom_rows.add((family_id, d))
+    if rec_rows:
+        op.bulk_insert(recipients, [{"family_id": f, "email": e} for f, e in sorted(rec_rows)])
+    if dom_rows:
+        op.bulk_insert(domains, [{"family_id": f, "domain": d} for f, d in sorted(dom_rows)])
+
+
+def downgrade() -> None:
+    op.drop_table("family_domains")
+    op.drop_table("family_recipients")
@@ -0,0 +1,33 @@
+"""domain_popularity counts, backfilled from family_domains
+
+Revision ID: 0002_domain_popularity
+Revises: 0001_family_index
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002_domain_popularity"
+down_revision = "0001_family_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("domain_popularity"):
+        op.create_table(
+            "domain_popularity",
+            sa.Column("domain", sa.String(255), primary_key=True),
+            sa.Column("family_count", sa.Integer, nullable=False, server_default="0"),
+        )
+    bind.execute(sa.text("DELETE FROM domain_popularity"))
+    bind.execute(sa.text(
+        "INSERT INTO domain_popularity (domain, family_count) "
+        "SELECT domain, COUNT(DISTINCT family_id) FROM family_domains GROUP BY domain"
+    ))
+
+
+def downgrade() -> None:
+    op.drop_table("domain_popularity")
@@ -0,0 +1,34 @@
+"""schoology_sync_state: section cache, per-section sync timestamps and HTTP validators
+
+Revision ID: 0003_schoology_sync_state
+Revises: 0002_domain_popularity
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003_schoology_sync_state"
+down_revision = "0002_domain_popularity"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("schoology_sync_state"):
+        return
+    op.create_table(
+        "schoology_sync_state",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("provider_account_id", sa.Integer, sa.ForeignKey("provider_accounts.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("resource", sa.String(255), nullable=False),
+        sa.Column("etag", sa.String(255), nullable=True),
+        sa.Column("last_modified", sa.String(64), nullable=True),
+        sa.Column("last_synced_at", sa.DateTime, nullable=True),
+        sa.Column("payload_json", sa.Text, nullable=True),
+        sa.UniqueConstraint("provider_account_id", "resource", name="uix_schoology_sync_resource"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("schoology_sync_state")
@@ -0,0 +1,31 @@
+"""imap_cursors: UIDVALIDITY/UID high-water mark for the forwarded-mail IMAP scan
+
+Revision ID: 0003a_imap_cursors
+Revises: 0003_schoology_sync_state
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003a_imap_cursors"
+down_revision = "0003_schoology_sync_state"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("imap_cursors"):
+        return
+    op.create_table(
+        "imap_cursors",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("mailbox", sa.String(400), nullable=False, unique=True),
+        sa.Column("uidvalidity", sa.BigInteger, nullable=False),
+        sa.Column("last_uid", sa.BigInteger, nullable=False),
+        sa.Column("updated_at", sa.DateTime, nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("imap_cursors")
@@ -0,0 +1,72 @@
+"""schoology_items.raw_json_z: compress raw_json into a binary column
+
+Revision ID: 0004_schoology_raw_json_z
+Revises: 0003a_imap_cursors
+Create Date: 2026-10-19
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_schoology_raw_json_z"
+down_revision = "0003a_imap_cursors"
+branch_labels = None
+depends_on = None
+
+BATCH = 500
+
+items = sa.table(
+    "schoology_items",
+    sa.column("id", sa.Integer),
+    sa.column("raw_json", sa.Text),
+    sa.column("raw_json_z", sa.LargeBinary),
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    cols = {c["name"] for c in sa.inspect(bind).get_columns("schoology_items")}
+    if "raw_json_z" not in cols:
+        op.add_column("schoology_items", sa.Column("raw_json_z", sa.LargeBinary, nullable=True))
+
+    # Compress in id-ordered batches so no single statement holds a long lock.
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(items.c.id, items.c.raw_json)
+            .where(items.c.id > last_id, items.c.raw_json.isnot(None))
+            .order_by(items.c.id)
+            .limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            sa.update(items).where(items.c.id == sa.bindparam("b_id")).values(
+                raw_json_z=sa.bindparam("b_z"), raw_json=None
+            ),
+            [{"b_id": r.id, "b_z": zlib.compress(r.raw_json.encode("utf-8"), 6)} for r in rows],
+        )
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(items.c.id, items.c.raw_json_z)
+            .where(items.c.id > last_id, items.c.raw_json_z.isnot(None))
+            .order_by(items.c.id)
+            .limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            sa.update(items).where(items.c.id == sa.bindparam("b_id")).values(raw_json=sa.bindparam("b_raw")),
+            [{"b_id": r.id, "b_raw": zlib.decompress(r.raw_json_z).decode("utf-8")} for r in rows],
+        )
+        last_id = rows[-1].id
+    with op.batch_alter_table("schoology_items") as batch:
+        batch.drop_column("raw_json_z")
@@ -0,0 +1,26 @@
+"""one_liners: no-op (the compile index is added by 0006)
+
+This revision used to create ix_one_liners_family_date_created on
+(family_id, date_string, created_at) for the digest compile window. Compile now
+windows on the typed event_date column, indexed by 0006
+(ix_one_liners_family_event_date), so nothing is created here. 0006 drops the
+old index from databases that ran the earlier version of this revision.
+
+Revision ID: 0005_one_liners_family_date
+Revises: 0004_schoology_raw_json_z
+Create Date: 2026-10-19
+"""
+
+
+revision = "0005_one_liners_family_date"
+down_revision = "0004_schoology_raw_json_z"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    pass
+
+
+def downgrade() -> None:
+    pass
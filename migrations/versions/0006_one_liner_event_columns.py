@@ -0,0 +1,141 @@
+"""one_liners: typed event_date / event_time / event_at + indexes, backfilled from strings
+
+The backfill is a frozen copy of app/event_time.py as of this revision, so it keeps
+working however the app code changes. Rows written by older code after the upgrade
+can be filled with `python -m app.event_time backfill`.
+
+Revision ID: 0006_one_liner_event_columns
+Revises: 0005_one_liners_family_date
+Create Date: 2026-10-19
+"""
+import re
+from datetime import datetime, time, timezone
+
+from alembic import op
+import pytz
+import sqlalchemy as sa
+
+
+revision = "0006_one_liner_event_columns"
+down_revision = "0005_one_liners_family_date"
+branch_labels = None
+depends_on = None
+
+OLD_INDEX = "ix_one_liners_family_date_created"
+BATCH = 1000
+ALLDAY_LOCAL_HOUR = 8
+DEFAULT_TZ = "America/Los_Angeles"
+
+one_liners = sa.table(
+    "one_liners",
+    sa.column("id", sa.Integer),
+    sa.column("family_id", sa.Integer),
+    sa.column("date_string", sa.String),
+    sa.column("time_string", sa.String),
+    sa.column("when_ts", sa.DateTime),
+    sa.column("event_date", sa.Date),
+    sa.column("event_time", sa.Time),
+    sa.column("event_at", sa.DateTime),
+)
+digest_prefs = sa.table("digest_prefs", sa.column("family_id", sa.Integer), sa.column("timezone", sa.String))
+
+_TIME_12H_RE = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*([ap])\.?\s*m\b\.?", re.I)
+_TIME_24H_RE = re.compile(r"\b(\d{1,2}):(\d{2})\b")
+
+
+def _parse_date(s):
+    try:
+        return datetime.strptime((s or "").strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _parse_time(s):
+    s = (s or "").strip()
+    m = _TIME_12H_RE.search(s)
+    if m:
+        hour, minute = int(m.group(1)), int(m.group(2) or 0)
+        if not (1 <= hour <= 12 and minute < 60):
+            return None
+        return time(hour % 12 + (12 if m.group(3).lower() == "p" else 0), minute)
+    m = _TIME_24H_RE.search(s)
+    if m and int(m.group(1)) < 24 and int(m.group(2)) < 60:
+        return time(int(m.group(1)), int(m.group(2)))
+    return None
+
+
+def _event_fields(date_string, time_string, when_ts, tz_name):
+    d, t = _parse_date(date_string), _parse_time(time_string)
+    if when_ts is not None:
+        at = when_ts.astimezone(timezone.utc).replace(tzinfo=None) if when_ts.tzinfo else when_ts
+    elif d is not None:
+        local = datetime.combine(d, t or time(ALLDAY_LOCAL_HOUR, 0))
+        at = pytz.timezone(tz_name or DEFAULT_TZ).localize(local, is_dst=False)
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        at = None
+    return {"b_date": d, "b_time": t, "b_at": at}
+
+
+def _backfill(bind) -> None:
+    tz_by_family = dict(bind.execute(sa.select(digest_prefs.c.family_id, digest_prefs.c.timezone)).all())
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(one_liners.c.id, one_liners.c.family_id, one_liners.c.date_string,
+                      one_liners.c.time_string, one_liners.c.when_ts)
+            .where(one_liners.c.id > last_id, one_liners.c.event_date.is_(None), one_liners.c.event_at.is_(None))
+            .order_by(one_liners.c.id)
+            .limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for r in rows:
+            f = _event_fields(r.date_string, r.time_string, r.when_ts, tz_by_family.get(r.family_id))
+            if f["b_date"] or f["b_time"] or f["b_at"]:
+                params.append({"b_id": r.id, **f})
+        if params:
+            bind.execute(
+                sa.update(one_liners).where(one_liners.c.id == sa.bindparam("b_id")).values(
+                    event_date=sa.bindparam("b_date"), event_time=sa.bindparam("b_time"),
+                    event_at=sa.bindparam("b_at"),
+                ),
+                params,
+            )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    cols = {c["name"] for c in insp.get_columns("one_liners")}
+    indexes = {ix["name"] for ix in insp.get_indexes("one_liners")}
+
+    with op.batch_alter_table("one_liners") as batch:
+        if "event_date" not in cols:
+            batch.add_column(sa.Column("event_date", sa.Date, nullable=True))
+        if "event_time" not in cols:
+            batch.add_column(sa.Column("event_time", sa.Time, nullable=True))
+        if "event_at" not in cols:
+            batch.add_column(sa.Column("event_at", sa.DateTime, nullable=True))
+
+    if OLD_INDEX in indexes:  # only on databases that ran the original 0005
+        op.drop_index(OLD_INDEX, table_name="one_liners")
+    if "ix_one_liners_family_event_date" not in indexes:
+        op.create_index(
+            "ix_one_liners_family_event_date", "one_liners", ["family_id", "event_date", "created_at"],
+            postgresql_include=["one_liner", "date_string", "time_string", "domain"],
+        )
+    if "ix_one_liners_family_event_at" not in indexes:
+        op.create_index("ix_one_liners_family_event_at", "one_liners", ["family_id", "event_at", "created_at"])
+
+    _backfill(op.get_bind())
+
+
+def downgrade() -> None:
+    op.drop_index("ix_one_liners_family_event_at", table_name="one_liners")
+    op.drop_index("ix_one_liners_family_event_date", table_name="one_liners")
+    with op.batch_alter_table("one_liners") as batch:
+        batch.drop_column("event_at")
+        batch.drop_column("event_time")
+        batch.drop_column("event_date")
@@ -0,0 +1,55 @@
+"""one_liners_archive + digest_run_rollups for the retention job
+
+Revision ID: 0007_retention_tables
+Revises: 0006_one_liner_event_columns
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007_retention_tables"
+down_revision = "0006_one_liner_event_columns"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if not _has_table("one_liners_archive"):
+        op.create_table(
+            "one_liners_archive",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("family_id", sa.Integer, nullable=False),
+            sa.Column("source_msg_id", sa.String(128), nullable=False),
+            sa.Column("one_liner", sa.Text, nullable=False),
+            sa.Column("created_at", sa.DateTime, nullable=False),
+            sa.Column("date_string", sa.String(20), nullable=True),
+            sa.Column("time_string", sa.String(20), nullable=True),
+            sa.Column("domain", sa.String(255), nullable=True),
+            sa.Column("event_date", sa.Date, nullable=True),
+            sa.Column("event_at", sa.DateTime, nullable=True),
+            sa.Column("archived_at", sa.DateTime, nullable=False),
+        )
+        op.create_index("ix_one_liners_archive_family_id", "one_liners_archive", ["family_id"])
+    if not _has_table("digest_run_rollups"):
+        op.create_table(
+            "digest_run_rollups",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("family_id", sa.Integer, sa.ForeignKey("families.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("day", sa.Date, nullable=False),
+            sa.Column("runs", sa.Integer, nullable=False, server_default="0"),
+            sa.Column("sent", sa.Integer, nullable=False, server_default="0"),
+            sa.Column("failed", sa.Integer, nullable=False, server_default="0"),
+            sa.Column("items_found", sa.Integer, nullable=False, server_default="0"),
+            sa.Column("messages_scanned", sa.Integer, nullable=False, server_default="0"),
+            sa.UniqueConstraint("family_id", "day", name="uix_digest_run_rollup_day"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("digest_run_rollups")
+    op.drop_table("one_liners_archive")
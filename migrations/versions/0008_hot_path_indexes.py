@@ -0,0 +1,43 @@
+"""indexes for hot-path lookups (dashboard, webhooks, provider accounts, dedupe)
+
+Revision ID: 0008_hot_path_indexes
+Revises: 0007_retention_tables
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008_hot_path_indexes"
+down_revision = "0007_retention_tables"
+branch_labels = None
+depends_on = None
+
+# (name, table, columns) — kept in step with the Index/index=True declarations in app/models.py
+INDEXES = [
+    ("ix_one_liners_family_source", "one_liners", ["family_id", "source_msg_id"]),
+    ("ix_processed_emails_family_msg", "processed_emails", ["family_id", "gmail_msg_id"]),
+    ("ix_processed_emails_family_processed", "processed_emails", ["family_id", "processed_at"]),
+    ("ix_digest_runs_family_started", "digest_runs", ["family_id", "started_at"]),
+    ("ix_subscriptions_family_id", "subscriptions", ["family_id"]),
+    ("ix_subscriptions_stripe_subscription_id", "subscriptions", ["stripe_subscription_id"]),
+    ("ix_subscriptions_stripe_customer_id", "subscriptions", ["stripe_customer_id"]),
+    ("ix_provider_accounts_user_provider", "provider_accounts", ["user_id", "provider"]),
+    ("ix_families_owner_user_id", "families", ["owner_user_id"]),
+    ("ix_digest_prefs_family_id", "digest_prefs", ["family_id"]),
+]
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    existing = {}
+    for name, table, cols in INDEXES:
+        if table not in existing:
+            existing[table] = {ix["name"] for ix in insp.get_indexes(table)}
+        if name not in existing[table]:
+            op.create_index(name, table, cols)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
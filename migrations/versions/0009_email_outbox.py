@@ -0,0 +1,43 @@
+"""email_outbox: rendered emails awaiting delivery
+
+Revision ID: 0009_email_outbox
+Revises: 0008_hot_path_indexes
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009_email_outbox"
+down_revision = "0008_hot_path_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("email_outbox"):
+        return
+    op.create_table(
+        "email_outbox",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("idempotency_key", sa.String(128), nullable=False, unique=True),
+        sa.Column("family_id", sa.Integer, sa.ForeignKey("families.id"), nullable=True),
+        sa.Column("digest_run_id", sa.Integer, sa.ForeignKey("digest_runs.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("to_addresses", sa.Text, nullable=False),
+        sa.Column("subject", sa.Text, nullable=False),
+        sa.Column("html", sa.Text, nullable=True),
+        sa.Column("text", sa.Text, nullable=True),
+        sa.Column("status", sa.String(20), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("next_attempt_at", sa.DateTime, nullable=False),
+        sa.Column("claimed_at", sa.DateTime, nullable=True),
+        sa.Column("last_error", sa.Text, nullable=True),
+        sa.Column("created_at", sa.DateTime, nullable=False),
+        sa.Column("sent_at", sa.DateTime, nullable=True),
+    )
+    op.create_index("ix_email_outbox_digest_run_id", "email_outbox", ["digest_run_id"])
+    op.create_index("ix_email_outbox_status_due", "email_outbox", ["status", "next_attempt_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("email_outbox")
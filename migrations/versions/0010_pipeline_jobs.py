@@ -0,0 +1,37 @@
+"""pipeline_jobs: background Run-now jobs and their stage progress
+
+Revision ID: 0010_pipeline_jobs
+Revises: 0009_email_outbox
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010_pipeline_jobs"
+down_revision = "0009_email_outbox"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("pipeline_jobs"):
+        return
+    op.create_table(
+        "pipeline_jobs",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("family_id", sa.Integer, sa.ForeignKey("families.id"), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False, server_default="queued"),
+        sa.Column("stage", sa.String(40), nullable=True),
+        sa.Column("metrics_json", sa.Text, nullable=True),
+        sa.Column("message", sa.Text, nullable=True),
+        sa.Column("created_at", sa.DateTime, nullable=False),
+        sa.Column("started_at", sa.DateTime, nullable=True),
+        sa.Column("updated_at", sa.DateTime, nullable=False),
+        sa.Column("finished_at", sa.DateTime, nullable=True),
+    )
+    op.create_index("ix_pipeline_jobs_family_created", "pipeline_jobs", ["family_id", "created_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("pipeline_jobs")
@@ -0,0 +1,32 @@
+"""digest_run_stages: per-stage wall time of each digest run
+
+Revision ID: 0011_digest_run_stages
+Revises: 0010_pipeline_jobs
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0011_digest_run_stages"
+down_revision = "0010_pipeline_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("digest_run_stages"):
+        return
+    op.create_table(
+        "digest_run_stages",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("digest_run_id", sa.Integer, sa.ForeignKey("digest_runs.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("stage", sa.String(32), nullable=False),
+        sa.Column("seconds", sa.Float, nullable=False),
+        sa.Column("calls", sa.Integer, nullable=False),
+    )
+    op.create_index("ix_digest_run_stages_digest_run_id", "digest_run_stages", ["digest_run_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("digest_run_stages")
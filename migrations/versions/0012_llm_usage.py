@@ -0,0 +1,58 @@
+"""llm_calls + llm_usage_daily: OpenAI token accounting; digest_prefs.llm_daily_token_budget
+
+Revision ID: 0012_llm_usage
+Revises: 0011_digest_run_stages
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0012_llm_usage"
+down_revision = "0011_digest_run_stages"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if "llm_daily_token_budget" not in {c["name"] for c in insp.get_columns("digest_prefs")}:
+        op.add_column("digest_prefs", sa.Column("llm_daily_token_budget", sa.Integer, nullable=True))
+    if not insp.has_table("llm_calls"):
+        op.create_table(
+            "llm_calls",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("family_id", sa.Integer, sa.ForeignKey("families.id", ondelete="CASCADE"), nullable=True),
+            sa.Column("call_site", sa.String(40), nullable=False),
+            sa.Column("model", sa.String(64), nullable=True),
+            sa.Column("prompt_tokens", sa.Integer, nullable=False),
+            sa.Column("completion_tokens", sa.Integer, nullable=False),
+            sa.Column("cached_tokens", sa.Integer, nullable=False),
+            sa.Column("latency_ms", sa.Integer, nullable=False),
+            sa.Column("outcome", sa.String(20), nullable=False),
+            sa.Column("error", sa.Text, nullable=True),
+            sa.Column("created_at", sa.DateTime, nullable=False),
+        )
+        op.create_index("ix_llm_calls_family_created", "llm_calls", ["family_id", "created_at"])
+    if not insp.has_table("llm_usage_daily"):
+        op.create_table(
+            "llm_usage_daily",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("family_id", sa.Integer, sa.ForeignKey("families.id", ondelete="CASCADE"), nullable=True),
+            sa.Column("day", sa.Date, nullable=False),
+            sa.Column("call_site", sa.String(40), nullable=False),
+            sa.Column("calls", sa.Integer, nullable=False),
+            sa.Column("errors", sa.Integer, nullable=False),
+            sa.Column("prompt_tokens", sa.Integer, nullable=False),
+            sa.Column("completion_tokens", sa.Integer, nullable=False),
+            sa.Column("cached_tokens", sa.Integer, nullable=False),
+            sa.Column("latency_ms", sa.BigInteger, nullable=False),
+            sa.UniqueConstraint("family_id", "day", "call_site", name="uix_llm_usage_daily"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("llm_usage_daily")
+    op.drop_table("llm_calls")
+    with op.batch_alter_table("digest_prefs") as batch:
+        batch.drop_column("llm_daily_token_budget")
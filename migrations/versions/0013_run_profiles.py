@@ -0,0 +1,30 @@
+"""digest_runs.profile_path + digest_prefs.profile_next_run: on-demand run profiling
+
+Revision ID: 0013_run_profiles
+Revises: 0012_llm_usage
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0013_run_profiles"
+down_revision = "0012_llm_usage"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if "profile_path" not in {c["name"] for c in insp.get_columns("digest_runs")}:
+        op.add_column("digest_runs", sa.Column("profile_path", sa.String(512), nullable=True))
+    if "profile_next_run" not in {c["name"] for c in insp.get_columns("digest_prefs")}:
+        op.add_column("digest_prefs", sa.Column("profile_next_run", sa.Boolean, nullable=False,
+                                                server_default=sa.false()))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("digest_prefs") as batch:
+        batch.drop_column("profile_next_run")
+    with op.batch_alter_table("digest_runs") as batch:
+        batch.drop_column("profile_path")
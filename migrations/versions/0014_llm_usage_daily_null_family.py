@@ -0,0 +1,40 @@
+"""llm_usage_daily: unique (day, call_site) for rows without a family
+
+Revision ID: 0014_llm_usage_daily_null_family
+Revises: 0013_run_profiles
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0014_llm_usage_daily_null_family"
+down_revision = "0013_run_profiles"
+branch_labels = None
+depends_on = None
+
+_TOTALS = ("calls", "errors", "prompt_tokens", "completion_tokens", "cached_tokens", "latency_ms")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    if "uix_llm_usage_daily_no_family" in {i["name"] for i in insp.get_indexes("llm_usage_daily")}:
+        return
+    # fold the duplicate family-less rows the NULL-blind constraint let through
+    t = sa.table("llm_usage_daily", sa.column("id"), sa.column("family_id"), sa.column("day"),
+                 sa.column("call_site"), *(sa.column(c) for c in _TOTALS))
+    dupes = bind.execute(
+        sa.select(t.c.day, t.c.call_site, sa.func.min(t.c.id), *(sa.func.sum(t.c[c]) for c in _TOTALS))
+        .where(t.c.family_id.is_(None)).group_by(t.c.day, t.c.call_site).having(sa.func.count() > 1)
+    ).all()
+    for day, call_site, keep, *totals in dupes:
+        bind.execute(t.update().where(t.c.id == keep).values(dict(zip(_TOTALS, totals))))
+        bind.execute(t.delete().where(t.c.family_id.is_(None), t.c.day == day, t.c.call_site == call_site,
+                                      t.c.id != keep))
+    op.create_index("uix_llm_usage_daily_no_family", "llm_usage_daily", ["day", "call_site"], unique=True,
+                    sqlite_where=sa.text("family_id IS NULL"), postgresql_where=sa.text("family_id IS NULL"))
+
+
+def downgrade() -> None:
+    op.drop_index("uix_llm_usage_daily_no_family", table_name="llm_usage_daily")
@@ -0,0 +1,41 @@
+"""pipeline_jobs: worker heartbeat and one active job per family
+
+Revision ID: 0015_pipeline_jobs_active
+Revises: 0014_llm_usage_daily_null_family
+Create Date: 2026-10-19
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0015_pipeline_jobs_active"
+down_revision = "0014_llm_usage_daily_null_family"
+branch_labels = None
+depends_on = None
+
+_ACTIVE = "status IN ('queued', 'running')"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    if "heartbeat_at" not in {c["name"] for c in insp.get_columns("pipeline_jobs")}:
+        op.add_column("pipeline_jobs", sa.Column("heartbeat_at", sa.DateTime, nullable=True))
+    if "uix_pipeline_jobs_active" in {i["name"] for i in insp.get_indexes("pipeline_jobs")}:
+        return
+    # keep each family's newest active job; older ones were orphaned by the check-then-insert race
+    t = sa.table("pipeline_jobs", sa.column("id"), sa.column("family_id"), sa.column("status"),
+                 sa.column("stage"), sa.column("message"), sa.column("finished_at"))
+    active = t.c.status.in_(("queued", "running"))
+    newest = sa.select(sa.func.max(t.c.id)).where(active).group_by(t.c.family_id)
+    bind.execute(t.update().where(active, t.c.id.not_in(newest)).values(
+        status="failed", stage="done", message="Run was interrupted", finished_at=datetime.utcnow()))
+    op.create_index("uix_pipeline_jobs_active", "pipeline_jobs", ["family_id"], unique=True,
+                    sqlite_where=sa.text(_ACTIVE), postgresql_where=sa.text(_ACTIVE))
+
+
+def downgrade() -> None:
+    op.drop_index("uix_pipeline_jobs_active", table_name="pipeline_jobs")
+    op.drop_column("pipeline_jobs", "heartbeat_at")
@@ -0,0 +1,132 @@
+"""Cassette record/replay: Gmail + OpenAI responses round-trip, sanitized, without the real services."""
+import base64
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import cassette, llm_usage
+from app.gmail_tokens import gmail_service_for_family
+from app.ingest_job import collect_recent_emails
+from app.models import Base, User, Family
+
+
+class _Req:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self, num_retries=0):
+        return self.result
+
+
+class RealGmail:
+    def __init__(self):
+        body = base64.urlsafe_b64encode(b"Call jane.doe@gmail.com about the field trip").decode()
+        self.msg = {"id": "m1", "payload": {"headers": [{"name": "From", "value": "Ms. Lee <lee@school.org>"}],
+                                           "parts": [{"mimeType": "text/plain", "body": {"data": body}}]}}
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, **kw):
+        return _Req({"messages": [{"id": "m1"}], "nextPageToken": None})
+
+    def get(self, **kw):
+        return _Req(self.msg)
+
+
+def _completion(content):
+    return {"id": "c1", "object": "chat.completion", "created": 1, "model": "gpt-4.1-mini",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}}
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=self)
+        self.calls = 0
+
+    def create(self, **kw):
+        from openai.types.chat import ChatCompletion
+        self.calls += 1
+        return ChatCompletion.model_validate(_completion('{"points": []}'))
+
+
+@pytest.fixture
+def cassette_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cassette, "CASSETTE_DIR", str(tmp_path))
+    monkeypatch.setattr(cassette, "CASSETTE_LATENCY_SCALE", 0)
+    monkeypatch.setattr(llm_usage, "record", lambda *a, **k: None)
+    return tmp_path
+
+
+def test_record_then_replay_without_services(cassette_dir, monkeypatch):
+    real, client = RealGmail(), FakeOpenAI()
+    with cassette.session(7, mode="record"):
+        svc = cassette.GmailCassette(cassette.current(), real)
+        svc.users().messages().list(userId="me", q="after:1000 (from:@school.org)", maxResults=100).execute()
+        svc.users().messages().get(userId="me", id="m1", format="full").execute()
+        llm_usage.chat(client, "summarize", model="gpt-4.1-mini", messages=[{"role": "user", "content": "run_date 1"}])
+    assert (cassette_dir / "family_7.json.gz").exists()
+
+    with cassette.session(7, mode="replay"):
+        # replay never builds a Gmail client or needs credentials
+        svc = gmail_service_for_family(db=None, family_id=7)
+        listing = svc.users().messages().list(userId="me", q="after:2000 (from:@school.org)", maxResults=100).execute()
+        msg = svc.users().messages().get(userId="me", id="m1", format="full").execute()
+        resp = llm_usage.chat(None, "summarize", model="gpt-4.1-mini",
+                              messages=[{"role": "user", "content": "run_date 2"}])
+        with pytest.raises(cassette.CassetteMiss):
+            llm_usage.chat(None, "summarize", model="gpt-4.1-mini", messages=[])
+
+    assert listing["messages"] == [{"id": "m1"}]
+    text = base64.urlsafe_b64decode(msg["payload"]["parts"][0]["body"]["data"]).decode()
+    assert "jane.doe" not in text and "@gmail.com about the field trip" in text
+    assert msg["payload"]["headers"][0]["value"].endswith("@school.org>")
+    assert resp.choices[0].message.content == '{"points": []}' and client.calls == 1
+
+
+def test_replay_needs_no_openai_key_or_network():
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env.update(CASSETTE_MODE="replay", OPENAI_BASE_URL="http://127.0.0.1:9")  # nothing listens there
+    done = subprocess.run([sys.executable, "-c", "import app.digest_runner, app.digest_from_emails"],
+                          env=env, capture_output=True, text=True, timeout=60)
+    assert done.returncode == 0, done.stderr[-2000:]
+
+
+def test_replay_collects_without_a_google_token(cassette_dir, tmp_path):
+    with cassette.session(8, mode="record"):
+        svc = cassette.GmailCassette(cassette.current(), RealGmail())
+        svc.users().messages().list(userId="me", q="after:1000 (from:@school.org)", maxResults=100).execute()
+        svc.users().messages().get(userId="me", id="m1", format="full").execute()
+
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    user = User(email="p@example.com"); db.add(user); db.commit()
+    fam = Family(owner_user_id=user.id); db.add(fam); db.commit()   # no Google ProviderAccount at all
+
+    with pytest.raises(RuntimeError, match="No Google account"):
+        collect_recent_emails(db, fam.id, ["school.org"])
+    with cassette.session(8, mode="replay"):
+        emails = collect_recent_emails(db, fam.id, ["school.org"])
+    assert [(e.gmail_id, e.domain) for e in emails] == [("m1", "school.org")]
+    assert "field trip" in emails[0].body_text
+    db.close()
+    engine.dispose()
+
+
+def test_schoology_pages_get_their_own_keys():
+    base = "https://api.schoology.com/v1/sections/7/events"
+    first = cassette.schoology_key("get", base, {"start": 0, "limit": 200, "start_date": "2026-10-12"})
+    page2 = cassette.schoology_key("GET", f"{base}?start=200&limit=200&start_date=2026-10-13", None)
+    assert first == cassette.schoology_key("GET", f"{base}?start=0&limit=200", None)
+    assert page2 != first
+    assert page2 == cassette.schoology_key("GET", f"{base}?limit=200&start=200", None)
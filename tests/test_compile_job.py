@@ -0,0 +1,85 @@
+import importlib.util
+import os
+from datetime import datetime, timezone
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, User, Family, DigestPreference, OneLiner
+from app.compile_job import _upcoming_oneliner_items
+from app.event_time import event_fields
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_upcoming_items_window(db_session):
+    user = User(email="p@example.com"); db_session.add(user); db_session.commit()
+    fam = Family(owner_user_id=user.id); db_session.add(fam); db_session.commit()
+    other = Family(owner_user_id=user.id); db_session.add(other); db_session.commit()
+
+    rows = [
+        ("past", "2025-01-02"), ("today", "2025-03-01"), ("later", "2025-03-09"),
+        ("undated", None), ("blank", ""), ("unpadded past", "2025-1-5"),
+        ("unpadded future", "2025-4-5"), ("garbage", "next week"),
+    ]
+    for i, (text, ds) in enumerate(rows):
+        db_session.add(OneLiner(family_id=fam.id, source_msg_id=f"m{i}", one_liner=text, date_string=ds,
+                                created_at=datetime(2025, 1, 1, 0, i), **event_fields(ds, None)))
+    db_session.add(OneLiner(family_id=other.id, source_msg_id="x", one_liner="other family", date_string="2025-05-01"))
+    db_session.commit()
+
+    items = _upcoming_oneliner_items(db_session, fam.id, "2025-03-01")
+
+    assert set(items[0]) == {"one_liner", "date_string", "time_string", "domain"}
+    # ordered by event_date (undated/unparseable last, by creation); past dates dropped
+    assert [it["one_liner"] for it in items] == [
+        "today", "later", "unpadded future", "undated", "blank", "garbage",
+    ]
+
+
+def test_event_fields_normalizes_llm_strings():
+    f = event_fields("2025-03-09", "6:00 PM to 7:30 PM", tz_name="America/Los_Angeles")
+    assert (str(f["event_date"]), str(f["event_time"])) == ("2025-03-09", "18:00:00")
+    assert f["event_at"] == datetime(2025, 3, 10, 1, 0)  # PDT starts that morning
+
+    allday = event_fields("2025-01-15", "", tz_name="America/Los_Angeles")
+    assert allday["event_time"] is None and allday["event_at"] == datetime(2025, 1, 15, 16, 0)
+
+    assert event_fields("next week", "soon") == {"event_date": None, "event_time": None, "event_at": None}
+
+
+def test_0006_backfill_matches_event_fields(db_session):
+    user = User(email="p@example.com"); db_session.add(user); db_session.commit()
+    fam = Family(owner_user_id=user.id); db_session.add(fam); db_session.commit()
+    db_session.add(DigestPreference(family_id=fam.id, timezone="America/New_York"))
+    rows = [("2025-03-09", "6:00 PM to 7:30 PM", None), ("2025-01-15", "", None), ("next week", "soon", None),
+            ("", "", datetime(2025, 2, 1, 17, 0, tzinfo=timezone.utc)), ("2025-4-5", "14:30", None)]
+    for i, (ds, ts, when) in enumerate(rows):
+        db_session.add(OneLiner(family_id=fam.id, source_msg_id=f"m{i}", one_liner=str(i), date_string=ds,
+                                time_string=ts, when_ts=when))
+    db_session.commit()
+
+    path = os.path.join(os.path.dirname(__file__), "..", "migrations", "versions", "0006_one_liner_event_columns.py")
+    spec = importlib.util.spec_from_file_location("m0006", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    migration.BATCH = 2
+    conn = db_session.connection()
+    with Operations.context(MigrationContext.configure(conn)):
+        migration.upgrade()
+    db_session.commit()
+
+    got = [(o.event_date, o.event_time, o.event_at) for o in db_session.query(OneLiner).order_by(OneLiner.id)]
+    want = [tuple(event_fields(ds, ts, when, "America/New_York").values()) for ds, ts, when in rows]
+    assert got == want and got[0][2] == datetime(2025, 3, 9, 22, 0)
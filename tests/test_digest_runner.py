@@ -0,0 +1,251 @@
+"""run_digest_once end to end with fake Gmail/OpenAI: pool usage, stage timings, tracing, token budgets, profiling."""
+import json
+import pstats
+import time
+from datetime import date, datetime
+
+import pytest
+from google.auth.exceptions import RefreshError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import compile_job, db as app_db, digest_runner, ingest_job, timings, tracing
+from app.db import track_pool
+from app.models import (Base, User, Family, DigestPreference, ProviderAccount, OneLiner, EmailOutbox, DigestRunStage,
+                        LlmUsageDaily)
+
+
+class _Call:
+    def __init__(self, result, gauge, seen):
+        self.result, self.gauge, self.seen = result, gauge, seen
+
+    def execute(self, num_retries=0):
+        self.seen.append(("gmail", self.gauge.in_use))
+        return self.result
+
+
+class FakeGmail:
+    def __init__(self, gauge, seen, messages):
+        self.gauge, self.seen, self.inbox = gauge, seen, messages
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, **kw):
+        return _Call({"messages": [{"id": m["id"]} for m in self.inbox]}, self.gauge, self.seen)
+
+    def get(self, userId, id, format):
+        return _Call(next(m for m in self.inbox if m["id"] == id), self.gauge, self.seen)
+
+
+def _msg(i):
+    headers = [("From", "Teacher <t@school.org>"), ("Subject", f"Note {i}"), ("Message-ID", f"<m{i}@school.org>")]
+    return {"id": str(i), "payload": {"headers": [{"name": k, "value": v} for k, v in headers]}}
+
+
+@pytest.fixture
+def gauge(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(app_db, "SessionLocal", sessionmaker(bind=engine, autoflush=False))
+    yield track_pool(engine)
+    engine.dispose()
+
+
+def _fake_pipeline(monkeypatch, gauge):
+    """One family with three school emails; Gmail and both LLM calls record pool usage when called."""
+    with app_db.session_scope() as db:
+        user = User(email="p@example.com"); db.add(user); db.flush()
+        fam = Family(owner_user_id=user.id); db.add(fam); db.flush()
+        db.add(DigestPreference(family_id=fam.id, to_addresses="p@example.com", school_domains="school.org"))
+        db.add(ProviderAccount(user_id=user.id, provider="google", token_json_enc="x"))
+        family_id = fam.id
+
+    seen = []
+    messages = [_msg(i) for i in range(3)]
+
+    def summarize(subject, body, local_tz=None, domain=None):
+        seen.append(("openai", gauge.in_use))
+        return [{"one_liner": f"{subject}: bring lunch", "date_string": "2099-01-05", "time_string": ""}]
+
+    def render(**kw):
+        seen.append(("openai", gauge.in_use))
+        return "Weekly", "<p>lunch</p>", "lunch"
+
+    monkeypatch.delenv("FORWARD_IMAP_PASS", raising=False)
+    monkeypatch.setattr(compile_job, "format_digest_from_oneliners", render)
+    monkeypatch.setattr(ingest_job, "gmail_service_for_family", lambda db, fid: FakeGmail(gauge, seen, messages))
+    monkeypatch.setattr(ingest_job, "extract_text_from_message", lambda service, msg: "Field trip, bring lunch.")
+    monkeypatch.setattr(ingest_job, "summarize_email_to_points", summarize)
+    return family_id, seen
+
+
+def test_no_connection_checked_out_during_remote_calls(gauge, monkeypatch):
+    family_id, seen = _fake_pipeline(monkeypatch, gauge)
+
+    sent, msg, metrics = digest_runner.run_digest_once(family_id)
+
+    assert sent, msg
+    assert metrics["emails_fetched"] == 3 and metrics["points_created"] == 3
+    assert {kind for kind, _ in seen} == {"gmail", "openai"}
+    assert [s for s in seen if s[1]] == []
+    assert gauge.in_use == 0 and gauge.peak == 1
+
+    with app_db.session_scope() as db:
+        assert db.query(OneLiner).count() == 3
+        assert db.query(EmailOutbox).count() == 1
+
+        # every stage the run went through is timed against its DigestRun
+        stages = {s.stage: s for s in db.query(DigestRunStage)}
+        assert set(stages) == {"forwarded_imap", "gmail_list", "gmail_get", "llm_summarize", "db_write",
+                               "schoology", "compile_llm"}
+        assert stages["gmail_get"].calls == 3 and stages["llm_summarize"].calls == 3
+        assert all(s.seconds >= 0 for s in stages.values())
+
+    assert 'schoolbrief_stage_seconds_count{stage="gmail_get"}' in timings.render_prometheus()
+
+
+def test_run_is_traced_end_to_end(gauge, monkeypatch, tmp_path):
+    family_id, _ = _fake_pipeline(monkeypatch, gauge)
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_EXPORT", "jsonl")
+    monkeypatch.setattr(tracing, "TRACE_JSONL_PATH", str(path))
+
+    digest_runner.run_digest_once(family_id)
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    by_id = {s["span_id"]: s for s in spans}
+    root = next(s for s in spans if s["parent_id"] is None)
+    assert root["name"] == "digest_run" and root["attributes"]["family_id"] == family_id
+    assert {s["trace_id"] for s in spans} == {root["trace_id"]}
+    assert all(s["parent_id"] is None or s["parent_id"] in by_id for s in spans)
+    assert {s["digest_run_id"] for s in spans} == {1}
+
+    names = [s["name"] for s in spans]
+    for name in ("collect_recent_emails", "process_recent_emails_saving_to_points", "sync_schoology",
+                 "compile_and_send_digest", "llm.compile", "gmail.list"):
+        assert name in names
+    gets = [s for s in spans if s["name"] == "gmail.get"]
+    assert sorted(s["attributes"]["gmail_id"] for s in gets) == ["0", "1", "2"]
+    emails = [s for s in spans if s["name"] == "email.summarize"]
+    assert {s["attributes"]["message_id"] for s in emails} == {"<m0@school.org>", "<m1@school.org>", "<m2@school.org>"}
+    assert all(by_id[s["parent_id"]]["name"] == "process_recent_emails_saving_to_points" for s in emails)
+
+
+def test_over_budget_family_degrades_to_rule_based(gauge, monkeypatch):
+    family_id, seen = _fake_pipeline(monkeypatch, gauge)
+    with app_db.session_scope() as db:
+        db.query(DigestPreference).filter_by(family_id=family_id).update({"llm_daily_token_budget": 100})
+        db.add(LlmUsageDaily(family_id=family_id, day=datetime.utcnow().date(), call_site="summarize", calls=1,
+                             errors=0, prompt_tokens=90, completion_tokens=10, cached_tokens=0, latency_ms=1))
+    monkeypatch.setattr(ingest_job, "extract_text_from_message",
+                        lambda service, msg: "Reminder: bring lunch for the field trip on Jan 5, 2099.")
+
+    sent, msg, metrics = digest_runner.run_digest_once(family_id)
+
+    assert sent, msg
+    assert [kind for kind, _ in seen if kind == "openai"] == []
+    with app_db.session_scope() as db:
+        assert db.query(OneLiner).filter_by(event_date=date(2099, 1, 5)).count() == 3
+        out = db.query(EmailOutbox).one()
+        assert "bring lunch" in out.text
+
+
+def test_flagged_run_is_profiled_and_linked(gauge, monkeypatch, tmp_path):
+    from app import profiling
+    from app.models import DigestRun
+
+    family_id, _ = _fake_pipeline(monkeypatch, gauge)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_INTERVAL", 0.001)
+    slow = ingest_job.summarize_email_to_points
+    monkeypatch.setattr(ingest_job, "summarize_email_to_points", lambda *a, **k: (time.sleep(0.02), slow(*a, **k))[1])
+    with app_db.session_scope() as db:
+        db.query(DigestPreference).filter_by(family_id=family_id).update({"profile_next_run": True})
+
+    sent, msg, _ = digest_runner.run_digest_once(family_id)
+
+    assert sent, msg
+    with app_db.session_scope() as db:
+        base = db.query(DigestRun).one().profile_path
+        assert db.query(DigestPreference.profile_next_run).filter_by(family_id=family_id).scalar() is False
+    assert base and base.endswith("run_1")
+    stats = pstats.Stats(f"{base}.pstats")
+    assert any(fn[2] == "process_recent_emails_saving_to_points" for fn in stats.stats)
+    stacks = open(f"{base}.collapsed").read().splitlines()
+    assert stacks and all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+    assert any("_run_stages" in line and "<lambda>" in line for line in stacks)
+
+    # one-shot: the next run is not profiled
+    digest_runner.run_digest_once(family_id)
+    with app_db.session_scope() as db:
+        assert db.query(DigestRun).order_by(DigestRun.id.desc()).first().profile_path is None
+
+
+def test_memory_profile_breaks_peak_down_by_stage(gauge, monkeypatch, tmp_path):
+    from app import profiling
+
+    family_id, _ = _fake_pipeline(monkeypatch, gauge)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(profiling, "PROFILE_FAMILIES", str(family_id))
+    monkeypatch.setattr(profiling, "PROFILE_MODE", "memory")
+    held = []
+    summarize = ingest_job.summarize_email_to_points
+    monkeypatch.setattr(ingest_job, "summarize_email_to_points",
+                        lambda *a, **k: (held.append(bytearray(2 << 20)), summarize(*a, **k))[1])
+
+    digest_runner.run_digest_once(family_id)
+
+    mem = profiling.last_profile.memory
+    assert mem.stats["llm_summarize"][0] == 3
+    assert mem.stats["llm_summarize"][2] >= 3 * (2 << 20)   # retained across calls
+    assert mem.peak_bytes >= 3 * (2 << 20)
+    report = (tmp_path / "profiles" / "run_1.memory.txt").read_text()
+    assert "llm_summarize" in report and "top allocations at llm_summarize peak" in report
+    assert not (tmp_path / "profiles" / "run_1.pstats").exists()
+
+
+def test_collect_keeps_compact_records_not_payloads(gauge, monkeypatch):
+    family_id, _ = _fake_pipeline(monkeypatch, gauge)
+
+    def extract(service, msg):
+        if msg["id"] == "1":
+            raise ValueError("bad part")
+        return f"body of {msg['id']}"
+    monkeypatch.setattr(ingest_job, "extract_text_from_message", extract)
+
+    with app_db.session_scope() as db:
+        emails = ingest_job.collect_recent_emails(db, family_id, ["school.org"])
+
+    assert all(isinstance(e, ingest_job.FetchedEmail) and not hasattr(e, "__dict__") for e in emails)
+    first = emails[0]
+    assert (first.gmail_id, first.subject, first.message_id, first.domain, first.body_text) == \
+        ("0", "Note 0", "<m0@school.org>", "school.org", "body of 0")
+    assert emails[1].body_text == ""   # extraction failure is kept, then skipped when summarizing
+
+    with app_db.session_scope() as db:
+        processed, points = ingest_job.process_recent_emails_saving_to_points(db, family_id, emails)
+    assert (processed, points) == (2, 2)
+
+
+def test_token_dying_mid_collect_clears_it_and_asks_to_reconnect(gauge, monkeypatch):
+    family_id, _ = _fake_pipeline(monkeypatch, gauge)
+    reconnects = []
+    monkeypatch.setattr(ingest_job, "send_reconnect_email", lambda user: reconnects.append(user.email))
+
+    def extract(service, msg):
+        if msg["id"] == "1":
+            raise RefreshError("invalid_grant: Token has been expired or revoked.")
+        return "Field trip, bring lunch."
+    monkeypatch.setattr(ingest_job, "extract_text_from_message", extract)
+
+    with app_db.session_scope() as db:
+        with pytest.raises(RuntimeError, match="invalid_grant"):
+            ingest_job.collect_recent_emails(db, family_id, ["school.org"])
+
+    assert reconnects == ["p@example.com"]
+    with app_db.session_scope() as db:
+        assert db.query(ProviderAccount).filter_by(provider="google").one().token_json_enc is None
@@ -0,0 +1,87 @@
+import smtplib
+from email.message import EmailMessage
+
+import pytest
+
+from app import emailer
+from app.emailer import SMTPPool
+
+
+class FakeSMTP:
+    """Records logins/sends; `drop_next` simulates the server closing an idle session,
+    `drop_after_data` the connection dying after DATA was sent."""
+    instances = []
+    data_started = False
+
+    def __init__(self, host, port, timeout=None):
+        self.logins, self.sent, self.closed = 0, [], False
+        self.drop_next = self.drop_after_data = False
+        FakeSMTP.instances.append(self)
+
+    def ehlo(self):
+        return 250, b"ok"
+
+    def starttls(self, context=None):
+        return 220, b"ready"
+
+    def login(self, user, password):
+        self.logins += 1
+
+    def noop(self):
+        if self.drop_next:
+            raise smtplib.SMTPServerDisconnected("gone")
+        return 250, b"ok"
+
+    def send_message(self, msg):
+        if self.drop_next:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.data_started = True
+        self.sent.append(msg["Subject"])
+        if self.drop_after_data:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+    def quit(self):
+        self.closed = True
+
+    close = quit
+
+
+def _msg(i):
+    m = EmailMessage()
+    m["Subject"] = f"s{i}"
+    m.set_content("x")
+    return m
+
+
+def test_pool_reuses_sessions_and_reconnects(monkeypatch):
+    FakeSMTP.instances = []
+    monkeypatch.setattr(emailer, "_SMTP", FakeSMTP)
+    pool = SMTPPool("smtp.test", 587, "u", "p", size=1, max_messages=3, noop_after=60)
+
+    for i in range(3):
+        pool.send(_msg(i))
+    assert len(FakeSMTP.instances) == 1 and FakeSMTP.instances[0].sent == ["s0", "s1", "s2"]
+
+    pool.send(_msg(3))  # max_messages reached -> retired, new session
+    assert len(FakeSMTP.instances) == 2 and FakeSMTP.instances[0].closed
+
+    FakeSMTP.instances[1].drop_next = True  # server dropped it between sends
+    pool.send(_msg(4))
+    assert FakeSMTP.instances[2].sent == ["s4"]
+    assert pool.connects == 3 and all(s.logins == 1 for s in FakeSMTP.instances)
+
+    pool.close()
+    assert FakeSMTP.instances[2].closed
+
+
+def test_pool_does_not_resend_after_data(monkeypatch):
+    FakeSMTP.instances = []
+    monkeypatch.setattr(emailer, "_SMTP", FakeSMTP)
+    pool = SMTPPool("smtp.test", 587, "u", "p", size=1, noop_after=60)
+    pool.send(_msg(0))
+
+    FakeSMTP.instances[0].drop_after_data = True  # the server may already have queued it
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        pool.send(_msg(1))
+    assert len(FakeSMTP.instances) == 1 and FakeSMTP.instances[0].sent == ["s0", "s1"]
+    assert FakeSMTP.instances[0].closed
@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models import Base, User, Family, DigestPreference, DomainPopularity, FamilyDomain, FamilyRecipient
+from app.family_index import family_for_recipient, domain_suggestions, invalidate_domain_suggestions
+
+@pytest.fixture
+def db_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _family(db, email, recipients, domains):
+    user = User(email=email)
+    db.add(user); db.commit()
+    fam = Family(owner_user_id=user.id)
+    db.add(fam); db.commit()
+    db.add(DigestPreference(family_id=fam.id, to_addresses=recipients, school_domains=domains))
+    db.commit()
+    return fam
+
+
+def test_index_tables_follow_csv(db_session):
+    invalidate_domain_suggestions()
+    a = _family(db_session, "a@example.com", "A@example.com, grandma@example.com", "@schoology.com, parentsquare.com")
+    b = _family(db_session, "b@example.com", "b@example.com", "parentsquare.com")
+
+    assert family_for_recipient(db_session, "Grandma@Example.com").id == a.id
+    assert domain_suggestions(db_session) == ["parentsquare.com", "schoology.com"]
+    assert db_session.get(DomainPopularity, "parentsquare.com").family_count == 2
+
+    pref = db_session.query(DigestPreference).filter_by(family_id=a.id).one()
+    pref.to_addresses = "a@example.com"
+    pref.school_domains = "peachjar.com"
+    db_session.commit()
+
+    assert family_for_recipient(db_session, "grandma@example.com") is None
+    assert domain_suggestions(db_session) == ["parentsquare.com", "peachjar.com"]
+
+    db_session.delete(db_session.query(DigestPreference).filter_by(family_id=b.id).one())
+    db_session.commit()
+    assert db_session.query(FamilyRecipient).filter_by(family_id=b.id).count() == 0
+    assert db_session.query(FamilyDomain).filter_by(family_id=b.id).count() == 0
+    assert db_session.get(DomainPopularity, "parentsquare.com").family_count == 0
+    assert db_session.get(DomainPopularity, "schoology.com").family_count == 0
+
+
+def test_suggestions_cache_cleared_only_on_commit(db_session):
+    invalidate_domain_suggestions()
+    a = _family(db_session, "a@example.com", "a@example.com", "parentsquare.com")
+    assert domain_suggestions(db_session) == ["parentsquare.com"]
+
+    pref = db_session.query(DigestPreference).filter_by(family_id=a.id).one()
+    pref.school_domains = "peachjar.com"
+    db_session.flush()
+    db_session.rollback()
+    # a rolled-back change neither reaches the cache nor empties it
+    assert domain_suggestions(db_session) == ["parentsquare.com"]
+
+    pref.school_domains = "peachjar.com"
+    db_session.flush()
+    assert domain_suggestions(db_session) == ["parentsquare.com"]
+    db_session.commit()
+    assert domain_suggestions(db_session) == ["peachjar.com"]
+
+
+def test_moving_a_preference_clears_the_old_family(db_session):
+    a = _family(db_session, "a@example.com", "a@example.com", "parentsquare.com")
+    user = User(email="b@example.com"); db_session.add(user); db_session.commit()
+    b = Family(owner_user_id=user.id); db_session.add(b); db_session.commit()
+
+    pref = db_session.query(DigestPreference).filter_by(family_id=a.id).one()
+    pref.family_id = b.id
+    db_session.commit()
+
+    assert db_session.query(FamilyRecipient).filter_by(family_id=a.id).count() == 0
+    assert db_session.query(FamilyDomain).filter_by(family_id=a.id).count() == 0
+    assert family_for_recipient(db_session, "a@example.com").id == b.id
+    assert db_session.get(DomainPopularity, "parentsquare.com").family_count == 1
@@ -1,10 +1,13 @@
 import pytest
-from unittest.mock import patch, MagicMock
+import re
+import email as email_mod
+from email.message import EmailMessage
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from app.models import Base, User, Family, DigestPreference, ProcessedEmail
-from app.ingest_job import process_forwarded_emails_and_update_domains
+from app.models import Base, User, Family, DigestPreference, ProcessedEmail, ImapCursor
+from app.ingest_job import _decode_peeked_part, process_forwarded_emails_and_update_domains
 import os
+from email.utils import parseaddr
 
 @pytest.fixture
 def db_session(tmp_path):
@@ -17,10 +20,120 @@ def db_session(tmp_path):
     session.close()
     engine.dispose()
 
-@patch("app.ingest_job.imaplib.IMAP4_SSL")
-@patch("app.ingest_job.email_mod.message_from_bytes")
-def test_process_forwarded_emails_and_update_domains(mock_message_from_bytes, mock_imap, db_session):
-    # Setup test user/family/pref
+
+class FakeIMAP:
+    """Local IMAP stand-in: just enough of imaplib.IMAP4 for UID SEARCH/FETCH/STORE."""
+
+    def __init__(self, messages, uidvalidity=1):
+        self.messages = dict(messages)  # uid -> raw bytes
+        self.seen = set()
+        self.uidvalidity = uidvalidity
+        self.calls = []
+        self._untagged = {}
+        self.headerless = set()   # UIDs whose header fetch comes back empty
+
+    def __call__(self, host):
+        return self
+
+    def login(self, user, password):
+        return "OK", [b"logged in"]
+
+    def select(self, mailbox="INBOX"):
+        self._untagged["UIDVALIDITY"] = [str(self.uidvalidity).encode()]
+        return "OK", [str(len(self.messages)).encode()]
+
+    def response(self, code):
+        return code, self._untagged.pop(code, [None])
+
+    def logout(self):
+        return "BYE", []
+
+    def uid(self, command, *args):
+        self.calls.append((command.upper(),) + args)
+        return getattr(self, "_uid_" + command.lower())(*args)
+
+    def _uid_search(self, charset, *criteria):
+        lo = int(re.match(r"UID (\d+):\*", criteria[0]).group(1))
+        hits = [u for u in sorted(self.messages) if u >= lo and u not in self.seen]
+        if not hits and self.messages:
+            hits = [max(self.messages)]  # RFC 3501: "n:*" always matches the last message
+        return "OK", [" ".join(str(u) for u in hits).encode()]
+
+    def _uid_fetch(self, uid_set, items):
+        out = []
+        for seq, uid in enumerate(int(u) for u in uid_set.split(",")):
+            raw = self.messages[uid]
+            head, _, _ = raw.partition(b"\n\n")
+            parts = []
+            if "BODY.PEEK[HEADER]" in items and uid not in self.headerless:
+                parts.append(("BODY[HEADER]", head + b"\n\n"))
+            m = re.search(r"BODY\.PEEK\[1\]<0\.(\d+)>", items)
+            if m:
+                msg = email_mod.message_from_bytes(raw)
+                first = msg.get_payload(0) if msg.is_multipart() else msg
+                body = first.get_payload() if not first.is_multipart() else first.as_string()
+                if isinstance(body, list):
+                    body = body[0].as_string()
+                parts.append(("BODY[1]<0>", body.encode()[: int(m.group(1))]))
+            if "BODY.PEEK[]" in items:
+                parts.append(("BODY[]", raw))
+            structure = ""
+            if "BODYSTRUCTURE" in items:
+                structure = f"BODYSTRUCTURE {_bodystructure(email_mod.message_from_bytes(raw))} "
+            for i, (name, data) in enumerate(parts):
+                prefix = f"{seq + 1} (UID {uid} {structure}" if i == 0 else " "
+                out.append((f"{prefix}{name} {{{len(data)}}}".encode(), data))
+            out.append(b")")
+        return "OK", out
+
+    def _uid_store(self, uid_set, op, flags):
+        self.seen.update(int(u) for u in uid_set.split(","))
+        return "OK", []
+
+
+def _q(v) -> str:
+    return "NIL" if v is None else '"%s"' % str(v).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _bodystructure(msg) -> str:
+    """IMAP BODYSTRUCTURE for an email.message (type, subtype, encoding; envelope From for rfc822)."""
+    if msg.get_content_maintype() == "multipart":
+        return "(" + "".join(_bodystructure(p) for p in msg.get_payload()) + f" {_q(msg.get_content_subtype())})"
+    base = (f"{_q(msg.get_content_maintype())} {_q(msg.get_content_subtype())} NIL NIL NIL "
+            f"{_q(msg.get('Content-Transfer-Encoding', '7bit'))} {len(msg.as_bytes())}")
+    if msg.get_content_type() == "message/rfc822":
+        inner = msg.get_payload(0)
+        name, addr = parseaddr(inner["From"])
+        mailbox, host = addr.split("@")
+        env = f"(NIL {_q(inner['Subject'])} (({_q(name)} NIL {_q(mailbox)} {_q(host)})) NIL NIL NIL NIL NIL NIL NIL)"
+        return f"({base} {env} {_bodystructure(inner)} 1)"
+    return f"({base} 1)"
+
+
+def _inline_forward(sender: str, original: str) -> bytes:
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = "addschoolbrief@gmail.com"
+    msg["Subject"] = "Fwd: Field trip"
+    msg.set_content(f"---------- Forwarded message ---------\nFrom: Teacher <{original}>\nSubject: Field trip\n\nBring lunch.\n")
+    return msg.as_bytes()
+
+
+def _attached_forward(sender: str, original: str) -> bytes:
+    inner = EmailMessage()
+    inner["From"] = f"Office <{original}>"
+    inner["Subject"] = "Picture day"
+    inner.set_content("Picture day is Friday.")
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["Subject"] = "Fwd: Picture day"
+    msg.set_content("See attached.")
+    msg.add_attachment(inner)
+    return msg.as_bytes()
+
+
+@pytest.fixture
+def family(db_session):
     user = User(email="forwarder@example.com")
     db_session.add(user)
     db_session.commit()
@@ -30,32 +143,81 @@ def test_process_forwarded_emails_and_update_domains(mock_message_from_bytes, mo
     pref = DigestPreference(family_id=fam.id, to_addresses="forwarder@example.com", school_domains="")
     db_session.add(pref)
     db_session.commit()
-
-    # Mock IMAP
-    mock_mail = MagicMock()
-    mock_imap.return_value = mock_mail
-    mock_mail.login.return_value = ("OK", [])
-    mock_mail.select.return_value = ("OK", [])
-    mock_mail.search.return_value = ("OK", [b'1'])
-    mock_mail.fetch.return_value = ("OK", [(None, b"rawbytes")])
-    mock_mail.store.return_value = ("OK", [])
-    mock_mail.logout.return_value = ("OK", [])
-
-    # Mock email parsing
-    mock_msg = MagicMock()
-    mock_msg.get.return_value = "forwarder@example.com"
-    mock_msg.get_payload.return_value = "From: Teacher <teacher@school.org>\nBody text"
-    mock_message_from_bytes.return_value = mock_msg
-
-    # Set env var for IMAP_PASS
     os.environ["FORWARD_IMAP_PASS"] = "dummy"
+    return fam
 
-    # Run
-    added = process_forwarded_emails_and_update_domains(db_session)
-    db_session.commit()
-    # Check
-    pref = db_session.query(DigestPreference).filter_by(family_id=fam.id).first()
-    assert "school.org" in (pref.school_domains or "")
-    assert added == 1
-    processed = db_session.query(ProcessedEmail).filter_by(family_id=fam.id).first()
-    assert processed is not None
+
+def test_process_forwarded_emails_and_update_domains(db_session, family):
+    imap = FakeIMAP({
+        7: _inline_forward("forwarder@example.com", "teacher@school.org"),
+        9: _attached_forward("Parent <forwarder@example.com>", "office@district.k12.ca.us"),
+    })
+
+    added = process_forwarded_emails_and_update_domains(db_session, imap_factory=imap)
+
+    pref = db_session.query(DigestPreference).filter_by(family_id=family.id).first()
+    assert added == 2
+    assert pref.school_domains == "district.k12.ca.us,school.org"
+    assert db_session.query(ProcessedEmail).filter_by(family_id=family.id).count() == 2
+
+    fetches = [c for c in imap.calls if c[0] == "FETCH"]
+    # one batched peek; the rfc822 attachment's envelope (BODYSTRUCTURE) spares a full download
+    assert len(fetches) == 1 and fetches[0][1] == "7,9"
+    assert "BODYSTRUCTURE" in fetches[0][2] and "BODY.PEEK[HEADER]" in fetches[0][2]
+
+    cursor = db_session.query(ImapCursor).one()
+    assert (cursor.uidvalidity, cursor.last_uid) == (1, 9)
+
+
+def test_forwarded_cursor_skips_handled_uids(db_session, family):
+    imap = FakeIMAP({3: _inline_forward("forwarder@example.com", "teacher@school.org")})
+    process_forwarded_emails_and_update_domains(db_session, imap_factory=imap)
+    imap.calls.clear()
+
+    # Non-prod leaves messages UNSEEN; the cursor alone must stop refetching.
+    assert process_forwarded_emails_and_update_domains(db_session, imap_factory=imap) == 0
+    assert not [c for c in imap.calls if c[0] == "FETCH"]
+
+    # A rebuilt mailbox (new UIDVALIDITY) resets the cursor.
+    imap.uidvalidity = 2
+    imap.messages = {1: _inline_forward("forwarder@example.com", "coach@league.org")}
+    assert process_forwarded_emails_and_update_domains(db_session, imap_factory=imap) == 1
+    cursor = db_session.query(ImapCursor).one()
+    assert (cursor.uidvalidity, cursor.last_uid) == (2, 1)
+
+
+def test_attached_original_beats_inline_from_in_forwarding_note(db_session, family):
+    raw = email_mod.message_from_bytes(_attached_forward("forwarder@example.com", "office@district.org"))
+    raw.get_payload(0).set_payload("FYI\nFrom: Grandma <grandma@family.net>\n")
+    imap = FakeIMAP({5: raw.as_bytes()})
+
+    assert process_forwarded_emails_and_update_domains(db_session, imap_factory=imap) == 1
+    assert db_session.query(DigestPreference).filter_by(family_id=family.id).one().school_domains == "district.org"
+
+
+def test_first_part_decoded_per_bodystructure_encoding(db_session, family):
+    msg = EmailMessage()
+    msg["From"] = "forwarder@example.com"
+    msg["Subject"] = "Fwd: Band"
+    msg.set_content("---------- Forwarded message ---------\nFrom: Band <band@music.org>\n", cte="base64")
+    imap = FakeIMAP({1: msg.as_bytes()})
+
+    assert process_forwarded_emails_and_update_domains(db_session, imap_factory=imap) == 1
+    assert db_session.query(DigestPreference).filter_by(family_id=family.id).one().school_domains == "music.org"
+    # no declared encoding: text that merely looks like base64 is left alone
+    assert _decode_peeked_part(b"SGVsbG8gdGVhY2hlcg==", "7bit") == "SGVsbG8gdGVhY2hlcg=="
+    assert _decode_peeked_part(b"SGVsbG8gdGVhY2hlcg==", None) == "SGVsbG8gdGVhY2hlcg=="
+
+
+def test_forwarded_cursor_stops_before_unfetched_uid(db_session, family):
+    imap = FakeIMAP({uid: _inline_forward("forwarder@example.com", f"t{uid}@school{uid}.org") for uid in (2, 4, 6)})
+    imap.headerless = {4}
+
+    assert process_forwarded_emails_and_update_domains(db_session, imap_factory=imap) == 2
+    assert db_session.query(ImapCursor).one().last_uid == 2
+
+    # the header comes back next time: 4 is picked up, 6 is not double-counted
+    imap.headerless = set()
+    assert process_forwarded_emails_and_update_domains(db_session, imap_factory=imap) == 1
+    assert db_session.query(ImapCursor).one().last_uid == 6
+    assert db_session.query(ProcessedEmail).filter_by(family_id=family.id).count() == 3
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app import db as app_db, digest_runner, jobs, outbox
+from app.models import Base, User, Family, DigestPreference, PipelineJob
+
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(app_db, "SessionLocal", factory)
+    monkeypatch.setattr(jobs, "_pool", lambda: _Inline())
+    yield factory
+    engine.dispose()
+
+
+class _Inline:
+    """Runs submitted work immediately so the test sees the finished job."""
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def test_run_now_job_reports_stages_and_outcome(Session, monkeypatch):
+    db = Session()
+    user = User(email="j@example.com"); db.add(user); db.commit()
+    fam = Family(owner_user_id=user.id); db.add(fam); db.commit()
+    db.add(DigestPreference(family_id=fam.id, to_addresses="j@example.com")); db.commit()
+
+    seen = []
+
+    def fake_run(family_id, *, user_email_fallback=None, days_back=7, progress=None):
+        metrics = {}
+        for stage, key in (("collect", "emails_fetched"), ("summarize", "points_created"), ("compile", None)):
+            progress(stage, dict(metrics))
+            seen.append(Session().get(PipelineJob, 1).stage)
+            if key:
+                metrics[key] = 3
+        return True, "queued", metrics
+
+    monkeypatch.setattr(digest_runner, "run_digest_once", fake_run)
+    monkeypatch.setattr(outbox, "drain_outbox", lambda family_id=None: {"sent": 1})
+
+    job = jobs.start_run_now(db, fam.id)
+    assert seen == ["collect", "summarize", "compile"]
+
+    db.expire_all()
+    status = jobs.job_status(db.get(PipelineJob, job.id))
+    assert status["status"] == "done" and status["done"] and status["message"] == "sent"
+    assert status["metrics"] == {"emails_fetched": 3, "points_created": 3}
+    assert jobs.active_job(db, fam.id) is None
+
+    # a job nobody has touched for too long is reported as interrupted, and does not block a new run
+    stuck = PipelineJob(family_id=fam.id, status="running", stage="summarize",
+                        updated_at=datetime.utcnow() - timedelta(seconds=jobs.RUN_NOW_STALE_SECONDS + 1))
+    db.add(stuck); db.commit()
+    assert jobs.job_status(stuck)["status"] == "failed"
+    assert jobs.start_run_now(db, fam.id).id not in (job.id, stuck.id)
+    db.close()
+
+
+def test_concurrent_run_now_returns_the_job_that_won(Session, monkeypatch):
+    db = Session()
+    user = User(email="k@example.com"); db.add(user); db.commit()
+    fam = Family(owner_user_id=user.id); db.add(fam); db.commit()
+    monkeypatch.setattr(jobs, "_pool", lambda: pytest.fail("the losing request must not submit work"))
+
+    winner = {}
+
+    def other_request_inserts_first(session, flush_context, instances):
+        other = Session()
+        job = PipelineJob(family_id=fam.id, status="running", stage="collect", heartbeat_at=datetime.utcnow())
+        other.add(job); other.commit()
+        winner["id"] = job.id
+        other.close()
+
+    event.listen(db, "before_flush", other_request_inserts_first, once=True)
+    assert jobs.start_run_now(db, fam.id).id == winner["id"]
+    assert Session().query(PipelineJob).count() == 1
+    db.close()
+
+
+def test_heartbeat_keeps_a_long_stage_alive(Session):
+    db = Session()
+    user = User(email="h@example.com"); db.add(user); db.commit()
+    fam = Family(owner_user_id=user.id); db.add(fam); db.commit()
+    long_ago = datetime.utcnow() - timedelta(seconds=jobs.RUN_NOW_STALE_SECONDS + 1)
+    job = PipelineJob(family_id=fam.id, status="running", stage="summarize", updated_at=long_ago,
+                      heartbeat_at=long_ago)
+    db.add(job); db.commit()
+    assert jobs.job_status(job)["status"] == "failed"
+
+    jobs._live.add(job.id)
+    try:
+        jobs._beat_once()
+    finally:
+        jobs._live.discard(job.id)
+    db.refresh(job)
+    assert jobs.job_status(job)["status"] == "running"
+    assert jobs.start_run_now(db, fam.id).id == job.id
+    db.close()
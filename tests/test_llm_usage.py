@@ -0,0 +1,111 @@
+"""OpenAI accounting (llm_calls + llm_usage_daily rollups) and the rule-based fallback."""
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import db as app_db, ingest_job, llm_usage
+from app.models import Base, User, Family, DigestPreference, LlmCall, LlmUsageDaily
+
+
+class FakeClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kw):
+        if self.fail:
+            raise TimeoutError("read timed out")
+        usage = SimpleNamespace(prompt_tokens=120, completion_tokens=30,
+                                prompt_tokens_details=SimpleNamespace(cached_tokens=100))
+        return SimpleNamespace(model=kw["model"], usage=usage, choices=[])
+
+
+@pytest.fixture
+def family_id(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(app_db, "SessionLocal", sessionmaker(bind=engine, autoflush=False))
+    with app_db.session_scope() as db:
+        user = User(email="p@example.com"); db.add(user); db.flush()
+        fam = Family(owner_user_id=user.id); db.add(fam); db.flush()
+        db.add(DigestPreference(family_id=fam.id, llm_daily_token_budget=400))
+        fid = fam.id
+    yield fid
+    engine.dispose()
+
+
+def test_calls_are_recorded_and_rolled_up_per_call_site(family_id):
+    with llm_usage.family_scope(family_id):
+        llm_usage.chat(FakeClient(), "summarize", model="gpt-4.1-mini", messages=[])
+        llm_usage.chat(FakeClient(), "summarize", model="gpt-4.1-mini", messages=[])
+        with pytest.raises(TimeoutError):
+            llm_usage.chat(FakeClient(fail=True), "compile", model="gpt-4.1-mini", messages=[])
+        assert not llm_usage.over_budget()
+
+    with app_db.session_scope() as db:
+        calls = db.query(LlmCall).order_by(LlmCall.id).all()
+        assert [(c.call_site, c.outcome) for c in calls] == [("summarize", "ok"), ("summarize", "ok"),
+                                                             ("compile", "error")]
+        assert all(c.family_id == family_id and c.model == "gpt-4.1-mini" for c in calls)
+        daily = {d.call_site: d for d in db.query(LlmUsageDaily)}
+        s = daily["summarize"]
+        assert (s.calls, s.errors, s.prompt_tokens, s.completion_tokens, s.cached_tokens) == (2, 0, 240, 60, 200)
+        assert (daily["compile"].calls, daily["compile"].errors) == (1, 1)
+        assert llm_usage.tokens_used_today(db, family_id) == 300
+
+    # a third call crosses the 400-token budget
+    llm_usage.chat(FakeClient(), "summarize", family_id=family_id, model="gpt-4.1-mini", messages=[])
+    assert llm_usage.over_budget(family_id)
+
+
+def test_scoped_budget_is_read_once_and_tracked_in_memory(family_id):
+    with llm_usage.family_scope(family_id):
+        assert not llm_usage.over_budget()           # loads 400 budget, 0 used
+        with app_db.session_scope() as db:
+            db.query(DigestPreference).filter_by(family_id=family_id).update({"llm_daily_token_budget": 100})
+        llm_usage.chat(FakeClient(), "summarize", model="gpt-4.1-mini", messages=[])
+        assert not llm_usage.over_budget()           # 150/400: the edit is not seen mid-stage
+        for _ in range(2):
+            llm_usage.chat(FakeClient(), "summarize", model="gpt-4.1-mini", messages=[])
+        assert llm_usage.over_budget()               # 450/400, counted without a reload
+
+    with app_db.session_scope() as db:
+        db.query(DigestPreference).filter_by(family_id=family_id).update({"llm_daily_token_budget": 1000})
+    with llm_usage.family_scope(family_id):
+        assert not llm_usage.over_budget()
+        with app_db.session_scope() as db:
+            db.query(DigestPreference).filter_by(family_id=family_id).update({"llm_daily_token_budget": 100})
+        assert not llm_usage.over_budget()
+        llm_usage.recheck_budget()                   # stage boundary
+        assert llm_usage.over_budget()
+
+
+def test_calls_without_a_family_share_one_daily_row(family_id, monkeypatch):
+    for _ in range(3):
+        llm_usage.chat(FakeClient(), "forwarded", model="gpt-4.1-mini", messages=[])
+    # and the same through the ORM fallback used for other dialects
+    monkeypatch.setattr(llm_usage, "upsert_insert", lambda dialect, table: None)
+    llm_usage.chat(FakeClient(), "forwarded", model="gpt-4.1-mini", messages=[])
+
+    with app_db.session_scope() as db:
+        rows = db.query(LlmUsageDaily).filter(LlmUsageDaily.family_id.is_(None)).all()
+        assert [(r.call_site, r.calls, r.prompt_tokens) for r in rows] == [("forwarded", 4, 480)]
+
+
+def test_rule_based_points_come_from_classify():
+    body = ("Hi families! Hope you had a great weekend.\n"
+            "The field trip to the science museum is on Oct 24 at 9:15am.\n"
+            "Reminder: please return the permission form by Friday, Oct 23.\n"
+            "Add it: https://calendar.google.com/calendar/render?action=TEMPLATE&text=Picture+Day"
+            "&dates=20261028T160000Z/20261028T170000Z\n")
+    em = ingest_job.FetchedEmail("1", "Weekly update", "t@school.org", "<m@school.org>",
+                                 "Mon, 19 Oct 2026 08:00:00 -0700", "school.org", body)
+    points = ingest_job._rule_based_points(em, "America/Los_Angeles")
+    assert [(p["one_liner"][:14], p["date_string"], p["time_string"]) for p in points] == [
+        ("Picture Day", "2026-10-28", "9:00 AM"),
+        ("The field trip", "2026-10-24", "9:15 AM"),
+        ("Reminder: plea", "2026-10-23", ""),
+    ]
+    assert points[0]["when_iso"] == "2026-10-28T16:00:00+00:00" and points[1]["when_iso"] == ""
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""JSON log lines through the queue handler, and debug sampling."""
+import json
+import logging
+import queue
+
+from app import logger as app_logger
+
+
+def test_json_line_keeps_extra_fields_and_traceback_through_the_queue():
+    q = queue.SimpleQueue()
+    log = logging.getLogger("test.json")
+    log.addHandler(app_logger._Queueing(q))
+    log.propagate = False
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        log.error("run %s failed", 7, exc_info=True, extra={"family_id": 3})
+
+    line = json.loads(app_logger.JsonFormatter().format(q.get_nowait()))
+    assert (line["level"], line["msg"], line["family_id"]) == ("ERROR", "run 7 failed", 3)
+    assert "ZeroDivisionError" in line["exc"]
+
+
+def test_sampled_lets_one_in_n_through_only_at_debug(monkeypatch):
+    monkeypatch.setattr(app_logger, "LOG_DEBUG_SAMPLE_EVERY", 3)
+    level = app_logger.logger.level
+    try:
+        app_logger.logger.setLevel(logging.DEBUG)
+        assert [app_logger.sampled("t.site") for _ in range(6)] == [True, False, False, True, False, False]
+        app_logger.logger.setLevel(logging.INFO)
+        assert not app_logger.sampled("t.site")
+    finally:
+        app_logger.logger.setLevel(level)
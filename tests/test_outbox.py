@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import outbox
+from app.models import Base, User, Family, DigestRun, EmailOutbox
+from app.outbox import digest_run_key, drain_outbox, enqueue_email
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_outbox_retries_then_records_run(db_session, monkeypatch):
+    user = User(email="o@example.com"); db_session.add(user); db_session.commit()
+    fam = Family(owner_user_id=user.id); db_session.add(fam); db_session.commit()
+    run = DigestRun(family_id=fam.id, started_at=datetime.utcnow()); db_session.add(run); db_session.commit()
+
+    for _ in range(2):  # same key twice -> one row
+        enqueue_email(db_session, idempotency_key=digest_run_key(run.id), subject="Weekly", html="<p>x</p>",
+                      text="x", to_addrs=["a@example.com", "b@example.com"], family_id=fam.id, digest_run_id=run.id)
+    db_session.commit()
+    assert db_session.query(EmailOutbox).count() == 1
+
+    calls = []
+
+    def flaky_send(subject, html, text, to_addrs, message_id=None):
+        calls.append((to_addrs, message_id))
+        if len(calls) == 1:
+            raise RuntimeError("SMTP error: 421 try later")
+
+    monkeypatch.setattr(outbox, "send_email", flaky_send)
+    closes = []
+    monkeypatch.setattr(outbox, "close_smtp_pool", lambda: closes.append(1))
+    now = datetime.utcnow() + timedelta(seconds=1)
+
+    assert drain_outbox(db_session, now=now) == {"sent": 0, "retrying": 1, "dead": 0, "skipped": 0}
+    assert closes == [1]  # the pooled SMTP sessions are not left open between drains
+    entry = db_session.query(EmailOutbox).one()
+    assert entry.status == "pending" and entry.next_attempt_at == now + timedelta(seconds=60)
+    assert "will retry" in db_session.get(DigestRun, run.id).error
+
+    # not due yet
+    assert drain_outbox(db_session, now=now + timedelta(seconds=30))["sent"] == 0
+    assert drain_outbox(db_session, now=now + timedelta(seconds=61))["sent"] == 1
+    assert closes == [1, 1]
+
+    run = db_session.get(DigestRun, run.id)
+    assert run.email_sent and run.error is None
+    assert calls[0] == (["a@example.com", "b@example.com"], f"<digest-run-{run.id}@schoolbrief.app>")
+    assert calls[0][1] == calls[1][1]  # stable Message-ID across retries
+    assert drain_outbox(db_session, now=now + timedelta(days=1))["sent"] == 0
+
+
+def test_outbox_gives_up_after_max_attempts(db_session, monkeypatch):
+    monkeypatch.setattr(outbox, "MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(outbox, "send_email", lambda *a, **k: (_ for _ in ()).throw(RuntimeError("down")))
+    enqueue_email(db_session, idempotency_key="k", subject="s", html="", text="t", to_addrs=["a@example.com"])
+    db_session.commit()
+    now = datetime.utcnow() + timedelta(seconds=1)
+    drain_outbox(db_session, now=now)
+    assert drain_outbox(db_session, now=now + timedelta(hours=1))["dead"] == 1
+    assert db_session.query(EmailOutbox).one().status == "dead"
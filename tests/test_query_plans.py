@@ -0,0 +1,148 @@
+"""
+Query-plan guards for hot-path queries: each must be served by an index, never a
+full table scan. Runs on SQLite always, and on Postgres when TEST_POSTGRES_URL
+points at a scratch database (tables are created and dropped there).
+
+Where a query lives in a helper we call the helper and EXPLAIN exactly the SQL it
+emits; queries written inline in views/billing are reproduced from their call site.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, or_, and_
+from sqlalchemy.orm import sessionmaker
+
+from app.models import (Base, User, Family, DigestPreference, ProviderAccount, Subscription, DigestRun,
+                        ProcessedEmail, OneLiner, SchoologyItem)
+from app.compile_job import _upcoming_oneliner_items
+from app.family_index import family_for_recipient
+from app.gmail_tokens import _load_provider_account_for_user
+from app.outbox import drain_outbox
+from app.schoology import get_or_create_schoology_provider, materialize_schoology_items_as_oneliners
+
+BACKENDS = ["sqlite", "postgres"]
+
+
+@pytest.fixture(params=BACKENDS)
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        eng = create_engine(f"sqlite:///{tmp_path}/plans.db")
+    else:
+        url = os.getenv("TEST_POSTGRES_URL")
+        if not url:
+            pytest.skip("TEST_POSTGRES_URL not set")
+        eng = create_engine(url)
+    Base.metadata.create_all(eng)
+    yield eng
+    if eng.dialect.name != "sqlite":
+        Base.metadata.drop_all(eng)
+    eng.dispose()
+
+
+@pytest.fixture
+def seeded(engine):
+    db = sessionmaker(bind=engine)()
+    user = User(email="plan@example.com"); db.add(user); db.commit()
+    fam = Family(owner_user_id=user.id); db.add(fam); db.commit()
+    db.add(DigestPreference(family_id=fam.id, to_addresses="plan@example.com", school_domains="school.org"))
+    db.add(ProviderAccount(user_id=user.id, provider="google"))
+    db.add(ProviderAccount(user_id=user.id, provider="schoology"))
+    db.add(Subscription(family_id=fam.id, stripe_customer_id="cus_1", stripe_subscription_id="sub_1"))
+    db.add(DigestRun(family_id=fam.id, started_at=datetime.utcnow()))
+    db.add(ProcessedEmail(family_id=fam.id, gmail_msg_id="m1", content_hash="h1"))
+    db.add(OneLiner(family_id=fam.id, source_msg_id="m1", one_liner="x", event_date=datetime.utcnow().date()))
+    db.commit()
+    yield db, user, fam
+    db.close()
+
+
+def _capture(engine, fn):
+    """Run fn() and return the (sql, params) of every SELECT it sent."""
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            seen.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert seen, "no SELECT captured"
+    return seen
+
+
+def _full_scans(engine, statement, parameters):
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            # "SEARCH t USING INDEX .." is a probe; "SCAN t [USING INDEX ..]" walks everything
+            return [r[-1] for r in rows if r[-1].startswith("SCAN ") and r[-1] != "SCAN CONSTANT ROW"]
+        conn.exec_driver_sql("SET enable_seqscan = off")  # tiny tables would otherwise always seq scan
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        out, stack = [], [plan[0]["Plan"]]
+        while stack:
+            node = stack.pop()
+            if node["Node Type"] == "Seq Scan":
+                out.append(f"Seq Scan on {node.get('Relation Name')}")
+            stack.extend(node.get("Plans", []))
+        return out
+
+
+def _hot_queries(db, user, fam):
+    now = datetime.utcnow()
+    start, end = now - timedelta(days=1), now + timedelta(days=6)
+    return {
+        # helpers, exercised for real
+        "family_for_recipient": lambda: family_for_recipient(db, "plan@example.com"),
+        "compile upcoming one-liners": lambda: _upcoming_oneliner_items(db, fam.id, now.strftime("%Y-%m-%d")),
+        "schoology materialize anti-join": lambda: materialize_schoology_items_as_oneliners(db, fam.id),
+        "google provider account": lambda: _load_provider_account_for_user(db, user.id),
+        "schoology provider account": lambda: get_or_create_schoology_provider(db, user.id),
+        "outbox due entries": lambda: drain_outbox(db),
+        # inline in views.py / billing.py / ingest_job.py
+        "family by owner": lambda: db.query(Family).filter_by(owner_user_id=user.id).first(),
+        "dashboard subscription": lambda: (
+            db.query(Subscription).filter_by(family_id=fam.id).order_by(Subscription.id.desc()).first()),
+        "dashboard recent runs": lambda: (
+            db.query(DigestRun).filter_by(family_id=fam.id).order_by(DigestRun.started_at.desc()).limit(20).all()),
+        "webhook subscription by id or customer": lambda: db.query(Subscription).filter(
+            (Subscription.stripe_subscription_id == "sub_1") | (Subscription.stripe_customer_id == "cus_1")).first(),
+        "webhook subscription deleted": lambda: (
+            db.query(Subscription).filter(Subscription.stripe_subscription_id == "sub_1").first()),
+        "ingest dedupe hash": lambda: db.query(ProcessedEmail).filter_by(family_id=fam.id, content_hash="h1").first(),
+        "processed email by message id": lambda: (
+            db.query(ProcessedEmail).filter_by(family_id=fam.id, gmail_msg_id="m1").first()),
+        "data view processed emails": lambda: (
+            db.query(ProcessedEmail.gmail_msg_id, ProcessedEmail.subject, ProcessedEmail.processed_at)
+            .filter(ProcessedEmail.family_id == fam.id)
+            .order_by(ProcessedEmail.processed_at.desc()).limit(200).all()),
+        "data view one-liners": lambda: (
+            db.query(OneLiner).filter(OneLiner.family_id == fam.id)
+            .filter(OneLiner.source_msg_id.in_(["m1", "m2"])).order_by(OneLiner.created_at.asc()).all()),
+        "data preview window": lambda: (
+            db.query(OneLiner).filter(OneLiner.family_id == fam.id)
+            .filter(or_(
+                and_(OneLiner.event_at >= start, OneLiner.event_at < end),
+                and_(OneLiner.event_at == None, OneLiner.created_at >= start, OneLiner.created_at < end),  # noqa: E711
+            ))
+            .order_by(OneLiner.event_at.is_(None), OneLiner.event_at, OneLiner.created_at.desc()).all()),
+        "schoology item upsert key": lambda: (
+            db.query(SchoologyItem).filter_by(family_id=fam.id, schoology_id="1").first()),
+    }
+
+
+def test_hot_path_queries_use_indexes(engine, seeded):
+    db, user, fam = seeded
+    failures = {}
+    for name, fn in _hot_queries(db, user, fam).items():
+        db.expire_all()
+        for statement, parameters in _capture(engine, fn):
+            scans = _full_scans(engine, statement, parameters)
+            if scans:
+                failures.setdefault(name, []).extend(scans)
+    assert not failures, f"full scans on hot-path queries ({engine.dialect.name}): {failures}"
@@ -0,0 +1,57 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import (Base, User, Family, OneLiner, OneLinerArchive, ProcessedEmail,
+                        DigestRun, DigestRunRollup)
+from app.retention import run_retention
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_retention_dry_run_then_apply(db_session):
+    now = datetime(2025, 6, 1, 12, 0)
+    user = User(email="r@example.com"); db_session.add(user); db_session.commit()
+    fam = Family(owner_user_id=user.id); db_session.add(fam); db_session.commit()
+
+    for i, days_ago in enumerate([200, 120, 95, 10, -5]):
+        d = (now - timedelta(days=days_ago)).date()
+        db_session.add(OneLiner(family_id=fam.id, source_msg_id=f"m{i}", one_liner=f"item {i}",
+                                created_at=now - timedelta(days=days_ago + 3), date_string=d.isoformat(), event_date=d))
+    db_session.add(OneLiner(family_id=fam.id, source_msg_id="undated", one_liner="no date",
+                            created_at=now - timedelta(days=400)))
+    for i, days_ago in enumerate([60, 31, 3]):
+        db_session.add(ProcessedEmail(family_id=fam.id, gmail_msg_id=f"g{i}", content_hash=f"h{i}",
+                                      processed_at=now - timedelta(days=days_ago)))
+    old_day = now - timedelta(days=100)
+    for sent in (True, True, False):
+        db_session.add(DigestRun(family_id=fam.id, started_at=old_day, email_sent=sent, items_found=4,
+                                 error=None if sent else "boom"))
+    db_session.add(DigestRun(family_id=fam.id, started_at=now - timedelta(days=1), email_sent=True))
+    db_session.commit()
+
+    expected = {"one_liners": 3, "processed_emails": 2, "digest_runs": 3, "schoology_items": 0,
+                "email_outbox": 0, "llm_calls": 0}
+    assert run_retention(db_session, dry_run=True, now=now) == expected
+    assert db_session.query(OneLiner).count() == 6
+
+    assert run_retention(db_session, now=now, chunk=2) == expected
+    assert sorted(o.source_msg_id for o in db_session.query(OneLiner)) == ["m3", "m4", "undated"]
+    assert sorted(a.source_msg_id for a in db_session.query(OneLinerArchive)) == ["m0", "m1", "m2"]
+    assert [p.gmail_msg_id for p in db_session.query(ProcessedEmail)] == ["g2"]
+    assert db_session.query(DigestRun).count() == 1
+    rollup = db_session.query(DigestRunRollup).one()
+    assert (rollup.day, rollup.runs, rollup.sent, rollup.failed, rollup.items_found) == (old_day.date(), 3, 2, 1, 12)
+
+    # idempotent
+    assert run_retention(db_session, now=now) == {k: 0 for k in expected}
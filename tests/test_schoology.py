@@ -0,0 +1,289 @@
+import importlib.util
+import json
+import os
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import schoology
+from app.models import Base, User, Family, DigestPreference, OneLiner, ProviderAccount, SchoologyItem, SchoologySyncState
+from app.schoology import Listing, SchoologyClient
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _family(db):
+    user = User(email="s@example.com"); db.add(user); db.commit()
+    fam = Family(owner_user_id=user.id); db.add(fam); db.commit()
+    pa = ProviderAccount(user_id=user.id, provider=schoology.PROVIDER_NAME, token_json_enc="token")
+    db.add(pa); db.commit()
+    return fam, pa
+
+
+class FakeClient:
+    """Stands in for SchoologyClient; the fetchers are patched, so it only carries pool settings."""
+    max_workers = 1
+
+    def __init__(self, pa):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def test_failed_section_store_rolls_back_to_its_savepoint(db_session, monkeypatch):
+    fam, pa = _family(db_session)
+    sections = [{"id": "1", "course_title": "Math"}, {"id": "2", "course_title": "Art"}]
+    monkeypatch.setattr(schoology, "SchoologyClient", FakeClient)
+    monkeypatch.setattr(schoology, "fetch_sections", lambda client, etag, lm: Listing(sections, "s1"))
+    monkeypatch.setattr(schoology, "fetch_section_assignments", lambda client, sec, etag, lm: Listing(
+        [{"id": f"a{sec}", "title": f"Homework {sec}"}], f"etag-a{sec}"))
+    monkeypatch.setattr(schoology, "fetch_section_events", lambda client, sec, etag, lm: Listing([], f"etag-e{sec}"))
+
+    store = schoology.store_items
+
+    def store_then_fail_for_art_assignments(db, family_id, pa, items, item_type, course_title):
+        n = store(db, family_id, pa, items, item_type, course_title)
+        if course_title == "Art" and item_type == "assignment":
+            raise ValueError("constraint violated half way through")
+        return n
+
+    monkeypatch.setattr(schoology, "store_items", store_then_fail_for_art_assignments)
+    result = schoology.sync_schoology(db_session, fam.id)
+
+    assert result["created"] == 1
+    db_session.expire_all()
+    assert [i.schoology_id for i in db_session.query(SchoologyItem)] == ["a1"]
+    states = {st.resource: st for st in db_session.query(SchoologySyncState)}
+    assert states["sections/1/assignments"].etag == "etag-a1"
+    # the failed listing must be fetched in full again, not answered with a 304
+    assert states["sections/2/assignments"].etag is None
+    assert states["sections/2/assignments"].last_synced_at is not None
+    assert states["sections/2/events"].etag == "etag-e2"
+
+
+def _items(*ids, title="Essay"):
+    return [{"id": i, "title": f"{title} {i}", "due": "1767225600"} for i in ids]   # 2026-01-01T00:00Z
+
+
+@pytest.mark.parametrize("dialect_upsert", [True, False], ids=["on-conflict", "orm-fallback"])
+def test_store_items_inserts_new_and_updates_existing(db_session, monkeypatch, dialect_upsert):
+    if not dialect_upsert:
+        monkeypatch.setattr(schoology, "upsert_insert", lambda dialect, table: None)
+    fam, pa = _family(db_session)
+
+    assert schoology.store_items(db_session, fam.id, pa, _items("1", "2"), "assignment", "Math") == 2
+    assert schoology.store_items(db_session, fam.id, pa, _items("2", "3", title="Revised"), "assignment",
+                                 "Math 2") == 1
+    db_session.commit()
+
+    rows = {i.schoology_id: i for i in db_session.query(SchoologyItem)}
+    assert sorted(rows) == ["1", "2", "3"]
+    assert (rows["1"].title, rows["1"].course_title) == ("Essay 1", "Math")
+    assert (rows["2"].title, rows["2"].course_title) == ("Revised 2", "Math 2")
+    assert rows["2"].due_at == datetime(2026, 1, 1)
+
+
+def test_materialize_anti_join_and_window_edges(db_session):
+    fam, pa = _family(db_session)
+    now = datetime(2026, 3, 1, 12, 0)
+    lo = now - timedelta(days=schoology.WINDOW_PAST_DAYS)
+    hi = now + timedelta(days=schoology.WINDOW_FUTURE_DAYS)
+    due = {"at-lo": lo, "before-lo": lo - timedelta(seconds=1), "at-hi": hi,
+           "after-hi": hi + timedelta(seconds=1), "undated": None, "done": now}
+    for sid, due_at in due.items():
+        db_session.add(SchoologyItem(family_id=fam.id, provider_account_id=pa.id, schoology_id=sid,
+                                     item_type="assignment", title=sid, due_at=due_at))
+    db_session.add(OneLiner(family_id=fam.id, source_msg_id="sch_done", one_liner="already there"))
+    db_session.commit()
+
+    assert schoology.materialize_schoology_items_as_oneliners(db_session, fam.id, now=now) == 3
+    assert schoology.materialize_schoology_items_as_oneliners(db_session, fam.id, now=now) == 0
+    made = {o.source_msg_id for o in db_session.query(OneLiner).filter(OneLiner.source_msg_id != "sch_done")}
+    assert made == {"sch_at-lo", "sch_at-hi", "sch_undated"}
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code, self.headers = status_code, headers or {}
+        self._body = body
+        self.text = json.dumps(body) if body is not None else ""
+
+    def json(self):
+        return self._body
+
+
+class FakeHttp:
+    """requests.Session stand-in: answers by URL, records every request."""
+
+    def __init__(self, routes):
+        self.routes, self.requests = routes, []
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def close(self):
+        pass
+
+    def request(self, method, url, params=None, headers=None, auth=None, timeout=None):
+        self.requests.append((url, params, headers or {}))
+        return self.routes[url](params, headers or {})
+
+
+@pytest.fixture
+def client_for(monkeypatch):
+    monkeypatch.setenv("SCHOOLGY_CONSUMER_KEY", "ck")
+    monkeypatch.setenv("SCHOOLGY_CONSUMER_SECRET", "cs")
+    return lambda http: SchoologyClient(ProviderAccount(token_json_enc=None), http=http, rate_per_sec=0)
+
+
+def test_get_all_follows_links_next(client_for):
+    base = f"{schoology.SCHO_BASE}/sections/7/assignments"
+    page2 = f"{base}?start=200&limit=200"
+    http = FakeHttp({
+        base: lambda params, headers: FakeResponse(200, {"assignment": _items("1", "2"), "links": {"next": page2}},
+                                                   {"ETag": '"v1"'}),
+        page2: lambda params, headers: FakeResponse(200, {"assignment": _items("3"), "links": {"next": page2}}),
+    })
+    listing = client_for(http).get_all("/sections/7/assignments", "assignment")
+
+    assert [i["id"] for i in listing.items] == ["1", "2", "3"]
+    assert listing.etag == '"v1"' and not listing.not_modified
+    # the repeated next link ends the walk instead of looping
+    assert [u for u, _, _ in http.requests] == [base, page2]
+    assert http.requests[0][1] == {"start": 0, "limit": schoology.PAGE_SIZE}
+
+
+def test_get_all_conditional_request_and_304(client_for):
+    base = f"{schoology.SCHO_BASE}/users/me/sections"
+
+    def answer(params, headers):
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, {"section": [{"id": "7"}]}, {"ETag": '"v1"', "Last-Modified": "Sun, 01 Mar 2026"})
+
+    http = FakeHttp({base: answer})
+    client = client_for(http)
+    fresh = schoology.fetch_sections(client)
+    assert (fresh.items, fresh.etag, fresh.not_modified) == ([{"id": "7"}], '"v1"', False)
+
+    again = schoology.fetch_sections(client, fresh.etag, fresh.last_modified)
+    assert again.not_modified and again.items == []
+    assert (again.etag, again.last_modified) == ('"v1"', "Sun, 01 Mar 2026")
+    assert http.requests[1][2] == {"If-None-Match": '"v1"', "If-Modified-Since": "Sun, 01 Mar 2026"}
+
+
+def test_section_list_ttl_and_per_section_throttle(db_session, monkeypatch):
+    fam, pa = _family(db_session)
+    calls = []
+    monkeypatch.setattr(schoology, "SchoologyClient", FakeClient)
+
+    def fetch_sections(client, etag, lm):
+        calls.append(("sections", etag))
+        return Listing([{"id": "7", "course_title": "Math"}], "s1")
+
+    def fetcher(kind):
+        def fetch(client, sec, etag, lm):
+            calls.append((kind, etag))
+            return Listing(_items("1"), f"{kind}-v1")
+        return fetch
+
+    monkeypatch.setattr(schoology, "fetch_sections", fetch_sections)
+    monkeypatch.setattr(schoology, "fetch_section_assignments", fetcher("assignments"))
+    monkeypatch.setattr(schoology, "fetch_section_events", fetcher("events"))
+
+    def age(resource, delta):
+        st = db_session.query(SchoologySyncState).filter_by(resource=resource).one()
+        st.last_synced_at -= delta
+        db_session.commit()
+
+    schoology.sync_schoology(db_session, fam.id)
+    assert calls == [("sections", None), ("assignments", None), ("events", None)]
+
+    calls.clear()
+    assert schoology.sync_schoology(db_session, fam.id)["skipped"] == 2
+    assert calls == []
+
+    # past the per-section interval, the items are re-requested conditionally; the section list is still fresh
+    calls.clear()
+    age("sections/7/assignments", timedelta(seconds=schoology.SECTION_MIN_INTERVAL + 1))
+    schoology.sync_schoology(db_session, fam.id)
+    assert calls == [("assignments", "assignments-v1")]
+
+    calls.clear()
+    age("sections", timedelta(seconds=schoology.SECTIONS_TTL + 1))
+    schoology.sync_schoology(db_session, fam.id)
+    assert calls == [("sections", "s1")]
+
+
+def test_raw_payload_is_stored_compressed(db_session):
+    fam, pa = _family(db_session)
+    payload = json.dumps({"id": "1", "description": "x" * 2000})
+    item = SchoologyItem(family_id=fam.id, provider_account_id=pa.id, schoology_id="1", item_type="event")
+    item.raw_payload = payload
+    db_session.add(item); db_session.commit()
+
+    db_session.expire_all()
+    item = db_session.query(SchoologyItem).one()
+    assert item.raw_json is None and len(item.raw_json_z) < len(payload)
+    assert item.raw_payload == payload
+
+
+def _migration(name):
+    path = os.path.join(os.path.dirname(__file__), "..", "migrations", "versions", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_0004_moves_raw_json_into_raw_json_z(db_session):
+    fam, pa = _family(db_session)
+    payloads = {str(i): json.dumps({"id": i, "title": "t" * i}) for i in range(1, 4)}
+    conn = db_session.connection()
+    conn.execute(text("ALTER TABLE schoology_items DROP COLUMN raw_json_z"))
+    for sid, raw in payloads.items():
+        conn.execute(text(
+            "INSERT INTO schoology_items (family_id, provider_account_id, schoology_id, item_type, created_at, "
+            "updated_at, raw_json) VALUES (:f, :p, :s, 'event', :now, :now, :raw)"
+        ), {"f": fam.id, "p": pa.id, "s": sid, "now": datetime.utcnow(), "raw": raw})
+
+    migration = _migration("0004_schoology_raw_json_z")
+    migration.BATCH = 2
+    with Operations.context(MigrationContext.configure(conn)):
+        migration.upgrade()
+    db_session.commit()
+
+    items = db_session.query(SchoologyItem).all()
+    assert {i.schoology_id: i.raw_payload for i in items} == payloads
+    assert all(i.raw_json is None for i in items)
+
+
+def test_materialized_dates_are_in_the_family_timezone(db_session):
+    fam, pa = _family(db_session)
+    db_session.add(DigestPreference(family_id=fam.id, timezone="America/New_York"))
+    # 02:30 UTC on the 5th is 9:30 PM on the 4th in New York
+    db_session.add(SchoologyItem(family_id=fam.id, provider_account_id=pa.id, schoology_id="1",
+                                 item_type="assignment", title="Lab report", due_at=datetime(2026, 3, 5, 2, 30)))
+    db_session.commit()
+
+    schoology.materialize_schoology_items_as_oneliners(db_session, fam.id, now=datetime(2026, 3, 1))
+    o = db_session.query(OneLiner).one()
+    assert (o.date_string, o.time_string) == ("2026-03-04", "9:30 PM")
+    assert (o.event_date, o.event_time) == (date(2026, 3, 4), time(21, 30))
+    assert o.event_at == o.when_ts == datetime(2026, 3, 5, 2, 30)